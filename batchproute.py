@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+#
+# this script paints many solutions to PDF, SVG or PNG files in one go
+#
+# Work is grouped by instance, so that each instance is parsed once per worker
+# process instead of once per solution, and groups are shared among worker
+# processes. Each solution is reported with its painting time, and a failure
+# does not stop the batch.
+
+import sys
+import os
+import glob
+import math
+import time
+import pickle
+import concurrent.futures
+
+import config
+import loaddata
+import pdfproute
+
+USAGE = '[-jN] manifest_file\n' + \
+    '   or: ' + sys.argv[0] + \
+    ' [-jN] type[:subtype] instance_file [:solution subtype]' + \
+    ' "solution_glob" output_directory [pdf|svg|png]\n' + \
+    'Each line of a manifest file is of the form\n' + \
+    '  type[:subtype] instance_file [:solution subtype] solution_file' + \
+    ' output_file\n' + \
+    'where relative paths are relative to the manifest file; empty lines' + \
+    ' and lines starting with # are ignored.\n' + \
+    'N is the number of worker processes, one per CPU by default.'
+
+# a group of solutions of the same instance is split into chunks of at most
+# this many solutions, so that large groups are shared among workers
+maxChunkSize = 50
+
+# each worker process has its own loader, and parses each instance once
+_workerLoader = None
+_workerInstances = {}
+
+def _initRenderingWorker():
+    global _workerLoader
+    config.initializeConfig()
+    _workerLoader = loaddata.DataLoader()
+
+# parse the type[:subtype] instance_file [:solution subtype] solution_file
+# part of a command line or manifest line
+# return (type, subtype, instance file, solution subtype, solution file) and
+# the remaining arguments
+def parseArguments(args):
+    toks = args[0].split(':')
+    type = toks[0]
+    subtype = toks[1] if len(toks) > 1 else 'default'
+    if args[2][0] == ':':
+        return (type, subtype, args[1], args[2][1:], args[3]), args[4:]
+    else:
+        return (type, subtype, args[1], 'default', args[2]), args[3:]
+
+# list of jobs described in a manifest file
+# a job is (type, subtype, instance file, solution subtype, solution file,
+# output file)
+def readManifest(fName):
+    baseDir = os.path.dirname(os.path.abspath(fName))
+    jobs = []
+    for lineNumber, line in enumerate(open(fName)):
+        toks = line.split()
+        if not toks or toks[0][0] == '#':
+            continue
+        try:
+            (type, subtype, instanceFile, solutionSubtype, solutionFile), \
+                rest = parseArguments(toks)
+            if len(rest) != 1:
+                raise IndexError
+        except IndexError:
+            print('Error: wrong format at line', lineNumber + 1, 'of', fName)
+            continue
+        jobs.append( (type, subtype,
+                      os.path.join(baseDir, instanceFile),
+                      solutionSubtype,
+                      os.path.join(baseDir, solutionFile),
+                      os.path.join(baseDir, rest[0])) )
+    return jobs
+
+# list of jobs painting all solutions matching a pattern to a directory
+def globJobs(type, subtype, instanceFile, solutionSubtype, pattern,
+             outputDir, extension='pdf'):
+    return [ (type, subtype, instanceFile, solutionSubtype, solutionFile,
+              os.path.join(outputDir,
+                           os.path.splitext(os.path.basename(\
+                            solutionFile))[0] + '.' + extension))
+             for solutionFile in sorted(glob.glob(pattern)) ]
+
+# split jobs into chunks of solutions of the same instance
+# a chunk is (type, subtype, instance file, solution subtype,
+# [ (solution file, output file)... ])
+def makeChunks(jobs, nWorkers):
+    groups = {}
+    for type, subtype, instanceFile, solutionSubtype, solutionFile, \
+            outputFile in jobs:
+        groups.setdefault((type, subtype, instanceFile, solutionSubtype),
+                          []).append( (solutionFile, outputFile) )
+    # enough chunks for all workers to be busy, but not too many since each
+    # chunk may have to parse its instance
+    chunkSize = max(1, min(maxChunkSize,
+                           int(math.ceil(len(jobs) / float(nWorkers)))))
+    return [ key + (items[i:i+chunkSize],)
+             for key, items in groups.items()
+             for i in range(0, len(items), chunkSize) ]
+
+# paint a chunk of solutions of the same instance
+# return a list of (solution file, output file, time in seconds, error
+# message or None)
+def paintChunk(chunk, loader=None):
+    type, subtype, instanceFile, solutionSubtype, items = chunk
+    if loader is None:
+        loader = _workerLoader
+    key = (type, subtype, instanceFile)
+    try:
+        if not key in _workerInstances:
+            _workerInstances[key] = \
+                loader.loadInstance(instanceFile, type, subtype)
+        vrp = _workerInstances[key]
+    except Exception as e:
+        message = 'unable to load instance ' + instanceFile + ': ' + str(e)
+        return [ (solutionFile, outputFile, 0, message)
+                 for solutionFile, outputFile in items ]
+    results = []
+    for solutionFile, outputFile in items:
+        start = time.time()
+        try:
+            solution = loader.loadSolution(solutionFile, vrp,
+                                           type, solutionSubtype)
+            pdfproute.paintToFile(vrp, solution,
+                                  loader.loadStyleSheet(type), outputFile)
+            results.append( (solutionFile, outputFile,
+                             time.time() - start, None) )
+        except Exception as e:
+            results.append( (solutionFile, outputFile,
+                             time.time() - start,
+                             e.__class__.__name__ + ': ' + str(e)) )
+    return results
+
+# paint all jobs using nWorkers processes, reporting each result as it comes
+# return the list of results, as returned by paintChunk()
+def paintJobs(jobs, nWorkers=None):
+    if nWorkers is None:
+        nWorkers = os.cpu_count() or 1
+    nWorkers = max(1, min(nWorkers, len(jobs)))
+    for outputFile in set( [ job[5] for job in jobs ] ):
+        outputDir = os.path.dirname(outputFile)
+        if outputDir and not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+    chunks = makeChunks(jobs, nWorkers)
+    results = []
+    if nWorkers > 1:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(\
+                max_workers=nWorkers,
+                initializer=_initRenderingWorker) as executor:
+                futures = [ executor.submit(paintChunk, chunk)
+                            for chunk in chunks ]
+                for future in concurrent.futures.as_completed(futures):
+                    for result in future.result():
+                        report(result)
+                        results.append(result)
+            return results
+        except (pickle.PicklingError,
+                concurrent.futures.process.BrokenProcessPool) as e:
+            print('[Warning] unable to paint solutions in parallel:', e)
+            done = set( [ result[0:2] for result in results ] )
+            chunks = [ chunk[:4] + ([ item for item in chunk[4]
+                                      if not item in done ],)
+                       for chunk in chunks ]
+    loader = loaddata.DataLoader()
+    for chunk in chunks:
+        for result in paintChunk(chunk, loader):
+            report(result)
+            results.append(result)
+    return results
+
+# print the result of painting one solution
+def report(result):
+    solutionFile, outputFile, duration, error = result
+    if error is None:
+        print('[ok] %.2fs' % duration, solutionFile, '->', outputFile)
+    else:
+        print('[failed] %.2fs' % duration, solutionFile, '->', outputFile,
+              ':', error)
+    sys.stdout.flush()
+
+# main program: paint all solutions given by a manifest or a pattern
+if __name__ == '__main__':
+    config.initializeConfig()
+    args = sys.argv[1:]
+    nWorkers = None
+    if args and args[0][:2] == '-j':
+        try:
+            nWorkers = int(args[0][2:])
+        except ValueError:
+            nWorkers = 0
+        args = args[1:]
+    try:
+        if nWorkers == 0:
+            raise IndexError
+        elif len(args) == 1:
+            jobs = readManifest(args[0])
+        else:
+            (type, subtype, instanceFile, solutionSubtype, pattern), rest = \
+                parseArguments(args)
+            if len(rest) < 1 or len(rest) > 2:
+                raise IndexError
+            jobs = globJobs(type, subtype, instanceFile, solutionSubtype,
+                            pattern, *rest)
+    except IndexError:
+        print('USAGE:', sys.argv[0], USAGE)
+        sys.exit(0)
+    start = time.time()
+    results = paintJobs(jobs, nWorkers)
+    nFailed = len( [ result for result in results if not result[3] is None ] )
+    print(len(results) - nFailed, 'solutions painted,', nFailed, 'failed in',
+          '%.2fs' % (time.time() - start))
+    sys.exit(1 if nFailed > 0 else 0)
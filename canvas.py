@@ -151,3 +151,61 @@ class Canvas:
     # draw a bitmap, using the given point as NW corner
     def drawBitmap(self, bitmap, NWcorner):
         print('Error: method drawBitmap not implemented in backend')
+
+    # groups: backends able to store drawing operations once and draw them
+    # many times at different positions overload the following methods
+    # True if this canvas supports groups
+    def supportsGroups(self):
+        return False
+
+    # True if a group with given key has already been defined
+    def hasGroup(self, key):
+        return False
+
+    # drawing operations until endGroup() define a group instead of being
+    # drawn; the group is clipped to the given box, origin is the point that
+    # is placed at the position given to placeGroup()
+    def beginGroup(self, key, xmin, ymin, xmax, ymax, origin=(0, 0)):
+        print('Error: method beginGroup not implemented in backend')
+
+    def endGroup(self):
+        print('Error: method endGroup not implemented in backend')
+
+    # draw a group with its origin at x, y
+    def placeGroup(self, key, x, y):
+        print('Error: method placeGroup not implemented in backend')
+
+    # True if this canvas is repainted interactively, in which case the output
+    # of styles is kept and replayed (see StyleSheet.paintMemoizedStyle)
+    def isInteractive(self):
+        return False
+
+# names of the methods drawing something on a canvas
+drawingMethods = [ name for name in dir(Canvas)
+                   if name[:4] == 'draw' and name != 'drawBorder' ]
+
+# canvas recording the drawing operations performed on another canvas, so that
+# they can be replayed later on any canvas
+class RecordingCanvas(object):
+    def __init__(self, target):
+        self.target = target
+        # list of (method name, args, kwargs)
+        self.operations = []
+
+    def getSize(self):
+        return self.target.getSize()
+
+    # drawing methods are recorded and forwarded, anything else is forwarded
+    def __getattr__(self, name):
+        method = getattr(self.target, name)
+        if not name in drawingMethods:
+            return method
+        def record(*args, **kwargs):
+            self.operations.append( (name, args, kwargs) )
+            return method(*args, **kwargs)
+        return record
+
+# perform recorded drawing operations on a canvas
+def replay(operations, canvas):
+    for name, args, kwargs in operations:
+        getattr(canvas, name)(*args, **kwargs)
@@ -0,0 +1,240 @@
+#
+# Viewport culling for styles
+#
+# -*- coding: utf-8 -*-
+# When zoomed in, only a small part of an instance is visible. Instead of
+# issuing draw calls for every node and arc and relying on the canvas to clip
+# them, styles can ask for the entities lying in the visible area, given as the
+# boundingBox argument of Style.paint().
+# Nodes are looked up in the k-d tree of the instance's neighbour finder. Route
+# segments are looked up in a SegmentIndex built the first time a solution is
+# culled, and kept as long as the solution exists.
+# All functions return every entity when culling is disabled, when the
+# instance is small or when the whole instance is visible anyway.
+
+import weakref
+
+import numpy
+
+import findneighbour
+
+# built-in styles only draw what is visible when this is True
+useCulling = True
+# culling is not worth it below this number of nodes or segments
+cullingThreshold = 1000
+# margin around the visible area in pixels, so that symbols of entities lying
+# just outside of it are still drawn
+cullingMargin = 50
+# same for labels and bars, which can extend far from their node
+wideCullingMargin = 250
+# segments longer than this factor times the median segment extent are not
+# stored in the k-d tree of a SegmentIndex but tested one by one
+longSegmentFactor = 8
+
+# segment indices for each solution and instance
+_segmentIndices = weakref.WeakKeyDictionary()
+
+# visible area in data coordinates, extended by margin pixels
+# returns None if everything should be drawn
+def cullingBox(inputData, nEntities, boundingBox, convertX, convertY, margin):
+    if not useCulling or boundingBox is None or \
+            nEntities < cullingThreshold:
+        return None
+    # transformations are linear so their scale is known from two points
+    xScale = abs(convertX(1.0) - convertX(0.0))
+    yScale = abs(convertY(1.0) - convertY(0.0))
+    if xScale == 0 or yScale == 0:
+        return None
+    xmin, ymin, xmax, ymax = boundingBox
+    xmin, xmax = min(xmin, xmax) - margin / xScale, \
+        max(xmin, xmax) + margin / xScale
+    ymin, ymax = min(ymin, ymax) - margin / yScale, \
+        max(ymin, ymax) + margin / yScale
+    # nothing to cull if the whole instance is visible
+    if xmin <= inputData.xmin and xmax >= inputData.xmax and \
+            ymin <= inputData.ymin and ymax >= inputData.ymax:
+        return None
+    return xmin, ymin, xmax, ymax
+
+# positions in inputData.nodes of nodes that may be visible, in increasing
+# order
+def visibleNodeIndices(inputData, boundingBox, convertX, convertY,
+                       margin=cullingMargin):
+    box = cullingBox(inputData, len(inputData.nodes),
+                     boundingBox, convertX, convertY, margin)
+    finder = getattr(inputData, 'neighbourFinder', None)
+    if box is None or not hasattr(finder, 'getNodeIndicesInBox'):
+        return range(len(inputData.nodes))
+    return finder.getNodeIndicesInBox(*box).tolist()
+
+# nodes that may be visible, in the same order as in inputData.nodes
+def visibleNodes(inputData, boundingBox, convertX, convertY,
+                 margin=cullingMargin):
+    box = cullingBox(inputData, len(inputData.nodes),
+                     boundingBox, convertX, convertY, margin)
+    if box is None:
+        return inputData.nodes
+    nodes = inputData.nodes
+    return [ nodes[i] for i in visibleNodeIndices(inputData, boundingBox,
+                                                  convertX, convertY,
+                                                  margin) ]
+
+# spatial index over line segments
+# segments are stored in a k-d tree using their centre; since a segment can be
+# visible while its centre isn't, queries are extended by the largest half
+# extent of stored segments, and candidates are then tested exactly
+class SegmentIndex:
+    def __init__(self, x1s, y1s, x2s, y2s):
+        self.xmins = numpy.minimum(x1s, x2s)
+        self.xmaxs = numpy.maximum(x1s, x2s)
+        self.ymins = numpy.minimum(y1s, y2s)
+        self.ymaxs = numpy.maximum(y1s, y2s)
+        halfWidths = (self.xmaxs - self.xmins) / 2.0
+        halfHeights = (self.ymaxs - self.ymins) / 2.0
+        # a few long segments (e.g. to and from a depot) would otherwise
+        # extend every query
+        if len(halfWidths) > 0:
+            limit = longSegmentFactor * max(numpy.median(halfWidths),
+                                            numpy.median(halfHeights))
+            long = (halfWidths > limit) | (halfHeights > limit)
+        else:
+            long = numpy.zeros(0, dtype=bool)
+        self.longSegments = numpy.flatnonzero(long)
+        shortSegments = numpy.flatnonzero(~long)
+        self.xPadding = halfWidths[shortSegments].max() \
+            if len(shortSegments) else 0.0
+        self.yPadding = halfHeights[shortSegments].max() \
+            if len(shortSegments) else 0.0
+        self.tree = \
+            findneighbour.KDTree(self.xmins[shortSegments] + \
+                                     halfWidths[shortSegments],
+                                 self.ymins[shortSegments] + \
+                                     halfHeights[shortSegments],
+                                 shortSegments)
+
+    def __len__(self):
+        return len(self.xmins)
+
+    # sorted positions of segments whose bounding box intersects the box
+    def inBox(self, xmin, ymin, xmax, ymax):
+        candidates = numpy.concatenate(
+            (self.tree.inBox(xmin - self.xPadding, ymin - self.yPadding,
+                             xmax + self.xPadding, ymax + self.yPadding),
+             self.longSegments))
+        keep = (self.xmins[candidates] <= xmax) & \
+            (self.xmaxs[candidates] >= xmin) & \
+            (self.ymins[candidates] <= ymax) & \
+            (self.ymaxs[candidates] >= ymin)
+        return numpy.sort(candidates[keep])
+
+# segments of all routes of a solution, indexed in one SegmentIndex
+# pairs is a list with one (from nodes, to nodes) pair of lists per route
+class RouteSegments:
+    def __init__(self, inputData, pairs):
+        counts = [ len(froms) for froms, tos in pairs ]
+        self.offsets = numpy.concatenate( ([0], numpy.cumsum(counts)) )
+        self.routeOf = numpy.repeat(numpy.arange(len(pairs)), counts)
+        froms = numpy.array([ i for f, t in pairs for i in f ],
+                            dtype=numpy.intp)
+        tos = numpy.array([ i for f, t in pairs for i in t ],
+                          dtype=numpy.intp)
+        xs, ys = inputData.nodeColumn('x'), inputData.nodeColumn('y')
+        self.index = SegmentIndex(xs[froms], ys[froms], xs[tos], ys[tos])
+
+    # positions of visible segments in each route
+    def visible(self, box):
+        result = [ [] for i in range(len(self.offsets) - 1) ]
+        segments = self.index.inBox(*box)
+        routes = self.routeOf[segments]
+        positions = (segments - self.offsets[routes]).tolist()
+        for route, position in zip(routes.tolist(), positions):
+            result[route].append(position)
+        return result
+
+# return the segment index of given kind for a solution, building it if needed
+def getRouteSegments(inputData, solutionData, kind):
+    if not solutionData in _segmentIndices:
+        _segmentIndices[solutionData] = weakref.WeakKeyDictionary()
+    perInstance = _segmentIndices[solutionData]
+    if not inputData in perInstance:
+        perInstance[inputData] = {}
+    if not kind in perInstance[inputData]:
+        if kind == 'arcs':
+            pairs = [ ([ arc['from'] for arc in route['arcs'] ],
+                       [ arc['to'] for arc in route['arcs'] ])
+                      for route in solutionData.routes ]
+        else:
+            pairs = [ (route['node sequence'][:-1],
+                       route['node sequence'][1:])
+                      for route in solutionData.routes ]
+        perInstance[inputData][kind] = RouteSegments(inputData, pairs)
+    return perInstance[inputData][kind]
+
+# positions of the arcs that may be visible, as a list with one list of
+# positions in route['arcs'] per route
+def visibleArcPositions(inputData, solutionData, boundingBox, convertX,
+                        convertY, margin=cullingMargin):
+    nArcs = sum( [ len(route['arcs']) for route in solutionData.routes ] )
+    box = cullingBox(inputData, nArcs, boundingBox, convertX, convertY, margin)
+    if box is None:
+        return [ list(range(len(route['arcs'])))
+                 for route in solutionData.routes ]
+    return getRouteSegments(inputData, solutionData, 'arcs').visible(box)
+
+# arcs that may be visible, as a list with one list of arcs per route
+def visibleArcs(inputData, solutionData, boundingBox, convertX, convertY,
+                margin=cullingMargin):
+    visible = visibleArcPositions(inputData, solutionData, boundingBox,
+                                  convertX, convertY, margin)
+    return [ [ route['arcs'][i] for i in positions ]
+             for route, positions in zip(solutionData.routes, visible) ]
+
+# group consecutive segment positions into runs of nodes of a sequence
+def segmentsToRuns(sequence, positions):
+    runs = []
+    for position in positions:
+        if runs and runs[-1][1] == position:
+            runs[-1][1] = position + 1
+        else:
+            runs.append( [position, position + 1] )
+    return [ sequence[first:last+1] for first, last in runs ]
+
+# parts of each route's node sequence that may be visible, as a list with one
+# list of node sequences (each to be drawn as a polyline) per route
+# if nodeFilter is specified, nodes not satisfying it are removed from the
+# sequences beforehand
+def visiblePolylines(inputData, solutionData, boundingBox, convertX, convertY,
+                     nodeFilter=None, margin=cullingMargin):
+    if nodeFilter is None:
+        sequences = [ route['node sequence'] for route in solutionData.routes ]
+    else:
+        sequences = [ [ node for node in route['node sequence']
+                        if nodeFilter(node) ]
+                      for route in solutionData.routes ]
+    nSegments = sum( [ max(0, len(s) - 1) for s in sequences ] )
+    box = cullingBox(inputData, nSegments, boundingBox, convertX, convertY,
+                     margin)
+    if box is None:
+        return [ [ sequence ] for sequence in sequences ]
+    # filtered sequences are not indexed: their segments are tested directly
+    if not nodeFilter is None:
+        xs, ys = inputData.nodeColumn('x'), inputData.nodeColumn('y')
+        result = []
+        for sequence in sequences:
+            if len(sequence) < 2:
+                result.append([])
+                continue
+            indices = numpy.array(sequence, dtype=numpy.intp)
+            x1s, y1s = xs[indices[:-1]], ys[indices[:-1]]
+            x2s, y2s = xs[indices[1:]], ys[indices[1:]]
+            keep = (numpy.minimum(x1s, x2s) <= box[2]) & \
+                (numpy.maximum(x1s, x2s) >= box[0]) & \
+                (numpy.minimum(y1s, y2s) <= box[3]) & \
+                (numpy.maximum(y1s, y2s) >= box[1])
+            result.append(segmentsToRuns(sequence,
+                                         numpy.flatnonzero(keep).tolist()))
+        return result
+    visible = \
+        getRouteSegments(inputData, solutionData, 'sequence').visible(box)
+    return [ segmentsToRuns(sequence, positions)
+             for sequence, positions in zip(sequences, visible) ]
@@ -8,9 +8,14 @@
 import util
 import math
 import sys
+import heapq
+
+import numpy
 
 mapDimension = 500
 cellRangeInMap = 6
+# maximum number of points in a leaf of a KDTree
+kdTreeLeafSize = 32
 
 # this class allows to find the closest neighbour to a given node
 class NeighbourFinder:
@@ -213,3 +218,196 @@ class TwoDTreeNeighbourFinder(NeighbourFinder):
             maxDist = self.defaultDistUB
         index, distance = self.tree.findClosest(x, y, maxDist)
         return index
+
+# static k-d tree stored in flat arrays
+# Points are reordered once at construction so that each subtree covers a
+# contiguous slice [lo, hi) of the arrays: the median point of the slice is at
+# (lo + hi) // 2 and splits it along the dimension with the widest spread,
+# slices with at most kdTreeLeafSize points are leaves. Queries traverse the
+# tree iteratively with an explicit stack.
+class KDTree:
+    # xs and ys are the coordinates of the points, indices the values returned
+    # by queries for each point (by default the position of the point)
+    def __init__(self, xs, ys, indices=None):
+        xs = numpy.asarray(xs, dtype=numpy.float64)
+        ys = numpy.asarray(ys, dtype=numpy.float64)
+        n = len(xs)
+        indices = numpy.arange(n) if indices is None \
+            else numpy.asarray(indices)
+        order = numpy.arange(n)
+        # split dimension of the internal node whose median is at position i
+        self.splitDims = numpy.zeros(n, dtype=numpy.int8)
+        stack = [ (0, n) ]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= kdTreeLeafSize:
+                continue
+            segment = order[lo:hi]
+            segmentXs, segmentYs = xs[segment], ys[segment]
+            if numpy.ptp(segmentXs) >= numpy.ptp(segmentYs):
+                dim, values = 0, segmentXs
+            else:
+                dim, values = 1, segmentYs
+            median = (hi - lo) // 2
+            order[lo:hi] = segment[numpy.argpartition(values, median)]
+            self.splitDims[lo + median] = dim
+            stack.append( (lo, lo + median) )
+            stack.append( (lo + median + 1, hi) )
+        self.xs, self.ys, self.indices = xs[order], ys[order], indices[order]
+        self.bounds = (xs.min(), ys.min(), xs.max(), ys.max()) if n > 0 \
+            else (0.0, 0.0, 0.0, 0.0)
+
+    def __len__(self):
+        return len(self.xs)
+
+    # squared distances from (x, y) to points in slice [lo, hi)
+    def squaredDistances(self, x, y, lo, hi):
+        dx = self.xs[lo:hi] - x
+        dy = self.ys[lo:hi] - y
+        return dx * dx + dy * dy
+
+    # closest point to (x, y) at distance strictly less than maxDist
+    # returns a point index and its distance, or None and maxDist
+    def nearest(self, x, y, maxDist=float('inf')):
+        result = self.kNearest(x, y, 1, maxDist)
+        return result[0] if result else (None, maxDist)
+
+    # k closest points to (x, y) at distance strictly less than maxDist
+    # returns a list of (index, distance) sorted by increasing distance
+    def kNearest(self, x, y, k, maxDist=float('inf')):
+        if k <= 0:
+            return []
+        bound = maxDist * maxDist
+        # max-heap of the best candidates found so far, as
+        # (-squared distance, position)
+        best = []
+        stack = [ (0, len(self.xs), 0.0) ]
+        while stack:
+            lo, hi, lowerBound = stack.pop()
+            if lowerBound >= bound:
+                continue
+            if hi - lo <= kdTreeLeafSize:
+                distances = self.squaredDistances(x, y, lo, hi)
+                for i in numpy.flatnonzero(distances < bound):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distances[i], lo + i))
+                    elif distances[i] < -best[0][0]:
+                        heapq.heapreplace(best, (-distances[i], lo + i))
+                    if len(best) == k:
+                        bound = -best[0][0]
+                continue
+            median = (lo + hi) // 2
+            if self.splitDims[median] == 0:
+                diff = x - self.xs[median]
+            else:
+                diff = y - self.ys[median]
+            # the median point itself
+            dx, dy = x - self.xs[median], y - self.ys[median]
+            distance = dx * dx + dy * dy
+            if distance < bound:
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, median))
+                else:
+                    heapq.heapreplace(best, (-distance, median))
+                if len(best) == k:
+                    bound = -best[0][0]
+            # the most promising side is explored first
+            if diff < 0:
+                near, far = (lo, median), (median + 1, hi)
+            else:
+                near, far = (median + 1, hi), (lo, median)
+            stack.append( (far[0], far[1], max(lowerBound, diff * diff)) )
+            stack.append( (near[0], near[1], lowerBound) )
+        best.sort(reverse=True)
+        return [ (self.indices[i].item(), math.sqrt(-d)) for d, i in best ]
+
+    # indices of points in the given axis-aligned box (bounds included)
+    def inBox(self, xmin, ymin, xmax, ymax):
+        return self.rangeQuery(
+            lambda cxmin, cymin, cxmax, cymax: \
+                cxmin >= xmin and cxmax <= xmax and \
+                cymin >= ymin and cymax <= ymax,
+            lambda cxmin, cymin, cxmax, cymax: \
+                cxmin > xmax or cxmax < xmin or \
+                cymin > ymax or cymax < ymin,
+            lambda xs, ys: (xs >= xmin) & (xs <= xmax) & \
+                (ys >= ymin) & (ys <= ymax))
+
+    # indices of points at distance at most radius from (x, y)
+    def inRadius(self, x, y, radius):
+        r2 = radius * radius
+        def contains(cxmin, cymin, cxmax, cymax):
+            dx = max(x - cxmin, cxmax - x)
+            dy = max(y - cymin, cymax - y)
+            return dx * dx + dy * dy <= r2
+        def disjoint(cxmin, cymin, cxmax, cymax):
+            dx = max(cxmin - x, 0.0, x - cxmax)
+            dy = max(cymin - y, 0.0, y - cymax)
+            return dx * dx + dy * dy > r2
+        return self.rangeQuery(
+            contains, disjoint,
+            lambda xs, ys: (xs - x) * (xs - x) + (ys - y) * (ys - y) <= r2)
+
+    # generic range query: the region is given as two tests on the bounding
+    # box of a tree cell (cell entirely in the region, cell entirely out of
+    # the region) and a vectorized test on point coordinates
+    # returns the sorted array of indices of points in the region
+    def rangeQuery(self, cellInside, cellOutside, pointsInside):
+        parts = []
+        stack = [ (0, len(self.xs)) + self.bounds ]
+        while stack:
+            lo, hi, cxmin, cymin, cxmax, cymax = stack.pop()
+            if lo >= hi or cellOutside(cxmin, cymin, cxmax, cymax):
+                continue
+            elif cellInside(cxmin, cymin, cxmax, cymax):
+                parts.append(self.indices[lo:hi])
+            elif hi - lo <= kdTreeLeafSize:
+                mask = pointsInside(self.xs[lo:hi], self.ys[lo:hi])
+                parts.append(self.indices[lo:hi][mask])
+            else:
+                median = (lo + hi) // 2
+                if pointsInside(self.xs[median:median+1],
+                                self.ys[median:median+1])[0]:
+                    parts.append(self.indices[median:median+1])
+                if self.splitDims[median] == 0:
+                    split = self.xs[median]
+                    stack.append( (lo, median, cxmin, cymin, split, cymax) )
+                    stack.append( (median+1, hi, split, cymin, cxmax, cymax) )
+                else:
+                    split = self.ys[median]
+                    stack.append( (lo, median, cxmin, cymin, cxmax, split) )
+                    stack.append( (median+1, hi, cxmin, split, cxmax, cymax) )
+        if not parts:
+            return numpy.zeros(0, dtype=self.indices.dtype)
+        return numpy.sort(numpy.concatenate(parts))
+
+# use a static k-d tree to find neighbours
+class KDTreeNeighbourFinder(NeighbourFinder):
+    def __init__(self, vrpData):
+        self.tree = KDTree(vrpData.nodeColumn('x'), vrpData.nodeColumn('y'),
+                           vrpData.nodeColumn('index'))
+        # arbitrary value
+        self.defaultDistUB = 0.01 * math.hypot(vrpData.xmax - vrpData.xmin,
+                                               vrpData.ymax - vrpData.ymin)
+
+    # if there is a node nearby the specified coordinates, return it
+    # otherwise return None
+    def getNodeIndexAtCoords(self, x, y, maxDist=None):
+        if maxDist is None:
+            maxDist = self.defaultDistUB
+        index, distance = self.tree.nearest(x, y, maxDist)
+        return index
+
+    # indices of the k nodes closest to the specified coordinates, closest
+    # first
+    def getKNearestNodeIndices(self, x, y, k, maxDist=float('inf')):
+        return [ index for index, distance in
+                 self.tree.kNearest(x, y, k, maxDist) ]
+
+    # indices of nodes in the given box
+    def getNodeIndicesInBox(self, xmin, ymin, xmax, ymax):
+        return self.tree.inBox(xmin, ymin, xmax, ymax)
+
+    # indices of nodes at most at distance radius from the given coordinates
+    def getNodeIndicesInRadius(self, x, y, radius):
+        return self.tree.inRadius(x, y, radius)
@@ -0,0 +1,87 @@
+#
+# Graphics state tracking for canvas backends
+#
+# -*- coding: utf-8 -*-
+# Styles pass a DrawingStyle with every primitive, and most consecutive
+# primitives use the same one. Backends used to convert colours, build pens,
+# brushes and fonts and emit every state change for each primitive, which is
+# slow on screen and inflates PDF files. A GraphicsState remembers the current
+# value of each state component (pen, brush, stroke colour...) so that a
+# backend only changes what actually differs, and backend objects are interned
+# by value so that each distinct colour, pen or font is converted only once.
+
+# interned backend objects are forgotten past this number
+maxInternedObjects = 1024
+
+# key = (kind, value key), value = backend object
+internedObjects = {}
+
+# state changes performed and avoided by all graphics states so far
+totalPerformed = 0
+totalAvoided = 0
+
+# return the backend object of given kind for a value key, creating it with
+# function(*key) the first time
+def intern(kind, key, function):
+    if not (kind, key) in internedObjects:
+        if len(internedObjects) >= maxInternedObjects:
+            internedObjects.clear()
+        internedObjects[(kind, key)] = function(*key)
+    return internedObjects[(kind, key)]
+
+# short description of the state changes performed and avoided so far
+def report():
+    total = totalPerformed + totalAvoided
+    return 'graphics state: ' + str(totalPerformed) + ' changes, ' + \
+        str(totalAvoided) + ' avoided' + \
+        (' (' + str(round(100.0 * totalAvoided / total)) + '%)' \
+             if total > 0 else '')
+
+class GraphicsState(object):
+    def __init__(self):
+        # key = state component, value = its current value
+        # a component that is not in this dictionary has an unknown value
+        self.current = {}
+        # saved states, for backends with save/restore operations
+        self.stack = []
+        # state changes performed and avoided by this graphics state
+        self.performed = 0
+        self.avoided = 0
+
+    # True if a component must be set to value, i.e. if its current value is
+    # different or unknown; in that case the value becomes the current one
+    def change(self, component, value):
+        global totalPerformed, totalAvoided
+        if component in self.current and self.current[component] == value:
+            self.avoided += 1
+            totalAvoided += 1
+            return False
+        else:
+            self.current[component] = value
+            self.performed += 1
+            totalPerformed += 1
+            return True
+
+    # current value of a component, None if unknown
+    def get(self, component):
+        return self.current.get(component)
+
+    # forget the value of a component, or of all components, e.g. after the
+    # backend state was modified behind our back
+    def forget(self, component=None):
+        if component is None:
+            self.current = {}
+        elif component in self.current:
+            del self.current[component]
+
+    # save and restore the current state, along with the backend's
+    def save(self):
+        self.stack.append(dict(self.current))
+
+    def restore(self):
+        self.current = self.stack.pop() if self.stack else {}
+
+    # start from scratch, e.g. on a new page
+    def reset(self):
+        self.current = {}
+        self.stack = []
@@ -0,0 +1,73 @@
+#
+# Level of detail for dense node sets
+#
+# -*- coding: utf-8 -*-
+# When a large instance is zoomed out, many nodes end up on the same few
+# pixels: drawing each of them is wasted work and their labels can't be read
+# anyway. Styles can bin node positions (in screen coordinates) into square
+# cells of a few pixels: when the nodes are too dense, one aggregated marker is
+# drawn per occupied cell instead of one per node, and labels are not drawn at
+# all. Since the density is measured on screen, full detail comes back by
+# itself when zooming in.
+
+import numpy
+
+# built-in styles aggregate dense nodes when this is True
+useLevelOfDetail = True
+# nodes are always drawn individually below this number of nodes
+lodThreshold = 1000
+# size in pixels of the cells nodes are binned into
+nodeCellSize = 4
+# nodes are aggregated above this average number of nodes per occupied cell
+maxNodesPerCell = 2.0
+# same for labels, which need more room
+labelCellSize = 24
+maxLabelsPerCell = 1.5
+
+# bin screen positions into square cells of given size
+# return the cell of each position and the number of positions in each cell,
+# cells being numbered from 0 in no particular order
+def binPositions(xs, ys, cellSize):
+    columns = numpy.floor(numpy.asarray(xs, dtype=float) / cellSize)
+    rows = numpy.floor(numpy.asarray(ys, dtype=float) / cellSize)
+    if len(columns) == 0:
+        return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=int)
+    # one integer key per cell
+    columns = (columns - columns.min()).astype(numpy.int64)
+    rows = (rows - rows.min()).astype(numpy.int64)
+    keys = columns * (rows.max() + 1) + rows
+    cells, inverse, counts = numpy.unique(keys, return_inverse=True,
+                                          return_counts=True)
+    return inverse.reshape(-1), counts
+
+# True if the given screen positions are too dense to be drawn one by one
+def tooDense(xs, ys, cellSize, maxPerCell):
+    if not useLevelOfDetail or len(xs) < lodThreshold:
+        return False
+    inverse, counts = binPositions(xs, ys, cellSize)
+    return float(len(xs)) / len(counts) > maxPerCell
+
+# aggregate screen positions into one marker per occupied cell
+# return the lists of x and y coordinates of the markers, which are at the
+# centroid of the positions in their cell, and the number of positions each
+# marker stands for
+def aggregate(xs, ys, cellSize):
+    xs = numpy.asarray(xs, dtype=float)
+    ys = numpy.asarray(ys, dtype=float)
+    inverse, counts = binPositions(xs, ys, cellSize)
+    markerX = numpy.bincount(inverse, weights=xs) / counts
+    markerY = numpy.bincount(inverse, weights=ys) / counts
+    return markerX.tolist(), markerY.tolist(), counts.tolist()
+
+# positions to draw nodes at: the positions themselves, or aggregated markers
+# if they are too dense
+def nodeMarkers(xs, ys, cellSize=nodeCellSize):
+    if tooDense(xs, ys, cellSize, maxNodesPerCell):
+        markerX, markerY, counts = aggregate(xs, ys, cellSize)
+        return markerX, markerY
+    else:
+        return xs, ys
+
+# True if labels at these positions would be readable
+def labelsReadable(xs, ys):
+    return not tooDense(xs, ys, labelCellSize, maxLabelsPerCell)
@@ -7,17 +7,68 @@
 # this class uses unicode by default, i.e. every identifier string that can be
 # used as a key in a dict will be coverted to unicode
 import os
+import sys
 import string
 import types
+import pickle
+import multiprocessing
+import concurrent.futures
 
+import config
+import pluginregistry
 import vrpdata
 import stylesheet
 import util
 
-# load available plugins
-pluginNames = util.getPluginNames()
-for name in pluginNames:
-    exec('import ' + name)
+# parsed instances are cached on disk, so that loading an unchanged instance
+# file again doesn't require parsing it and rebuilding its derived structures
+useInstanceCache = True
+# maximum size of the instance cache in bytes
+instanceCacheSize = 512 * 1024 * 1024
+instanceCache = \
+    util.PersistentDiskCache(os.path.join(config.userConfigDir, 'instances'),
+                             instanceCacheSize)
+
+# version of the code used to load instances of given class: changes whenever
+# the source of a module defining the class or one of its ancestors changes
+def loaderVersion(inputClass):
+    version = [ util.version() ]
+    for c in inputClass.__mro__:
+        module = sys.modules.get(c.__module__)
+        fName = getattr(module, '__file__', None)
+        if fName:
+            stat = os.stat(fName)
+            version.append( (c.__module__, stat.st_size, stat.st_mtime_ns) )
+    return tuple(version)
+
+# key identifying an instance file in its current state in the cache
+def instanceCacheKey(fName, inputClass):
+    stat = os.stat(fName)
+    return (os.path.abspath(fName), stat.st_size, stat.st_mtime_ns,
+            inputClass.__module__ + '.' + inputClass.__name__,
+            loaderVersion(inputClass))
+
+# number of processes used to load several solutions at once
+# None means one process per CPU
+solutionLoadingWorkers = None
+
+# each solution loading process receives the instance and the solution class
+# once, when it starts
+# processes are spawned rather than forked, since the calling process may be
+# running the GUI, whose state can't be safely duplicated
+_workerInstance = None
+_workerSolutionClass = None
+
+def _initSolutionWorker(vrp, solutionClass):
+    global _workerInstance, _workerSolutionClass
+    _workerInstance, _workerSolutionClass = vrp, solutionClass
+
+# only the data read from the file is sent back, the solution is completed in
+# the main process with its own instance
+def _loadSolutionInWorker(fName):
+    solution = _workerSolutionClass.__new__(_workerSolutionClass)
+    solution.parse(fName, _workerInstance)
+    return solution.parsedData()
     
 # an instance of data loader handles various procedures
 class DataLoader:
@@ -28,50 +79,48 @@ class DataLoader:
         self.vrpInputClasses = {}
         self.vrpSolutionClasses = {}
         self.styleSheetClasses = {}
-        # get available plugins
-        pluginNames = util.getPluginNames()
-        # for each of these we can store what they allow to load
-        for name in pluginNames:
-            module = __import__(name)
-            for item in dir(module):
-                if item[:1] == '_': continue
-                thisOne = module.__getattribute__(item)
-                # interesting case: classes
-                if type(thisOne) is type:
-                    # case 1: input data class
-                    if issubclass(thisOne, vrpdata.VrpInputData):
-                        key = (str(thisOne.problemType),
-                               str(thisOne.instanceType))
-                        self.vrpInputClasses[key] = thisOne
-                        if not (key[0], 'default') in self.vrpInputClasses:
-                            # add this class as default in case there isn't one
-                            self.vrpInputClasses[(key[0], 'default')] = thisOne
-                    # case 2: solution data class
-                    elif issubclass(thisOne, vrpdata.VrpSolutionData):
-                        key = (str(thisOne.problemType),
-                               str(thisOne.solutionType))
-                        self.vrpSolutionClasses[key] = thisOne
-                        if not (key[0], 'default') in self.vrpSolutionClasses:
-                            # add this class as default in case there isn't one
-                            self.vrpSolutionClasses[(key[0], 'default')] = \
-                                thisOne
-                    # case 3: style sheet
-                    elif issubclass(thisOne, stylesheet.StyleSheet):
-                        for key in thisOne.defaultFor:
-                            self.styleSheetClasses[str(key)] = thisOne
-                    else:
-                        # non-appropriate class for this context (e.g. Style)
-                        pass
+        # plugins are scanned without being imported: the classes stored
+        # here are only imported when they are used
+        for thisOne in pluginregistry.getPluginClasses():
+            # case 1: input data class
+            if thisOne.kind == 'input':
+                key = (str(thisOne.problemType), str(thisOne.instanceType))
+                self.vrpInputClasses[key] = thisOne
+                if not (key[0], 'default') in self.vrpInputClasses:
+                    # add this class as default in case there isn't one
+                    self.vrpInputClasses[(key[0], 'default')] = thisOne
+            # case 2: solution data class
+            elif thisOne.kind == 'solution':
+                key = (str(thisOne.problemType), str(thisOne.solutionType))
+                self.vrpSolutionClasses[key] = thisOne
+                if not (key[0], 'default') in self.vrpSolutionClasses:
+                    # add this class as default in case there isn't one
+                    self.vrpSolutionClasses[(key[0], 'default')] = thisOne
+            # case 3: style sheet
+            elif thisOne.kind == 'stylesheet':
+                for key in thisOne.defaultFor:
+                    self.styleSheetClasses[str(key)] = thisOne
+            else:
+                # non-appropriate class for this context (e.g. Style)
+                pass
 
     def getInputClassFromType(self, type, subType):
-        return self.vrpInputClasses[(type, subType)]
+        return self.vrpInputClasses[(type, subType)].load()
     
     def getSolutionClassFromType(self, type, subType):
-        return self.vrpSolutionClasses[(type, subType)]
+        return self.vrpSolutionClasses[(type, subType)].load()
 
     # load the instance in file fName with specified type and subtype
+    # the parsed instance is reused from the cache if the file is unchanged
     def loadInstance(self, fName, type, subtype):
-        vrp = self.vrpInputClasses[(str(type), str(subtype))](fName)
+        inputClass = self.getInputClassFromType(str(type), str(subtype))
+        if not useInstanceCache:
+            return inputClass(fName)
+        key = instanceCacheKey(fName, inputClass)
+        vrp = instanceCache.get(key)
+        if vrp is None:
+            vrp = inputClass(fName)
+            instanceCache.put(key, vrp)
         # finally we can return our freshly loaded instance
         return vrp
         
@@ -80,14 +129,40 @@ class DataLoader:
     # if only a solution is returned then it is encapsulated in a list
     def loadSolution(self, fName, vrp, type, solutionSubtype):
         solution = \
-            self.vrpSolutionClasses[(str(type),
-                                     str(solutionSubtype))](fName, vrp)
+            self.getSolutionClassFromType(str(type),
+                                          str(solutionSubtype))(fName, vrp)
         return solution
 #         return solutions if solutions.__class__ == list else [ solutions ]
 
+    # load several solution files to instance vrp, in parallel if possible
+    # solutions are returned in the same order as the file names
+    def loadSolutions(self, fNames, vrp, type, solutionSubtype,
+                      nWorkers=None):
+        solutionClass = self.getSolutionClassFromType(str(type),
+                                                      str(solutionSubtype))
+        if nWorkers is None:
+            nWorkers = solutionLoadingWorkers or os.cpu_count() or 1
+        nWorkers = min(nWorkers, len(fNames))
+        if nWorkers > 1:
+            try:
+                with concurrent.futures.ProcessPoolExecutor(\
+                    max_workers=nWorkers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_initSolutionWorker,
+                    initargs=(vrp, solutionClass)) as executor:
+                    parsed = list(executor.map(_loadSolutionInWorker, fNames))
+                return [ solutionClass.fromParsedData(data, vrp)
+                         for data in parsed ]
+            # pickle raises TypeError or AttributeError for some objects it
+            # can't handle; errors in the data are raised again below
+            except (pickle.PicklingError, TypeError, AttributeError,
+                    concurrent.futures.process.BrokenProcessPool) as e:
+                print('[Warning] unable to load solutions in parallel:', e)
+        return [ solutionClass(fName, vrp) for fName in fNames ]
+
     # load the default style sheet for the given problem type
     def loadStyleSheet(self, type):
-        return self.styleSheetClasses[str(type)]() \
+        return self.styleSheetClasses[str(type)].load()() \
             if str(type) in self.styleSheetClasses \
             else stylesheet.StyleSheet()
 
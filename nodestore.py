@@ -0,0 +1,157 @@
+#
+# Columnar storage for the node data of large instances
+#
+# -*- coding: utf-8 -*-
+# A ColumnarNodeStore replaces the usual list of node dictionaries of a
+# VrpInputData: numeric attributes are kept in contiguous NumPy arrays, other
+# attributes in plain lists. Each node is still accessible as nodes[i], which
+# returns a lightweight view behaving like the original dictionary, so that
+# existing code can keep using node['x'] while vectorized code reads whole
+# columns with nodes.column('x').
+
+import numpy
+
+# marks a node for which an attribute is not defined
+_missing = object()
+
+# return the NumPy type able to store all given values exactly, or None if the
+# values should remain Python objects
+def columnType(values):
+    if all( type(v) is bool for v in values ):
+        return numpy.bool_
+    elif all( type(v) is int and -2**63 <= v < 2**63 for v in values ):
+        return numpy.int64
+    elif all( type(v) is float for v in values ):
+        return numpy.float64
+    else:
+        return None
+
+# dictionary-like view on one node of a ColumnarNodeStore
+class NodeView(object):
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        value = self.store.columns[key][self.index]
+        if value is _missing:
+            raise KeyError(key)
+        # convert NumPy scalars back to the Python type originally stored
+        return value.item() if isinstance(value, numpy.generic) else value
+
+    def __setitem__(self, key, value):
+        self.store.setValue(self.index, key, value)
+
+    def __contains__(self, key):
+        return key in self.store.columns and \
+            not self.store.columns[key][self.index] is _missing
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        try:
+            return dict(self) == dict(other)
+        except Exception as e:
+            return False
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def keys(self):
+        return [ key for key, column in self.store.columns.items()
+                 if not column[self.index] is _missing ]
+
+    def values(self):
+        return [ self[key] for key in self.keys() ]
+
+    def items(self):
+        return [ (key, self[key]) for key in self.keys() ]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def copy(self):
+        return dict(self)
+
+# list-like container of nodes backed by one column per node attribute
+class ColumnarNodeStore(object):
+    def __init__(self, nodes, attributes=None):
+        self.nNodes = len(nodes)
+        # column order follows the attribute list when one is provided
+        names = [] if attributes is None else list(attributes)
+        known = set(names)
+        for node in nodes:
+            for key in node:
+                if not key in known:
+                    known.add(key)
+                    names.append(key)
+        self.columns = {}
+        for name in names:
+            values = [ node[name] if name in node else _missing
+                       for node in nodes ]
+            dtype = None if any( v is _missing for v in values ) \
+                else columnType(values)
+            self.columns[name] = values if dtype is None \
+                else numpy.array(values, dtype=dtype)
+
+    def __len__(self):
+        return self.nNodes
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ NodeView(self, i)
+                     for i in range(*index.indices(self.nNodes)) ]
+        if index < 0:
+            index += self.nNodes
+        if index < 0 or index >= self.nNodes:
+            raise IndexError('node index out of range')
+        return NodeView(self, index)
+
+    def __setitem__(self, index, node):
+        for key in list(self.columns):
+            if not key in node:
+                self.setValue(index, key, _missing)
+        for key, value in node.items():
+            self.setValue(index, key, value)
+
+    def __iter__(self):
+        for i in range(self.nNodes):
+            yield NodeView(self, i)
+
+    def __repr__(self):
+        return repr([ dict(node) for node in self ])
+
+    # set the value of an attribute for one node, converting the column to a
+    # list of Python objects if the value doesn't fit in its array any more
+    def setValue(self, index, key, value):
+        if not key in self.columns:
+            self.columns[key] = [ _missing ] * self.nNodes
+        column = self.columns[key]
+        if isinstance(column, numpy.ndarray):
+            if value is _missing or columnType([value]) != column.dtype.type:
+                column = self.columns[key] = column.tolist()
+            else:
+                column[index] = value
+                return
+        column[index] = value
+
+    # return the values of an attribute for all nodes as a NumPy array
+    def column(self, key):
+        column = self.columns[key]
+        if isinstance(column, numpy.ndarray):
+            return column
+        elif any( v is _missing for v in column ):
+            raise KeyError(key)
+        else:
+            return numpy.array(column)
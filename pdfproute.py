@@ -5,8 +5,10 @@
 # Last modified: July 29th 2011 by Fabien Tricoire
 #
 # this script loads a vrp instance and a solution and paints them to a PDF file
+# (or an SVG or PNG file if the output file name ends with .svg or .png)
 
 import sys
+import os
 import string
 import math
 import types
@@ -20,12 +22,26 @@ import vrpdata
 import loaddata
 import util
 from reportlabCanvas import ReportlabCanvas
+from svgCanvas import SvgCanvas
+from pilCanvas import PilCanvas
 
 USAGE = 'type[:subtype] instance_file [:solution subtype] solution_file\
- [output_file.pdf]'
+ [output_file.pdf|output_file.svg|output_file.png]'
+
+# canvas class for each output file extension, PDF being the default
+canvasClasses = { '.pdf': ReportlabCanvas, '.svg': SvgCanvas,
+                  '.png': PilCanvas }
 
 outputFileName = 'routes.pdf'
 
+# paint a solution to a file, whose extension gives the type of canvas
+def paintToFile(vrp, solution, styleSheet, outputFileName):
+    extension = os.path.splitext(outputFileName)[1].lower()
+    canvasClass = canvasClasses.get(extension, ReportlabCanvas)
+    canvas = canvasClass(vrp.width, vrp.height, outputFileName)
+    styleSheet.paint( vrp, solution, canvas )
+    canvas.save()
+
 # main program: load an instance, a solution, and paint it in a PDF file
 if __name__ == '__main__':
     config.initializeConfig()
@@ -55,10 +71,6 @@ if __name__ == '__main__':
         mySolution = loader.loadSolution(solutionFileName, myVrp,
                                          type, solutionSubtype)
         myStyleSheet = loader.loadStyleSheet(type)
-        # now we can paint it to a PDF canvas
-        width, height = myVrp.width, myVrp.height
-        canvas = ReportlabCanvas(width, height, outputFileName)
-        myStyleSheet.paint( myVrp, mySolution, canvas )
-        canvas.canvas.showPage()
-        canvas.canvas.save()
+        # now we can paint it to a PDF, SVG or raster canvas
+        paintToFile(myVrp, mySolution, myStyleSheet, outputFileName)
         print('Saved to', outputFileName)
@@ -0,0 +1,495 @@
+#
+# Raster canvas drawing into a Pillow image
+#
+# -*- coding: utf-8 -*-
+# Raster output used to require a running wx application. PilCanvas draws
+# into a Pillow image instead, so that PNG files and thumbnails can be
+# produced without a display. Anti-aliasing is obtained by supersampling: the
+# image is drawn larger than requested and reduced when it is retrieved.
+# Coordinates are converted with NumPy, one array per batch of primitives.
+
+from math import *
+
+import numpy
+from PIL import Image, ImageDraw, ImageFont
+
+from canvas import *
+import style
+import graphicsstate
+
+# the image is drawn this many times larger in each dimension
+defaultSupersampling = 2
+# number of points used to draw each Bezier curve of a spline
+pointsPerCurve = 16
+# a centred polygon drawn at least this many times at once is stamped
+minStampPlacements = 2
+# dash pattern, in points
+dashPattern = (7, 10)
+# font files, tried in order; Pillow's built-in font is used if none is found
+defaultFontFiles = { 'normal': [ 'DejaVuSans.ttf', 'Arial.ttf' ],
+                     'bold': [ 'DejaVuSans-Bold.ttf', 'Arial Bold.ttf' ],
+                     'italic': [ 'DejaVuSans-Oblique.ttf', 'Arial Italic.ttf' ] }
+
+# RGBA tuple for an AbstractColour, None for no colour at all
+def convertColour(abstractColour):
+    if abstractColour is None or abstractColour.alpha == 0:
+        return None
+    return abstractColour.getRGBA()
+
+# Pillow font of given family, style and size in pixels
+def loadFont(family, fontStyle, size):
+    fileNames = defaultFontFiles.get(fontStyle, defaultFontFiles['normal'])
+    if family:
+        fileNames = [ family + '.ttf' ] + fileNames
+    for fileName in fileNames:
+        try:
+            return ImageFont.truetype(fileName, size)
+        except IOError:
+            pass
+    return ImageFont.load_default()
+
+# each distinct font is only loaded once
+def internedFont(font, scale):
+    return graphicsstate.intern('pil font',
+                                (font.family, font.style,
+                                 max(1, int(round(font.size * scale)))),
+                                loadFont)
+
+# points of the Bezier curves making up a spline, with the same control
+# points as in the PDF and SVG backends
+def splinePoints(points):
+    points = numpy.array([ points[0] ] + list(points) + [ points[-1] ],
+                         dtype=float)
+    middles = (points[:-1] + points[1:]) / 2.0
+    t = numpy.linspace(0, 1, pointsPerCurve)[:, None]
+    curves = [ middles[0:1] ]
+    for i in range(1, len(points)-1):
+        start, control, end = middles[i-1], points[i], middles[i]
+        curves.append((1-t)**3 * start + 3 * (1-t)**2 * t * control +
+                      3 * (1-t) * t**2 * end + t**3 * end)
+    return numpy.concatenate(curves)
+
+# split a polyline given as an array of points into dashes
+def dashes(points, on, off):
+    result = []
+    period = on + off
+    distance = 0.0
+    for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+        length = hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            continue
+        # dashes overlapping this segment
+        k = floor(distance / period)
+        while k * period < distance + length:
+            start = max(k * period, distance) - distance
+            end = min(k * period + on, distance + length) - distance
+            if end > start:
+                result.append([ (x1 + (x2-x1) * start / length,
+                                 y1 + (y2-y1) * start / length),
+                                (x1 + (x2-x1) * end / length,
+                                 y1 + (y2-y1) * end / length) ])
+            k += 1
+        distance += length
+    return result
+
+# key identifying a drawing style by value
+def drawingStyleKey(style):
+    return (None if style.lineColour is None else style.lineColour.getRGBA(),
+            None if style.fillColour is None else style.fillColour.getRGBA(),
+            style.lineThickness, style.lineStyle)
+
+# image of a centred polygon drawn with a drawing style given by its key, on a
+# transparent background, with the centre of the polygon at the centre of the
+# image
+def makeStamp(points, styleKey, scale):
+    lineRGBA, fillRGBA, thickness, lineStyle = styleKey
+    thisStyle = style.DrawingStyle(None if lineRGBA is None
+                                   else style.Colour(*lineRGBA),
+                                   None if fillRGBA is None
+                                   else style.Colour(*fillRGBA),
+                                   thickness, lineStyle)
+    width = max(1, int(round((1 if thickness is None else thickness) *
+                             scale)))
+    # half the size of the image
+    size = int(ceil(max( [ max(abs(a), abs(b)) for a, b in points ] ) *
+                    scale)) + width + 1
+    # the fill and the contour are drawn on separate layers that are then
+    # composited, so that a transparent contour is blended with the fill as on
+    # other canvases
+    layers = []
+    for part in range(2):
+        canvas = PilCanvas(2.0 * size / scale, 2.0 * size / scale, None,
+                           scale)
+        canvas.image = Image.new('RGBA', (2 * size, 2 * size), (0, 0, 0, 0))
+        canvas.draw = ImageDraw.Draw(canvas.image)
+        layers.append(canvas)
+    fill, contour = layers
+    pixels = [ (size + a * scale, size - b * scale)
+               for a, b in list(points) + list(points[:1]) ]
+    if not thisStyle.fillColour is None:
+        fill.draw.polygon(pixels, fill=convertColour(thisStyle.fillColour))
+    contour.drawPixelPolyline(numpy.array(pixels), thisStyle)
+    return Image.alpha_composite(fill.image, contour.image)
+
+# raster canvas
+class PilCanvas(Canvas):
+    def __init__(self, width, height, fName='default.png',
+                 supersampling=None):
+        self.width = width
+        self.height = height
+        self.fName = fName
+        self.scale = defaultSupersampling if supersampling is None \
+            else supersampling
+        # image and drawing context, created by blank()
+        self.image = None
+        self.draw = None
+        # pixel coordinates of the top left corner of the image we draw on:
+        # restricted drawing is done on a copy of the restricted area
+        self.offset = (0, 0)
+        # (image, draw, offset) for each open restriction
+        self.restrictions = []
+
+    # return the width and height of this canvas
+    def getSize(self):
+        return self.width, self.height
+
+    # clear the canvas and set a white background
+    def blank(self):
+        self.restrictions = []
+        self.offset = (0, 0)
+        self.image = Image.new('RGB',
+                               (int(ceil(self.width * self.scale)),
+                                int(ceil(self.height * self.scale))),
+                               (255, 255, 255))
+        self.draw = ImageDraw.Draw(self.image, 'RGBA')
+
+    # the final image, reduced to the canvas size
+    def getImage(self):
+        if self.scale == 1:
+            return self.image.copy()
+        return self.image.resize((int(ceil(self.width)),
+                                  int(ceil(self.height))), Image.BOX)
+
+    # write the image to the file given at creation
+    def save(self):
+        self.getImage().save(self.fName)
+
+    # convert canvas coordinates to pixel coordinates, as arrays
+    def toPixels(self, xs, ys):
+        xs = numpy.asarray(xs, dtype=float) * self.scale - self.offset[0]
+        ys = (self.height - numpy.asarray(ys, dtype=float)) * self.scale - \
+            self.offset[1]
+        return xs, ys
+
+    # same as above, with one point
+    def toPixel(self, x, y):
+        return (x * self.scale - self.offset[0],
+                (self.height - y) * self.scale - self.offset[1])
+
+    # line width in pixels for a drawing style; thickness 0 means as thin as
+    # possible, as in PDF
+    def lineWidth(self, style):
+        thickness = 1 if style.lineThickness is None else style.lineThickness
+        return max(1, int(round(thickness * self.scale)))
+
+    # outline colour and width for a drawing style, None if no outline
+    # dashed outlines are drawn separately
+    def outline(self, style):
+        if style.lineStyle == 'dashed':
+            return None, 0
+        return convertColour(style.lineColour), self.lineWidth(style)
+
+    # draw a polyline given as an array of pixel coordinates
+    def drawPixelPolyline(self, points, style):
+        colour = convertColour(style.lineColour)
+        if colour is None:
+            return
+        width = self.lineWidth(style)
+        if style.lineStyle == 'dashed':
+            for dash in dashes(points, dashPattern[0] * self.scale,
+                               dashPattern[1] * self.scale):
+                self.draw.line(dash, fill=colour, width=width)
+        else:
+            self.draw.line([ tuple(p) for p in points ], fill=colour,
+                           width=width, joint='curve')
+
+    def restrictDrawing(self, xmin, ymin, xmax, ymax):
+        self.restrictions.append( (self.image, self.draw, self.offset) )
+        left, top = self.toPixel(xmin, ymax)
+        right, bottom = self.toPixel(xmax, ymin)
+        left = min(max(0, int(floor(left))), self.image.size[0])
+        top = min(max(0, int(floor(top))), self.image.size[1])
+        box = (left, top,
+               max(left, min(self.image.size[0], int(ceil(right)))),
+               max(top, min(self.image.size[1], int(ceil(bottom)))))
+        self.image = self.image.crop(box)
+        self.draw = ImageDraw.Draw(self.image, 'RGBA')
+        self.offset = (self.offset[0] + box[0], self.offset[1] + box[1])
+
+    def unrestrictDrawing(self):
+        image, draw, offset = self.restrictions.pop()
+        image.paste(self.image, (self.offset[0] - offset[0],
+                                 self.offset[1] - offset[1]))
+        self.image, self.draw, self.offset = image, draw, offset
+
+    # draw a simple border...
+    def drawBorder(self):
+        self.draw.rectangle([ 0, 0,
+                              self.image.size[0] - 1,
+                              self.image.size[1] - 1 ],
+                            outline=(128, 128, 128),
+                            width=max(1, int(round(self.scale))))
+
+    # coordinates of the south-west corner of a rectangle of size w, h with
+    # the given reference point at x, y
+    def southWestCorner(self, x, y, w, h, referencePoint):
+        if referencePoint == 'centre' or referencePoint == 'center':
+            return x - w/2.0, y - h/2.0
+        elif referencePoint == 'northwest':
+            return x, y-h
+        elif referencePoint == 'northeast':
+            return x-w, y-h
+        elif referencePoint == 'southeast':
+            return x-w, y
+        else:
+            return x, y
+
+    # draw a rectangle centred at coordinates x, y
+    def drawRectangle(self, x, y, w, h, style, referencePoint='centre'):
+        self.drawRectangles([ x ], [ y ], [ w ], [ h ], style, referencePoint)
+
+    # draw a list of rectangles with the same style
+    # xs, ys, ws, hs are lists
+    def drawRectangles(self, xs, ys, ws, hs, style, referencePoint='centre'):
+        if len(xs) == 0:
+            return
+        corners = [ self.southWestCorner(x, y, w, h, referencePoint)
+                    for x, y, w, h in zip(xs, ys, ws, hs) ]
+        lefts, tops = self.toPixels([ x for x, y in corners ],
+                                    [ y + h for (x, y), h in
+                                      zip(corners, hs) ])
+        ws = numpy.asarray(ws, dtype=float) * self.scale
+        hs = numpy.asarray(hs, dtype=float) * self.scale
+        fill = convertColour(style.fillColour)
+        outline, width = self.outline(style)
+        for left, top, w, h in zip(lefts, tops, ws, hs):
+            self.draw.rectangle([ left, top, left + w, top + h ],
+                                fill=fill, outline=outline, width=width)
+            if style.lineStyle == 'dashed':
+                self.drawPixelPolyline(numpy.array([ (left, top),
+                                                     (left + w, top),
+                                                     (left + w, top + h),
+                                                     (left, top + h),
+                                                     (left, top) ]),
+                                       style)
+
+    # draw a circle centred at coordinates x, y
+    def drawCircle(self, x, y, r, style):
+        self.drawCircles([ x ], [ y ], [ r ], style)
+
+    # draw a list of circles with the same colour style
+    # parameters xs, ys, rs should be lists
+    def drawCircles(self, xs, ys, rs, style):
+        if len(xs) == 0:
+            return
+        xs, ys = self.toPixels(xs, ys)
+        rs = numpy.abs(numpy.asarray(rs, dtype=float)) * self.scale
+        fill = convertColour(style.fillColour)
+        outline, width = self.outline(style)
+        for x, y, r in zip(xs, ys, rs):
+            self.draw.ellipse([ x - r, y - r, x + r, y + r ],
+                              fill=fill, outline=outline, width=width)
+
+    # draw a line
+    def drawLine(self, x1, y1, x2, y2, style):
+        self.drawLines([ x1 ], [ y1 ], [ x2 ], [ y2 ], style)
+
+    # draw lines with the same style
+    def drawLines(self, x1s, y1s, x2s, y2s, style):
+        if len(x1s) == 0:
+            return
+        x1s, y1s = self.toPixels(x1s, y1s)
+        x2s, y2s = self.toPixels(x2s, y2s)
+        colour = convertColour(style.lineColour)
+        if colour is None:
+            return
+        if style.lineStyle == 'dashed':
+            for x1, y1, x2, y2 in zip(x1s, y1s, x2s, y2s):
+                self.drawPixelPolyline(numpy.array([ (x1, y1), (x2, y2) ]),
+                                       style)
+        else:
+            width = self.lineWidth(style)
+            for x1, y1, x2, y2 in zip(x1s, y1s, x2s, y2s):
+                self.draw.line([ x1, y1, x2, y2 ], fill=colour, width=width)
+
+    # draw a polyline
+    # x and y are lists
+    def drawPolyline(self, x, y, style):
+        if len(x) < 2:
+            return
+        xs, ys = self.toPixels(x, y)
+        self.drawPixelPolyline(numpy.column_stack((xs, ys)), style)
+
+    # draw a spline; each element in points is a 2-uple with x,y coordinates
+    def drawSpline(self, points, style):
+        points = splinePoints(points)
+        self.drawPolyline(points[:, 0], points[:, 1], style)
+
+    # draw a polygon
+    # x and y are lists of point coordinates
+    def drawPolygon(self, x, y, style):
+        self.drawPolygons([ x ], [ y ], style)
+
+    # draw several polygons with the same style
+    # xs and ys are lists of lists of point coordinates
+    def drawPolygons(self, xs, ys, style):
+        fill = convertColour(style.fillColour)
+        outline, width = self.outline(style)
+        for x, y in zip(xs, ys):
+            if len(x) < 2:
+                continue
+            px, py = self.toPixels(x, y)
+            # Pillow draws thick outlines using a mask as large as the
+            # image, so polygons are drawn on a copy of their area
+            margin = width + 1
+            box = (max(0, int(floor(px.min())) - margin),
+                   max(0, int(floor(py.min())) - margin),
+                   min(self.image.size[0], int(ceil(px.max())) + margin),
+                   min(self.image.size[1], int(ceil(py.max())) + margin))
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            area = self.image.crop(box)
+            points = list(zip(px - box[0], py - box[1]))
+            ImageDraw.Draw(area, 'RGBA').polygon(points, fill=fill,
+                                                 outline=outline,
+                                                 width=width)
+            self.image.paste(area, box[:2])
+            if style.lineStyle == 'dashed':
+                points = list(zip(px, py))
+                self.drawPixelPolyline(numpy.array(points + points[:1]),
+                                       style)
+
+    # draw several times a centred polygon with the same style
+    # the polygon is drawn once on a stamp, which is pasted at each position
+    def drawCentredPolygons(self, polygon, xs, ys, radius, style, angle=0):
+        if len(xs) < minStampPlacements:
+            Canvas.drawCentredPolygons(self, polygon, xs, ys, radius, style,
+                                       angle)
+            return
+        points = polygon.getTransformedPoints(radius, angle)
+        stamp = graphicsstate.intern('pil stamp',
+                                     (tuple(points), drawingStyleKey(style),
+                                      self.scale),
+                                     makeStamp)
+        size = stamp.size[0] // 2
+        xs, ys = self.toPixels(xs, ys)
+        for x, y in zip(numpy.rint(xs).astype(int) - size,
+                        numpy.rint(ys).astype(int) - size):
+            self.image.paste(stamp, (x, y), stamp)
+
+    # draw a text label with top left corner at x, y
+    def drawText(self, label, x, y,
+                 font, foregroundColour, backgroundColour):
+        self.drawTexts([ label ], [ x ], [ y ],
+                       font, foregroundColour, backgroundColour)
+
+    # draw several text labels with top left corners given in xs, ys
+    def drawTexts(self, labels, xs, ys,
+                  font, foregroundColour, backgroundColour):
+        colour = convertColour(foregroundColour)
+        if colour is None or len(xs) == 0:
+            return
+        pilFont = internedFont(font, self.scale)
+        xs, ys = self.toPixels(xs, ys)
+        for label, x, y in zip(labels, xs, ys):
+            self.draw.text((x, y), str(label), font=pilFont, fill=colour)
+
+    # draw a text label at x, y
+    # this version allows to specify a reference point and an angle
+    # rotated text is drawn on a separate image that is rotated around the
+    # reference point, then pasted
+    def drawFancyText(self, label, x, y,
+                      font, foregroundColour, backgroundColour,
+                      angle=0,
+                      referencePoint='northwest'):
+        colour = convertColour(foregroundColour)
+        if colour is None:
+            return
+        if angle is None:
+            angle = 0
+        pilFont = internedFont(font, self.scale)
+        label = str(label)
+        # Pillow anchor corresponding to the reference point; south means
+        # on the baseline, as in PDF
+        if referencePoint == 'centre' or referencePoint == 'center':
+            anchor = 'mm'
+        else:
+            anchor = ('r' if referencePoint[-4:] == 'east' else 'l') + \
+                ('a' if referencePoint[:5] == 'north' else 's')
+        x, y = self.toPixel(x, y)
+        if angle == 0:
+            self.draw.text((x, y), label, font=pilFont, fill=colour,
+                           anchor=anchor)
+            return
+        left, top, right, bottom = pilFont.getbbox(label, anchor=anchor)
+        radius = int(ceil(max(abs(left), abs(top),
+                              abs(right), abs(bottom)))) + 1
+        text = Image.new('RGBA', (2 * radius, 2 * radius), (0, 0, 0, 0))
+        ImageDraw.Draw(text).text((radius, radius), label, font=pilFont,
+                                  fill=colour, anchor=anchor)
+        text = text.rotate(angle, resample=Image.BICUBIC)
+        self.image.paste(text, (int(round(x)) - radius,
+                                int(round(y)) - radius), text)
+
+    # draw a bitmap using the given north-west corner
+    def drawBitmap(self, bitmap, NWcorner):
+        x, y = self.toPixel(*NWcorner)
+        if self.scale != 1:
+            bitmap = bitmap.resize((int(round(bitmap.size[0] * self.scale)),
+                                    int(round(bitmap.size[1] * self.scale))))
+        position = (int(round(x)), int(round(y)))
+        if bitmap.mode == 'RGBA':
+            self.image.paste(bitmap, position, bitmap)
+        else:
+            self.image.paste(bitmap.convert('RGB'), position)
+
+# canvas used for thumbnails: as with the wx thumbnail canvas, only lines
+# are drawn, thin and lighter, since other shapes wouldn't be distinguishable
+# anyway
+class PilThumbnailCanvas(PilCanvas):
+    def __init__(self, width, height, supersampling=None):
+        PilCanvas.__init__(self, width, height, None, supersampling)
+
+    # solid lines one pixel wide, made lighter by removing some alpha
+    def thumbnailStyle(self, thisStyle):
+        lineColour = thisStyle.lineColour
+        if not lineColour is None:
+            r, g, b, a = lineColour.getRGBA()
+            lineColour = style.Colour(r, g, b, max(0, a-100))
+        return style.DrawingStyle(lineColour, None, 1, 'solid')
+
+    def drawLines(self, x1s, y1s, x2s, y2s, style):
+        PilCanvas.drawLines(self, x1s, y1s, x2s, y2s,
+                            self.thumbnailStyle(style))
+
+    def drawPolyline(self, x, y, style):
+        PilCanvas.drawPolyline(self, x, y, self.thumbnailStyle(style))
+
+    def drawRectangles(self, xs, ys, ws, hs, style, referencePoint='center'):
+        pass
+    def drawCircles(self, xs, ys, rs, style):
+        pass
+    def drawPolygons(self, xs, ys, style):
+        pass
+    def drawCentredPolygons(self, polygon, xs, ys, radius, style, angle=0):
+        pass
+    def drawTexts(self, labels, xs, ys,
+                  font, foregroundColour, backgroundColour):
+        pass
+    def drawFancyText(self, label, x, y,
+                      font, foregroundColour, backgroundColour,
+                      angle=None,
+                      referencePoint='centre'):
+        pass
+    def drawBitmap(self, bitmap, NWcorner):
+        pass
@@ -0,0 +1,297 @@
+#
+# Lazy registry of the classes provided by plugins
+#
+# -*- coding: utf-8 -*-
+# Plugins are not imported in order to find out what they provide: their
+# source is scanned with ast instead, looking for subclasses of VrpInputData,
+# VrpSolutionData, StyleSheet and Style along with the class attributes
+# describing them (problemType, instanceType, solutionType, defaultFor,
+# description). The result of scanning a file is cached on disk and reused as
+# long as the file doesn't change. A plugin module is only imported when one
+# of its classes is actually loaded.
+# Plugins whose relevant attributes are not plain literals are imported and
+# inspected the usual way.
+
+import ast
+import os
+
+import config
+import util
+
+# change this whenever the manifest format changes
+manifestVersion = 1
+
+# scanned manifests are cached on disk
+useManifestCache = True
+manifestCacheSize = 16 * 1024 * 1024
+manifestCache = \
+    util.PersistentDiskCache(os.path.join(config.userConfigDir, 'manifests'),
+                             manifestCacheSize)
+
+# core modules defining the classes plugins derive from
+coreModules = [ 'vrpdata', 'stylesheet', 'style' ]
+# kinds of plugin classes, identified by the core class they derive from
+rootClasses = { ('vrpdata', 'VrpInputData'): 'input',
+                ('vrpdata', 'VrpSolutionData'): 'solution',
+                ('stylesheet', 'StyleSheet'): 'stylesheet',
+                ('style', 'Style'): 'style' }
+# class attributes describing each kind of plugin class
+kindAttributes = { 'input': [ 'problemType', 'instanceType' ],
+                   'solution': [ 'problemType', 'solutionType' ],
+                   'stylesheet': [ 'defaultFor' ],
+                   'style': [ 'description' ] }
+
+# marks an attribute whose value can't be known without importing the module
+_dynamic = '<dynamic>'
+
+# a class provided by a plugin, known before its module is imported
+class PluginClass:
+    def __init__(self, moduleName, className, kind, attributes):
+        self.moduleName = moduleName
+        self.className = className
+        self.kind = kind
+        self.attributes = attributes
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['attributes'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return '<plugin class ' + self.moduleName + '.' + self.className + '>'
+
+    # import the module if required and return the actual class
+    def load(self):
+        module = __import__(self.moduleName)
+        return getattr(module, self.className)
+
+# return the dotted name of an expression such as a.b.C, or None
+def dottedName(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        head = dottedName(node.value)
+        return None if head is None else head + '.' + node.attr
+    else:
+        return None
+
+# scan the source of a plugin file
+# the manifest lists imported names and, for each top-level class, its bases
+# and the literal values of its class attributes
+def scanPluginSource(fName):
+    with open(fName, 'rb') as f:
+        tree = ast.parse(f.read(), fName)
+    manifest = { 'imports': {}, 'fromImports': {}, 'starImports': [],
+                 'classes': {}, 'classOrder': [] }
+    wanted = set( a for attributes in kindAttributes.values()
+                  for a in attributes )
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname is None:
+                    head = alias.name.split('.')[0]
+                    manifest['imports'][head] = head
+                else:
+                    manifest['imports'][alias.asname] = alias.name
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            for alias in node.names:
+                if alias.name == '*':
+                    manifest['starImports'].append(node.module)
+                else:
+                    manifest['fromImports'][alias.asname or alias.name] = \
+                        (node.module, alias.name)
+        elif isinstance(node, ast.ClassDef):
+            attributes = {}
+            for item in node.body:
+                if isinstance(item, ast.Assign):
+                    targets = [ t.id for t in item.targets
+                                if isinstance(t, ast.Name) ]
+                elif isinstance(item, ast.AnnAssign) and \
+                        item.value is not None and \
+                        isinstance(item.target, ast.Name):
+                    targets = [ item.target.id ]
+                else:
+                    continue
+                for target in targets:
+                    if target in wanted:
+                        try:
+                            attributes[target] = ast.literal_eval(item.value)
+                        except Exception as e:
+                            attributes[target] = _dynamic
+            manifest['classes'][node.name] = \
+                { 'bases': [ dottedName(b) for b in node.bases ],
+                  'attributes': attributes }
+            manifest['classOrder'].append(node.name)
+    return manifest
+
+# return the manifest for a plugin file, from the cache if it is unchanged
+# None is returned if the file can't be scanned
+def getManifest(fName):
+    stat = os.stat(fName)
+    key = ('plugin manifest', manifestVersion, os.path.abspath(fName),
+           stat.st_size, stat.st_mtime_ns)
+    manifest = manifestCache.get(key) if useManifestCache else None
+    if manifest is None:
+        try:
+            manifest = scanPluginSource(fName)
+        except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+            print('[Warning] unable to scan plugin', fName, ':', e)
+            return None
+        if useManifestCache:
+            manifestCache.put(key, manifest)
+    return manifest
+
+# builds the list of classes provided by all plugins from their manifests
+class PluginScanner:
+    def __init__(self, manifests):
+        # key = module name, value = manifest
+        self.manifests = manifests
+        self.kinds = {}
+
+    # find which class a name used in a module refers to
+    # return (module name, class name), or None if it can't be known
+    def resolve(self, moduleName, name):
+        if name is None:
+            return None
+        manifest = self.manifests[moduleName]
+        if '.' in name:
+            head, tail = name.split('.', 1)
+            if head in manifest['imports'] and not '.' in tail:
+                return (manifest['imports'][head], tail)
+            return None
+        elif name in manifest['classes']:
+            return (moduleName, name)
+        elif name in manifest['fromImports']:
+            return manifest['fromImports'][name]
+        for starModule in manifest['starImports']:
+            if starModule in self.manifests and \
+                    name in self.manifests[starModule]['classes']:
+                return (starModule, name)
+            elif starModule in coreModules and \
+                    hasattr(__import__(starModule), name):
+                return (starModule, name)
+        return None
+
+    # kind of a class ('input', 'solution', 'stylesheet', 'style') or None
+    def kind(self, reference):
+        if reference is None:
+            return None
+        elif reference in rootClasses:
+            return rootClasses[reference]
+        elif reference in self.kinds:
+            return self.kinds[reference]
+        moduleName, className = reference
+        result = None
+        # protect against cyclic definitions
+        self.kinds[reference] = None
+        if moduleName in coreModules:
+            thisClass = getattr(__import__(moduleName), className, None)
+            for (rootModule, rootName), kind in rootClasses.items():
+                root = getattr(__import__(rootModule), rootName)
+                if isinstance(thisClass, type) and \
+                        issubclass(thisClass, root):
+                    result = kind
+        elif moduleName in self.manifests and \
+                className in self.manifests[moduleName]['classes']:
+            for base in \
+                    self.manifests[moduleName]['classes'][className]['bases']:
+                result = self.kind(self.resolve(moduleName, base))
+                if not result is None:
+                    break
+        self.kinds[reference] = result
+        return result
+
+    # value of a class attribute, looking into base classes if required
+    def attribute(self, reference, name):
+        if reference is None:
+            return _dynamic
+        moduleName, className = reference
+        if moduleName in coreModules:
+            thisClass = getattr(__import__(moduleName), className, None)
+            return getattr(thisClass, name, _dynamic)
+        elif moduleName in self.manifests and \
+                className in self.manifests[moduleName]['classes']:
+            thisClass = self.manifests[moduleName]['classes'][className]
+            if name in thisClass['attributes']:
+                return thisClass['attributes'][name]
+            for base in thisClass['bases']:
+                value = self.attribute(self.resolve(moduleName, base), name)
+                if value != _dynamic:
+                    return value
+        return _dynamic
+
+    # all relevant classes defined in a module, or None if the module must be
+    # imported to know them
+    def moduleClasses(self, moduleName):
+        classes = []
+        # same order as when inspecting the module with dir()
+        for className in sorted(self.manifests[moduleName]['classOrder']):
+            reference = (moduleName, className)
+            kind = self.kind(reference)
+            if kind is None:
+                continue
+            attributes = {}
+            for name in kindAttributes[kind]:
+                attributes[name] = self.attribute(reference, name)
+                if attributes[name] == _dynamic:
+                    return None
+            classes.append(PluginClass(moduleName, className, kind,
+                                       attributes))
+        return classes
+
+# inspect an imported module, for plugins that can't be handled statically
+def inspectModule(moduleName):
+    classes = []
+    module = __import__(moduleName)
+    roots = [ (getattr(__import__(m), c), kind)
+              for (m, c), kind in rootClasses.items() ]
+    for item in dir(module):
+        if item[:1] == '_': continue
+        thisOne = getattr(module, item)
+        if not type(thisOne) is type:
+            continue
+        for root, kind in roots:
+            if issubclass(thisOne, root) and not thisOne is root:
+                attributes = dict( (name, getattr(thisOne, name))
+                                   for name in kindAttributes[kind] )
+                classes.append(PluginClass(moduleName, item, kind,
+                                           attributes))
+                break
+    return classes
+
+# return the classes provided by all plugins, optionally only of one kind
+# ('input', 'solution', 'stylesheet' or 'style')
+def getPluginClasses(kind=None):
+    manifests = {}
+    moduleNames = []
+    for pluginDir in config.pluginDirectories:
+        try:
+            fNames = sorted(os.listdir(pluginDir))
+        except OSError as e:
+            print('[Warning] unable to load plugins:', e)
+            continue
+        for fName in fNames:
+            moduleName = fName[:-3]
+            # modules found first on the path shadow the others
+            if fName[-3:] != '.py' or moduleName in manifests:
+                continue
+            manifests[moduleName] = getManifest(os.path.join(pluginDir, fName))
+            moduleNames.append(moduleName)
+    # plugins that couldn't be scanned are inspected after being imported
+    scanner = PluginScanner(dict( (m, manifest)
+                                  for m, manifest in manifests.items()
+                                  if not manifest is None ))
+    classes = []
+    for moduleName in moduleNames:
+        moduleClasses = None
+        if not manifests[moduleName] is None:
+            moduleClasses = scanner.moduleClasses(moduleName)
+        if moduleClasses is None:
+            try:
+                moduleClasses = inspectModule(moduleName)
+            except Exception as e:
+                print('[Warning] unable to load plugin', moduleName, ':', e)
+                moduleClasses = []
+        classes += moduleClasses
+    return [ c for c in classes if kind is None or c.kind == kind ]
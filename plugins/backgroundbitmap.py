@@ -23,6 +23,7 @@ import colours
 # Display a background bitmap
 class BackgroundBitmapDisplayer( Style ):
     description = 'background bitmap'
+    layer = 'background'
     # xNW and yNW are the coordinates of the north-west corner point of the map
     # xSE and ySE are the coordinates of the south-east corner point of the map
     # acceptable values for corner point parameters
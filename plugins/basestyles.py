@@ -6,10 +6,13 @@
 from style import *
 
 import colours
+import culling
+import levelofdetail
 
 # Basic style for an input data: draw depot and nodes
 class NodeDisplayer( Style ):
     description = 'nodes'
+    layer = 'instance'
     # used multiple times
     colourInfo = ColourParameterInfo()
     parameterInfo = { 'depot colour': colourInfo,
@@ -32,33 +35,35 @@ class NodeDisplayer( Style ):
                      'node contour thickness': 1,
                      'hide unused nodes': False,
                       }
+    #
+    def dependsOnSolution(self):
+        return self.parameterValue['hide unused nodes']
 
     #
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
-        # display depots
-        depotX = []
-        depotY = []
-        depotW = []
-        nodeX = []
-        nodeY = []
-        nodeR = []
-        for node in inputData.nodes:
-            if (nodePredicate and not nodePredicate(node)) or \
-                    self.parameterValue['hide unused nodes'] and \
-                    not solutionData.nodes[node['index']]['used']:
-                continue
-            # case of a depot
-            if node['is depot']:
-                depotX.append(convertX(node['x']))
-                depotY.append(convertY(node['y']))
-                depotW.append(self.parameterValue['depot size'])
-            else:
-                nodeX.append(convertX(node['x']))
-                nodeY.append(convertY(node['y']))
-                nodeR.append(self.parameterValue['node size'])
+              boundingBox, context):
+        # only nodes in the visible area are drawn
+        indices = context.shownNodeIndices(\
+            self.parameterValue['hide unused nodes'])
+        isDepot = context.nodeAttributeArray('is depot').astype(bool)
+        depots = indices[isDepot[indices]]
+        others = indices[~isDepot[indices]]
+        # screen coordinates are looked up for all selected nodes at once
+        screenX, screenY = context.screenCoordinates()
+        depotX = screenX[depots].tolist()
+        depotY = screenY[depots].tolist()
+        depotW = [ self.parameterValue['depot size'] ] * len(depots)
+        nodeX = screenX[others].tolist()
+        nodeY = screenY[others].tolist()
+        # when zoomed out on many nodes, nodes sharing the same few pixels are
+        # drawn as one marker
+        nodeX, nodeY = \
+            levelofdetail.nodeMarkers(nodeX, nodeY,
+                                      max(levelofdetail.nodeCellSize,
+                                          self.parameterValue['node size']))
+        nodeR = [ self.parameterValue['node size'] ] * len(nodeX)
         # draw all non-depots
         style = DrawingStyle(self.parameterValue['node contour'],
                              self.parameterValue['node colour'],
@@ -75,6 +80,7 @@ class NodeDisplayer( Style ):
 # Display a label for each node
 class NodeLabelDisplayer( Style ):
     description = 'node label'
+    layer = 'instance'
     # used multiple times
     colourInfo = ColourParameterInfo()
     parameterInfo = { 
@@ -95,11 +101,15 @@ class NodeLabelDisplayer( Style ):
         'font style': 'normal',
         'hide unused nodes': False,
         }
+    # solution node attributes start with '+'
+    def dependsOnSolution(self):
+        return self.parameterValue['hide unused nodes'] or \
+            self.parameterValue['attribute'][0] == '+'
     #
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         # one-time-only block
         if not 'attribute' in self.parameterInfo:
             self.parameterInfo['attribute'] = \
@@ -109,23 +119,23 @@ class NodeLabelDisplayer( Style ):
                     self.parameterValue['font style'])
         foreground = self.parameterValue['foreground colour']
         background = self.parameterValue['background colour']
-        labels, xs, ys = [], [], []
-        for node in inputData.nodes:
-            if (nodePredicate and not nodePredicate(node)) or \
-                    self.parameterValue['hide unused nodes'] and \
-                    not solutionData.nodes[node['index']]['used']:
-                continue
-            labels.append(str(globalNodeAttributeValue(self.parameterValue\
-                                                           ['attribute'],
-                                                       node,
-                                                       solutionData)))
-            xs.append(convertX(node['x']) + self.parameterValue['x offset'])
-            ys.append(convertY(node['y']) + self.parameterValue['y offset'])
+        indices = context.shownNodeIndices(\
+            self.parameterValue['hide unused nodes'],
+            culling.wideCullingMargin)
+        screenX, screenY = context.screenCoordinates()
+        xs = (screenX[indices] + self.parameterValue['x offset']).tolist()
+        ys = (screenY[indices] + self.parameterValue['y offset']).tolist()
+        # labels are not drawn when too dense to be read
+        if not levelofdetail.labelsReadable(xs, ys):
+            return
+        values = context.nodeAttributeColumn(self.parameterValue['attribute'])
+        labels = [ str(values[i]) for i in indices.tolist() ]
         canvas.drawTexts(labels, xs, ys, font, foreground, background)
 
 # Display a rectangle proportional to the demand for each node
 class NodeDemandDisplayer( Style ):
     description = 'small bar for demand'
+    layer = 'instance'
     # used multiple times
     offsetInfo = IntParameterInfo(-20, 20)
     parameterInfo = { 
@@ -151,10 +161,13 @@ class NodeDemandDisplayer( Style ):
         self.minDemand = False
         self.maxDemand = False
     #
+    def dependsOnSolution(self):
+        return self.parameterValue['hide unused nodes']
+    #
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         # first compute min and max demand if it's the first time we're here
         if not self.minDemand:
             demands = [ node['demand'] for node in inputData.nodes ]
@@ -163,18 +176,15 @@ class NodeDemandDisplayer( Style ):
                 util.intervalMapping(self.minDemand, self.maxDemand,
                                      self.parameterValue['min. height'],
                                      self.parameterValue['max. height'])
-        allX, allY, allW, allH = [], [], [], []
-        for node in inputData.nodes:
-            if (nodePredicate and not nodePredicate(node)) or \
-                    self.parameterValue['hide unused nodes'] and \
-                    not solutionData.nodes[node['index']]['used']:
-                continue
-            allX.append(convertX(node['x']) +
-                        self.parameterValue['x offset'])
-            allY.append(convertY(node['y']) +
-                        self.parameterValue['y offset'])
-            allW.append(self.parameterValue['width'])
-            allH.append(self.computeHeight(node['demand']))
+        indices = context.shownNodeIndices(\
+            self.parameterValue['hide unused nodes'],
+            culling.wideCullingMargin)
+        demands = context.nodeAttributeColumn('demand')
+        allH = [ self.computeHeight(demands[i]) for i in indices.tolist() ]
+        screenX, screenY = context.screenCoordinates()
+        allX = (screenX[indices] + self.parameterValue['x offset']).tolist()
+        allY = (screenY[indices] + self.parameterValue['y offset']).tolist()
+        allW = [ self.parameterValue['width'] ] * len(indices)
         style = DrawingStyle(self.parameterValue['colour'],
                              self.parameterValue['colour'])
         canvas.drawRectangles(allX, allY, allW, allH, style,
@@ -200,23 +210,25 @@ class RouteDisplayer( Style ):
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
-        # display each route
-        for route in solutionData.routes:
-            if routePredicate and not routePredicate(route): continue
-            for arc in route['arcs']:
-                if arcPredicate and not arcPredicate(arc): continue
-                node1 = inputData.nodes[arc['from']]
-                node2 = inputData.nodes[arc['to']]
-                style=DrawingStyle(lineColour=self.parameterValue['arc colour'],
-                              lineThickness=self.parameterValue['thickness'])
+              boundingBox, context):
+        # display each route (only arcs in the visible area)
+        isDepot = context.nodeAttributeColumn('is depot')
+        froms, tos = [], []
+        for arcs in context.shownArcs():
+            for arc in arcs:
                 if self.parameterValue['draw depot arcs'] or\
-                        ( not node1['is depot'] and not node2['is depot'] ):
-                    canvas.drawLine(convertX(node1['x']),
-                                    convertY(node1['y']),
-                                    convertX(node2['x']),
-                                    convertY(node2['y']),
-                                    style)
+                        ( not isDepot[arc['from']] and \
+                              not isDepot[arc['to']] ):
+                    froms.append(arc['from'])
+                    tos.append(arc['to'])
+        screenX, screenY = context.screenCoordinates()
+        style=DrawingStyle(lineColour=self.parameterValue['arc colour'],
+                           lineThickness=self.parameterValue['thickness'])
+        for x1, y1, x2, y2 in zip(screenX[froms].tolist(),
+                                  screenY[froms].tolist(),
+                                  screenX[tos].tolist(),
+                                  screenY[tos].tolist()):
+            canvas.drawLine(x1, y1, x2, y2, style)
 
 # Basic style for a solution data: draw arcs
 class RoutePolylineDisplayer( Style ):
@@ -238,18 +250,19 @@ class RoutePolylineDisplayer( Style ):
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         style=DrawingStyle(lineColour=self.parameterValue['arc colour'],
                            lineThickness=self.parameterValue['thickness'])
-        # display each route
-        for route in solutionData.routes:
-            if routePredicate and not routePredicate(route): continue
-            x, y = [], []
-            for node in route['node sequence']:
-                x.append(convertX(inputData.nodes[node]['x']))
-                y.append(convertY(inputData.nodes[node]['y']))
-            if len(x) > 1:
-                canvas.drawPolyline(x, y, style)
+        # display each route: only the parts in the visible area are drawn
+        screenX, screenY = context.screenCoordinates()
+        for shown, sequences in zip(context.routeMask(),
+                                    context.visiblePolylines()):
+            if not shown: continue
+            for sequence in sequences:
+                if len(sequence) > 1:
+                    canvas.drawPolyline(screenX[sequence].tolist(),
+                                        screenY[sequence].tolist(),
+                                        style)
 
 # Draw routes with different colours depending on attributes
 class RouteColourDisplayer( Style ):
@@ -284,7 +297,7 @@ class RouteColourDisplayer( Style ):
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         # this block is only executed the first time the style is used
         if self.values is None:
             # we construct a unique value-colour mapping
@@ -295,29 +308,32 @@ class RouteColourDisplayer( Style ):
                 RouteAttributeParameterInfo(solutionData, acceptable)
             self.mapping = {}
         # make sure that each route is present in the mapping
-        self.values = set([ route[self.parameterValue['attribute']]
-                            for route in solutionData.routes ])
+        self.values = \
+            context.routeAttributeValues(self.parameterValue['attribute'])
         for v in self.values:
             if not v in self.mapping:
                 self.mapping[v] = len(self.mapping)
         # end of first-time-only block
         # display each route
         attribute = self.parameterValue['attribute']
-        for route in solutionData.routes:
-            if routePredicate and not routePredicate(route): continue
+        # only the parts of routes in the visible area are drawn
+        visiblePolylines = context.visiblePolylines(\
+            not self.parameterValue['draw depot arcs'])
+        screenX, screenY = context.screenCoordinates()
+        for route, shown, sequences in zip(solutionData.routes,
+                                           context.routeMask(),
+                                           visiblePolylines):
+            if not shown: continue
             # set the appropriate colour for this route
             thisColour = self.parameterValue['colours']\
                 [self.mapping[route[attribute]]]
             style = DrawingStyle(thisColour,
                                  lineThickness=self.parameterValue['thickness'])
-            x, y = [], []
-            for node in route['node sequence']:
-                if self.parameterValue['draw depot arcs'] or\
-                        not inputData.nodes[node]['is depot']:
-                    x.append(convertX(inputData.nodes[node]['x']))
-                    y.append(convertY(inputData.nodes[node]['y']))
-            if len(x) > 1:
-                canvas.drawPolyline(x, y, style)
+            for sequence in sequences:
+                if len(sequence) > 1:
+                    canvas.drawPolyline(screenX[sequence].tolist(),
+                                        screenY[sequence].tolist(),
+                                        style)
 #             # now we can draw the route
 #             for arc in route['arcs']:
 #                 if arcPredicate and not arcPredicate(arc): continue
@@ -358,7 +374,7 @@ class ArcAttributeDisplayer( Style ):
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         # first-time-only execution
         if 'attribute' not in self.parameterInfo:
             self.parameterInfo['attribute'] = \
@@ -369,17 +385,15 @@ class ArcAttributeDisplayer( Style ):
                     self.parameterValue['font style'])
         foreground = self.parameterValue['foreground colour']
         background = self.parameterValue['background colour']
-        # display each route
-        for route in solutionData.routes:
-            if routePredicate and not routePredicate(route): continue
-            for arc in route['arcs']:
-                if arcPredicate and not arcPredicate(arc): continue
+        # display each route (only arcs in the visible area)
+        screenX, screenY = context.screenCoordinates()
+        screenX, screenY = screenX.tolist(), screenY.tolist()
+        for arcs in context.shownArcs(culling.wideCullingMargin):
+            for arc in arcs:
                 if not self.parameterValue['attribute'] in arc: continue
-                node1 = inputData.nodes[arc['from']]
-                node2 = inputData.nodes[arc['to']]
                 # here we calculate the position and angle of our label
-                x1, y1 = convertX(node1['x']), convertY(node1['y'])
-                x2, y2 = convertX(node2['x']), convertY(node2['y'])
+                x1, y1 = screenX[arc['from']], screenY[arc['from']]
+                x2, y2 = screenX[arc['to']], screenY[arc['to']]
                 # test
                 if x1 < x2:
                     x1, y1, x2, y2 = x2, y2, x1, y1
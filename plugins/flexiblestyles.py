@@ -10,6 +10,7 @@ from style import *
 
 import colours
 import shapes
+import culling
 from colourmapping import *
 from functools import reduce
 
@@ -90,13 +91,16 @@ class FlexibleSubInterval(Style):
             self.timeToX = util.intervalMapping(self.earliest, self.latest,
                                                 0.0,
                                                 self.parameterValue['width'])
-        # now we can display everything we want
+        # now we can display everything we want, for nodes in the visible area
+        visibleNodes = culling.visibleNodes(inputData, boundingBox,
+                                            convertX, convertY,
+                                            culling.wideCullingMargin)
         # for each node display its background
         allX, allY, allW, allH = [], [], [], []
         style = DrawingStyle(self.parameterValue['background colour'],
                              self.parameterValue['background colour'],
                              lineThickness=self.parameterValue['thickness'])
-        for node in inputData.nodes:
+        for node in visibleNodes:
             if not ('x' in node and 'y' in node):
                 continue
             allX.append(convertX(node['x']) + self.parameterValue['x offset'])
@@ -111,7 +115,7 @@ class FlexibleSubInterval(Style):
         allX, allY, allW, allH = [], [], [], []
         style = DrawingStyle(self.parameterValue['time window colour'],
                              self.parameterValue['time window colour'])
-        for node in inputData.nodes:
+        for node in visibleNodes:
             if not ('x' in node and 'y' in node):
                 continue
             allX.append(convertX(node['x']) + self.parameterValue['x offset'] +
@@ -128,7 +132,7 @@ class FlexibleSubInterval(Style):
         allX, allY, allW, allH = [], [], [], []
         style = DrawingStyle(self.parameterValue['contour colour'],
                              lineThickness=self.parameterValue['thickness'])
-        for node in inputData.nodes:
+        for node in visibleNodes:
             if not ('x' in node and 'y' in node):
                 continue
             allX.append(convertX(node['x']) + self.parameterValue['x offset'])
@@ -230,8 +234,12 @@ class NodeAttributeAsRectangleDisplayer( Style ):
                                      self.parameterValue['max. height'])
         # second only continue if an attribute is specified
         allX, allY, allW, allH = [], [], [], []
-        for node, fValue, value in zip(inputData.nodes,
-                                       self.fValues, self.values):
+        # only nodes in the visible area are drawn
+        for i in culling.visibleNodeIndices(inputData, boundingBox,
+                                            convertX, convertY,
+                                            culling.wideCullingMargin):
+            node, fValue, value = inputData.nodes[i], self.fValues[i], \
+                self.values[i]
             if nodePredicate and not nodePredicate(node):
                 continue
             # only display nodes matching the filter
@@ -308,9 +316,14 @@ class NodeListAttributeAsRectanglesDisplayer(NodeAttributeAsRectangleDisplayer):
         # second only continue if an attribute is specified
         # we use a different colour (hence style) for each item
         nElements = len(values[0])
+        # only nodes in the visible area are drawn
+        visible = [ (inputData.nodes[j], values[j])
+                    for j in culling.visibleNodeIndices(\
+                inputData, boundingBox, convertX, convertY,
+                culling.wideCullingMargin) ]
         for i in range(nElements):
             allX, allY, allW, allH = [], [], [], []
-            for node, vals in zip(inputData.nodes, values):
+            for node, vals in visible:
                 if (nodePredicate and not nodePredicate(node)) or \
                         node['is depot']:
                     continue
@@ -415,7 +428,7 @@ class FlexibleNodeDisplayer( Style ):
     def paint(self, inputData, solutionData,
               canvas, convertX, convertY,
               nodePredicate, routePredicate, arcPredicate,
-              boundingBox):
+              boundingBox, context):
         # first-time-only execution
         if not 'radius attribute' in self.parameterInfo:
             def acceptable(x):
@@ -496,39 +509,37 @@ class FlexibleNodeDisplayer( Style ):
         else:
             style = []
         # re-calculated here because it changes from one solution to another
-        values = globalNodeAttributeValues(\
-                self.parameterValue['filter attribute'],
-                inputData,
-                solutionData)
-        fValues = [ x if isinstance(x, str) else str(x)
-                    for x in values ]
-        rValues = globalNodeAttributeValues(\
-                self.parameterValue['radius attribute'],
-                inputData,
-                solutionData)
-        for node, filterValue, rValue in zip(inputData.nodes,
-                                             fValues,
-                                             rValues):
-            if nodePredicate and not nodePredicate(node):
-                continue
+        # (the render context computes them once for all styles and cells)
+        fValues = context.lookup(context.shared,
+                                 ('filter strings',
+                                  self.parameterValue['filter attribute']),
+                                 lambda values: [ x if isinstance(x, str)
+                                                  else str(x)
+                                                  for x in values ],
+                                 context.nodeAttributeColumn(\
+                self.parameterValue['filter attribute']))
+        rValues = context.nodeAttributeColumn(\
+            self.parameterValue['radius attribute'])
+        colourValues = context.nodeAttributeColumn(\
+            self.parameterValue['colour attribute'])
+        screenX, screenY = context.screenCoordinates()
+        screenX, screenY = screenX.tolist(), screenY.tolist()
+        # only nodes in the visible area are drawn
+        for i in context.shownNodeIndices(False,
+                                          culling.wideCullingMargin).tolist():
             # only display nodes matching the filter
-            elif self.parameterValue['filter active'] and \
+            if self.parameterValue['filter active'] and \
                     'filter value' in self.parameterValue and \
-                    filterValue != self.parameterValue['filter value']:
+                    fValues[i] != self.parameterValue['filter value']:
                 continue
             else:
-                allX.append(convertX(node['x']) +
-                            self.parameterValue['x offset'])
-                allY.append(convertY(node['y']) +
-                            self.parameterValue['y offset'])
-                allR.append(self.computeRadius(rValue) \
+                allX.append(screenX[i] + self.parameterValue['x offset'])
+                allY.append(screenY[i] + self.parameterValue['y offset'])
+                allR.append(self.computeRadius(rValues[i]) \
                                 if self.parameterValue['radius by attribute'] \
                                 else self.parameterValue['max. radius'])
                 if self.parameterValue['node colouring'] != 'constant':
-                    value = globalNodeAttributeValue(self.parameterValue\
-                                                         ['colour attribute'],
-                                                     node,
-                                                     solutionData)
+                    value = colourValues[i]
                     style.append(DrawingStyle(\
                             self.contourMapping[value],
                             self.fillMapping[value],
@@ -713,10 +724,16 @@ class FlexibleArcDisplayer( Style ):
         angleInRadians = math.pi * self.parameterValue['arrow angle'] / 180
         myCos = math.cos(angleInRadians)
         mySin = math.sin(angleInRadians)
+        # arcs outside of the visible area are not displayed
+        visibleArcs = culling.visibleArcs(inputData, solutionData, boundingBox,
+                                          convertX, convertY,
+                                          culling.wideCullingMargin)
+        visible = set( id(arc) for arcs in visibleArcs for arc in arcs )
         for route in solutionData.routes:
                 for arc in route['arcs']:
                     if (routePredicate is None or routePredicate(route)) \
-                       and (arcPredicate is None or arcPredicate(arc)):
+                       and (arcPredicate is None or arcPredicate(arc)) \
+                       and id(arc) in visible:
                         value = arc[self.parameterValue['filter attribute']]
                         if not isinstance(value, str):
                             value = str(value)
@@ -5,22 +5,97 @@
 #
 # -*- coding: utf-8 -*-
 
+import ast
+import re
 import string
 
+import numpy
+
 import vrpdata
 import stylesheet
 import vrpexceptions
 
+# number of rows used to guess the type of a column
+typeInferenceRows = 100
+
+intPattern = re.compile(r'[-+]?(0|[1-9][0-9]*)$')
+identifierPattern = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+floatPattern = re.compile(r'[-+]?([0-9]+\.[0-9]*|\.[0-9]+|[0-9]+(\.[0-9]*)?[eE][-+]?[0-9]+|[0-9]+\.[0-9]*[eE][-+]?[0-9]+)$')
+
+# convert one value: python literals are evaluated safely, anything else is
+# kept as a string (quoted strings included, quotes are not removed)
+def parseValue(value):
+    # names other than True, False and None are not literals: no need to try
+    if identifierPattern.match(value) and \
+            not value in ('True', 'False', 'None'):
+        return value
+    try:
+        result = ast.literal_eval(value)
+    except Exception as e:
+        return value
+    return value if isinstance(result, str) else result
+
 # useful when reading a line of data...
 def fillDict(keys, values):
-    thisDict = {}
-    for key, value in zip(keys, values):
-        # try to eval, if it doesn't work then it's a string...
-        try:
-            thisDict[key] = eval(value.replace('\'', '\\\'').replace('\"', '\\\"'))
-        except Exception as e:
-            thisDict[key] = value
-    return thisDict
+    return { key: parseValue(value) for key, value in zip(keys, values) }
+
+# guess the type of a column from its first values: 'bool', 'int', 'float',
+# 'list' or 'string'
+def inferColumnType(values):
+    sample = values[:typeInferenceRows]
+    if len(sample) == 0:
+        return 'string'
+    elif all( v == 'True' or v == 'False' for v in sample ):
+        return 'bool'
+    elif all( intPattern.match(v) for v in sample ):
+        return 'int'
+    elif all( floatPattern.match(v) or intPattern.match(v) for v in sample ):
+        return 'float'
+    elif all( v[:1] == '[' and v[-1:] == ']' for v in sample ):
+        return 'list'
+    else:
+        return 'string'
+
+# convert a whole column at once according to its inferred type; if some value
+# doesn't match that type, and for columns of any other type, each value of the
+# column is converted separately
+# all values are checked against the type, since NumPy accepts values that are
+# not Python literals (e.g. 'nan', '007'), which must stay strings
+def convertColumn(values):
+    columnType = inferColumnType(values)
+    try:
+        if columnType == 'bool':
+            if not set(values) <= set(['True', 'False']):
+                raise ValueError('not a boolean column')
+            return [ v == 'True' for v in values ]
+        elif columnType == 'int':
+            if not all( intPattern.match(v) for v in values ):
+                raise ValueError('not an integer column')
+            return numpy.array(values).astype(numpy.int64).tolist()
+        elif columnType == 'float':
+            if not all( floatPattern.match(v) or intPattern.match(v)
+                        for v in values ):
+                raise ValueError('not a float column')
+            floats = numpy.array(values).astype(numpy.float64).tolist()
+            # values written as integers stay integers
+            return [ int(v) if intPattern.match(v) else f
+                     for v, f in zip(values, floats) ]
+        elif columnType == 'list':
+            converted = [ ast.literal_eval(v) for v in values ]
+            if not all( isinstance(v, list) for v in converted ):
+                raise ValueError('not a list column')
+            return converted
+        else:
+            return [ parseValue(v) for v in values ]
+    except (ValueError, SyntaxError, OverflowError, MemoryError) as e:
+        return [ parseValue(v) for v in values ]
+
+# build one dictionary per row, converting the data column by column
+def parseRows(fields, rows):
+    if len(rows) == 0:
+        return []
+    columns = [ convertColumn(list(column)) for column in zip(*rows) ]
+    return [ dict(zip(fields, values)) for values in zip(*columns) ]
 
 class PIFInputData(vrpdata.VrpInputData):    
     problemType = 'Generic'
@@ -28,8 +103,9 @@ class PIFInputData(vrpdata.VrpInputData):
     # load an instance
     def loadData(self, fName):
         stage = 'header'
-        self.nodes = []
         self.attributes = {}
+        # node lines are split while reading and converted all at once
+        rows = []
         for line in open(fName).readlines():
             line = line.rstrip()
             # ignore comments and empty lines
@@ -50,11 +126,7 @@ class PIFInputData(vrpdata.VrpInputData):
                 if line[0] == separator:
                     key, value = line[1:].split(separator)
                     self.globalAttributes.append(key)
-                    # try to eval, if it doesn't work then it's a string...
-                    try:
-                        self.attributes[key] = eval(value)
-                    except Exception as e:
-                        self.attributes[key] = value
+                    self.attributes[key] = parseValue(value)
                 # line specifying node format
                 elif stage == 'format':
                     fields = line.split(separator)
@@ -69,9 +141,10 @@ class PIFInputData(vrpdata.VrpInputData):
                     if len(tokens) != len(fields):
                         raise vrpexceptions.VrpInputFileFormatException('PIF',
                                                                        fName)
-                    thisNode = fillDict(fields, tokens)
-                    thisNode['index'] = len(self.nodes)
-                    self.nodes.append(thisNode)
+                    rows.append(tokens)
+        self.nodes = parseRows(fields, rows) if rows else []
+        for index, node in enumerate(self.nodes):
+            node['index'] = index
 
 class PSFSolutionData(vrpdata.VrpSolutionData):
     problemType = 'Generic'
@@ -83,14 +156,19 @@ class PSFSolutionData(vrpdata.VrpSolutionData):
         # extra solution data for all nodes
         self.nodes = [ { 'index': x['index'] } for x in vrpData.nodes ]
         stage = 'header'
+        # content lines are split while reading and converted all at once:
+        # route rows, then arc and route-node rows along with the position of
+        # the route they belong to, then node rows
+        routeRows, arcRows, routeNodeRows, nodeRows = [], [], [], []
+        arcRoutes, routeNodeRoutes = [], []
         # process each line...
         for line in open(fName).readlines():
             line = line.rstrip()
             # ignore comments and empty lines
-            if line[0] == '#' or len(line) == 0:
+            if len(line) == 0 or line[0] == '#':
                 pass
             # first header line
-            if stage == 'header':
+            elif stage == 'header':
                 if line[:22] != 'proute solution file v':
                     raise vrpexceptions.VrpInputFileFormatException('PSF',
                                                                     fName)
@@ -103,11 +181,7 @@ class PSFSolutionData(vrpdata.VrpSolutionData):
                 # case of a global solution attribute
                 if line[0] == separator:
                     key, value = line[1:].split(separator)
-                     # try to eval, if it doesn't work then it's a string...
-                    try:
-                        self.attributes[key] = eval(value)
-                    except Exception as e:
-                        self.attributes[key] = value
+                    self.attributes[key] = parseValue(value)
                 # line specifying format
                 elif stage == 'format':
                     fields = line.split(separator)
@@ -129,8 +203,6 @@ class PSFSolutionData(vrpdata.VrpSolutionData):
                         self.routeNodeAttributes += routeNodeFields
                         self.routeNodeAttributes = \
                             [ x for x in set(self.routeNodeAttributes) ]
-                        # logically after this line we switch to content
-                        thisRoute = {}
                     # node information format
                     elif fields[0] == 'node':
                         nodeFields = fields[1:]
@@ -138,50 +210,61 @@ class PSFSolutionData(vrpdata.VrpSolutionData):
                         self.nodeAttributes = \
                             [ x for x in set(self.nodeAttributes) ]
                         # logically after this line we switch to content
-                        thisRoute = {}
                         stage = 'content'
                 # content information
                 elif stage == 'content':
                     tokens = line.split(separator)
                     if tokens[0] == 'route':
-                        # first we must add the previously read route to the
-                        # list of routes
-                        if thisRoute != {}:
-                            self.routes.append(thisRoute)
-                            thisRoute = {}
                         # consistency check
                         if len(tokens[1:]) != len(routeFields):
                             raise vrpexceptions.VrpInputFileFormatException(\
                                 'PSF', fName)
-                        thisRoute = fillDict(routeFields, tokens[1:])
-                        thisRoute['index'] = len(self.routes)
+                        routeRows.append(tokens[1:])
                     elif tokens[0] == 'arc':
                         # consistency check
                         if len(tokens[1:]) != len(arcFields):
                             raise vrpexceptions.VrpInputFileFormatException(\
                                 'PSF', fName)
-                        thisArc = fillDict(arcFields, tokens[1:])
-                        # finally we add the arc to the route
-                        if not 'arcs' in thisRoute:
-                            thisRoute['arcs'] = []
-                        thisRoute['arcs'].append(thisArc)
+                        arcRows.append(tokens[1:])
+                        arcRoutes.append(len(routeRows) - 1)
                     elif tokens[0] == 'routenode':
                         # consistency check
                         if len(tokens[1:]) != len(routeNodeFields):
                             raise vrpexceptions.VrpInputFileFormatException(\
                                 'PSF', fName)
-                        thisNode = fillDict(routeNodeFields, tokens[1:])
-                        # finally we add the node information to the route
-                        if not 'nodes' in thisRoute:
-                            thisRoute['nodes'] = []
-                        thisRoute['nodes'].append(thisNode)
+                        routeNodeRows.append(tokens[1:])
+                        routeNodeRoutes.append(len(routeRows) - 1)
                     elif tokens[0] == 'node':
                         # consistency check
                         if len(tokens[1:]) != len(nodeFields):
                             raise vrpexceptions.VrpInputFileFormatException(\
                                 'PSF', fName)
-                        thisNode = fillDict(nodeFields, tokens[1:])
-                        # finally we add the node information
-                        self.nodes[thisNode['index']] = thisNode
-        # let's not forget the last route
-        self.routes.append(thisRoute)
+                        nodeRows.append(tokens[1:])
+        # arcs and route nodes must come after the route they belong to
+        if (arcRoutes and arcRoutes[0] < 0) or \
+                (routeNodeRoutes and routeNodeRoutes[0] < 0):
+            raise vrpexceptions.VrpInputFileFormatException('PSF', fName)
+        # now we convert all rows of each kind at once
+        if routeRows:
+            self.routes = parseRows(routeFields, routeRows)
+        for index, route in enumerate(self.routes):
+            route['index'] = index
+        if arcRows:
+            for route, thisArc in zip(arcRoutes,
+                                      parseRows(arcFields, arcRows)):
+                # finally we add the arc to the route
+                if not 'arcs' in self.routes[route]:
+                    self.routes[route]['arcs'] = []
+                self.routes[route]['arcs'].append(thisArc)
+        if routeNodeRows:
+            for route, thisNode in zip(routeNodeRoutes,
+                                       parseRows(routeNodeFields,
+                                                 routeNodeRows)):
+                # finally we add the node information to the route
+                if not 'nodes' in self.routes[route]:
+                    self.routes[route]['nodes'] = []
+                self.routes[route]['nodes'].append(thisNode)
+        if nodeRows:
+            for thisNode in parseRows(nodeFields, nodeRows):
+                # finally we add the node information
+                self.nodes[thisNode['index']] = thisNode
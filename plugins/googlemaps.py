@@ -60,6 +60,7 @@ googleExtraMapSize = 640 - 512
 # Display a map...
 class GoogleMapDisplayer( Style ):
     description = 'google map'
+    layer = 'background'
     parameterInfo = {}
     defaultValue = {}
     scalingMethod = Image.BICUBIC
@@ -3,13 +3,125 @@
 # fabien.tricoire@univie.ac.at
 # Last modified: July 29th 2011 by Fabien Tricoire
 #
+import os
+import re
 import string
+import json
 
 import vrpdata
 import stylesheet
+import util
 
 from style import *
 
+# number of bytes read at once when indexing a log file
+logScanChunkSize = 1024 * 1024
+# change this whenever the format of log index files changes
+logIndexVersion = 2
+# a solution block in a log file starts with a line like 'Found ...'
+foundPattern = re.compile(rb'^[ \t]*Found(?=\s|$)', re.M)
+
+# build the routes described by the lines of one solution block of a log file
+def parseLogRoutes(lines):
+    routes = []
+    vehicleForDay = {}
+    for line in lines:
+        line = line.split()
+        if len(line) >= 10 and line[9] == 'Route':
+            thisRoute = {}
+            thisRoute['index'] = len(routes)
+            day = int(line[12])
+            thisRoute['day'] = day
+            if day in vehicleForDay:
+                thisRoute['vehicle'] = vehicleForDay[day]
+                vehicleForDay[day] += 1
+            else:
+                thisRoute['vehicle'] = 1
+                vehicleForDay[day] = 2
+            thisRoute['node sequence'] = \
+                [0] + [ int(x) for x in line[15:] ] + [0]
+            routes.append(thisRoute)
+    return routes
+
+# byte offsets of the solution blocks in a PVRP log file
+# the index is computed in one pass over the file and saved next to it, as
+# JSON in a file with the same name plus '.index'; it is only used if it was
+# computed for a log of the same size and modification time, and recomputed
+# otherwise
+class PVRPLogIndex:
+    def __init__(self, fName):
+        self.fName = fName
+        self.indexFileName = fName + '.index'
+        stat = os.stat(fName)
+        self.size = stat.st_size
+        self.key = [ logIndexVersion, stat.st_size, stat.st_mtime_ns ]
+        self.offsets = self.loadIndex()
+        if self.offsets is None:
+            self.offsets = self.scan()
+            self.saveIndex()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # read the index file if it matches the current log file and its offsets
+    # make sense for it
+    def loadIndex(self):
+        if not os.path.exists(self.indexFileName):
+            return None
+        try:
+            with open(self.indexFileName) as f:
+                data = json.load(f)
+            offsets = data['offsets']
+            if data['key'] != self.key or not offsets or \
+                    not all( type(x) is int and 0 <= x < max(self.size, 1)
+                             for x in offsets ) or \
+                    offsets != sorted(offsets):
+                return None
+            return offsets
+        except Exception as e:
+            print('[Warning] unable to read log index', self.indexFileName,
+                  ':', e)
+            return None
+
+    def saveIndex(self):
+        try:
+            with open(self.indexFileName, 'w') as f:
+                json.dump({ 'key': self.key, 'offsets': self.offsets }, f)
+        except Exception as e:
+            print('[Warning] unable to save log index', self.indexFileName,
+                  ':', e)
+
+    # find where each solution block starts, reading the file by chunks
+    # a log without any 'Found' line is considered as a single block
+    def scan(self):
+        offsets = []
+        # offset in the file of the first byte in the buffer
+        position = 0
+        rest = b''
+        with open(self.fName, 'rb') as f:
+            while True:
+                chunk = f.read(logScanChunkSize)
+                buffer = rest + chunk
+                # only complete lines are searched, except at the end
+                end = len(buffer) if not chunk else buffer.rfind(b'\n') + 1
+                for match in foundPattern.finditer(buffer, 0, end):
+                    offsets.append(position + match.start())
+                if not chunk:
+                    break
+                rest = buffer[end:]
+                position += end
+        return offsets if offsets else [ 0 ]
+
+    # return the lines of the k-th solution block
+    def readBlock(self, k):
+        start = self.offsets[k]
+        k = k if k >= 0 else k + len(self.offsets)
+        end = self.offsets[k+1] if k + 1 < len(self.offsets) else self.size
+        with open(self.fName, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return data.decode('utf-8', 'replace').splitlines()
+
 class PVRPInputData(vrpdata.VrpInputData):
     problemType = 'PVRP'
     instanceType = 'Cordeau'
@@ -85,7 +197,7 @@ class PVRPSolutionData(vrpdata.VrpSolutionData):
     def loadPVRP(self, fName):
         # process each line
         cpt = 0
-        for line in open(fName).readlines():
+        for line in open(fName):
             line = line.split()
             # case where we read a whole log file
             if line[0] == 'Initialized':
@@ -104,10 +216,27 @@ class PVRPSolutionData(vrpdata.VrpSolutionData):
                 self.routes.append(thisRoute)
                 cpt += 1
 
+    # index of the solution to load from a log file, by default the last one
+    solutionIndex = -1
+
+    # load a PVRP solution from a log file by Cacchiani et al.
+    # only the block of the required solution is read
+    def loadPVRPFromLog(self, fName):
+        index = PVRPLogIndex(fName)
+        self.routes = parseLogRoutes(index.readBlock(self.solutionIndex))
+
 # load a solution from a log file
 class PVRPLogSolutionData(PVRPSolutionData):
     problemtype = 'PVRP'
     solutionType = 'log'
+    # print the solution so that the right solution of the log is reloaded
+    def __repr__(self):
+        if self.solutionIndex == -1:
+            return PVRPSolutionData.__repr__(self)
+        return self.__module__ + '.PVRPLogSolutions(\'' + \
+            util.escapeFileName(self.fName) + '\', myData)[' + \
+            str(self.solutionIndex) + ']'
+
     # load a PVRP solution from a log file by Cacchiani, Hemmelmayr and Tricoire
     def loadData(self, fName, vrpData):
         # add vehicle load information
@@ -115,38 +244,36 @@ class PVRPLogSolutionData(PVRPSolutionData):
         # all routes in the solution (lists of indices)
         self.routes = []
         self.loadPVRPFromLog(fName)
-        
-    # load a PVRP solution from a log file by Cacchiani et al.
-    def loadPVRPFromLog(self, fName):
-        # process each line
-        cpt = 0
-        for line in open(fName).readlines():
-            line = line.split()
-            # case where we read a new solution
-            if len(line) == 0:
-                continue
-            elif line[0] == 'Found':
-                self.routes = []
-                vehicleForDay = {}
-                cpt = 0
-            elif len(line) >= 10 and line[9] == 'Route':
-                thisRoute = {}
-                thisRoute['index'] = len(self.routes)
-                day = int(line[12])
-                thisRoute['day'] = day
-                if day in vehicleForDay:
-                    thisRoute['vehicle'] = vehicleForDay[day]
-                    vehicleForDay[day] += 1
-                else:
-                    thisRoute['vehicle'] = 1
-                    vehicleForDay[day] = 2
-                thisRoute['node sequence'] = \
-                    [0] + [ int(x) for x in line[15:] ] + [0]
-                self.routes.append(thisRoute)
-                cpt += 1
-            else: continue
+        if self.solutionIndex != -1:
+            self.name += ' #' + str(self.solutionIndex)
+
+# all solutions found in a PVRP log file, as a sequence: solutions are only
+# read and parsed when accessed, e.g. solutions[k] for the k-th solution
+class PVRPLogSolutions:
+    def __init__(self, fName, vrpData):
+        self.fName = fName
+        self.vrpData = vrpData
+        self.index = PVRPLogIndex(fName)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError('solution index out of range')
+        # the constructor of solution classes must not be overloaded, so the
+        # solution index is set before calling it
+        solution = PVRPLogSolutionData.__new__(PVRPLogSolutionData)
+        solution.solutionIndex = k
+        solution.__init__(self.fName, self.vrpData)
+        return solution
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
 
-    
 # different style for displaying PVRP
 class PVRPStyleSheet(stylesheet.StyleSheet):
     defaultFor = [ 'PVRP' ]
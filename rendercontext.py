@@ -0,0 +1,180 @@
+#
+# Data shared by all styles painting the same cell
+#
+# -*- coding: utf-8 -*-
+# Many styles derive the same data from the instance and the solution every
+# time they are painted: which nodes satisfy the predicate, which are used,
+# the values of an attribute for all nodes, the routes grouped by attribute
+# value... StyleSheet.paint() builds one RenderContext per cell and passes it
+# to the styles accepting it, i.e. those whose paint() method has an extra
+# context argument. Everything is computed on first request only, and
+# everything that doesn't depend on the cell is shared by the contexts of all
+# cells of the same paint. The masks of mask predicates (see
+# util.MaskPredicate) are used as they are, instead of evaluating the
+# predicates item by item.
+
+import numpy
+
+import culling
+import util
+
+class RenderContext(object):
+    def __init__(self, inputData, solutionData, convertX, convertY,
+                 nodePredicate, routePredicate, arcPredicate, boundingBox,
+                 shared=None):
+        self.inputData = inputData
+        self.solutionData = solutionData
+        self.convertX = convertX
+        self.convertY = convertY
+        self.nodePredicate = nodePredicate
+        self.routePredicate = routePredicate
+        self.arcPredicate = arcPredicate
+        self.boundingBox = boundingBox
+        # data specific to this cell
+        self.cache = {}
+        # data that is the same for all cells
+        self.shared = {} if shared is None else shared
+
+    # return cache[key], computing it with function(*args) if required
+    def lookup(self, cache, key, function, *args):
+        if not key in cache:
+            cache[key] = function(*args)
+        return cache[key]
+
+    # screen coordinates of all nodes, as two arrays
+    def screenCoordinates(self):
+        return self.inputData.screenCoordinates(self.convertX, self.convertY)
+
+    # values of a node attribute for all nodes, as a list
+    # as with style.globalNodeAttributeValue(), an attribute starting with '+'
+    # is read from the solution nodes
+    def nodeAttributeColumn(self, attribute):
+        return self.lookup(self.shared, ('node column', attribute),
+                           self.computeNodeAttributeColumn, attribute)
+
+    def computeNodeAttributeColumn(self, attribute):
+        if attribute[0] == '+':
+            return [ node[attribute[1:]] for node in self.solutionData.nodes ]
+        else:
+            return [ node[attribute] for node in self.inputData.nodes ]
+
+    # same as above, as an array
+    def nodeAttributeArray(self, attribute):
+        return self.lookup(self.shared, ('node array', attribute),
+                           lambda: numpy.array(\
+                self.nodeAttributeColumn(attribute)))
+
+    # boolean array: True for nodes satisfying the node predicate
+    def nodeMask(self):
+        return self.lookup(self.cache, 'node mask', self.computeNodeMask)
+
+    def computeNodeMask(self):
+        return util.predicateMask(self.nodePredicate, self.inputData.nodes)
+
+    # boolean array: True for nodes used in the solution
+    def usedMask(self):
+        return self.solutionData.usedNodeMask()
+
+    # indices of the nodes to display in the visible area, in increasing
+    # order, optionally excluding unused nodes
+    # margin is the culling margin (see culling.py)
+    def shownNodeIndices(self, hideUnused=False, margin=culling.cullingMargin):
+        return self.lookup(self.cache, ('shown nodes', hideUnused, margin),
+                           self.computeShownNodeIndices, hideUnused, margin)
+
+    def computeShownNodeIndices(self, hideUnused, margin):
+        indices = numpy.asarray(culling.visibleNodeIndices(self.inputData,
+                                                           self.boundingBox,
+                                                           self.convertX,
+                                                           self.convertY,
+                                                           margin),
+                                dtype=numpy.intp)
+        mask = self.nodeMask()
+        if hideUnused:
+            mask = mask & self.usedMask()
+        return indices[mask[indices]]
+
+    # routes satisfying the route predicate
+    def shownRoutes(self):
+        return self.lookup(self.cache, 'shown routes',
+                           lambda: [ self.solutionData.routes[i] for i in
+                                     numpy.flatnonzero(self.routeMask()) ])
+
+    # boolean array: True for routes satisfying the route predicate
+    def routeMask(self):
+        return self.lookup(self.cache, 'route mask',
+                           lambda: util.predicateMask(self.routePredicate,
+                                                      self.solutionData.routes))
+
+    # set of values taken by a route attribute
+    def routeAttributeValues(self, attribute):
+        return self.lookup(self.shared, ('route values', attribute),
+                           self.computeRouteAttributeValues, attribute)
+
+    def computeRouteAttributeValues(self, attribute):
+        index = self.solutionData.routeIndex(attribute)
+        if index is None:
+            return set( [ route[attribute]
+                          for route in self.solutionData.routes ] )
+        return set(index.keys())
+
+    # routes grouped by value of an attribute, as a dictionary
+    def routesByAttribute(self, attribute):
+        return self.lookup(self.shared, ('route groups', attribute),
+                           self.computeRoutesByAttribute, attribute)
+
+    def computeRoutesByAttribute(self, attribute):
+        routes = self.solutionData.routes
+        index = self.solutionData.routeIndex(attribute)
+        if index is None:
+            groups = {}
+            for route in routes:
+                groups.setdefault(route[attribute], []).append(route)
+            return groups
+        return dict( [ (value, [ routes[i] for i in indices ])
+                       for value, (indices, nodes) in index.items() ] )
+
+    # arcs to display in the visible area, as one list per route: routes not
+    # satisfying the route predicate have no arc, arcs not satisfying the arc
+    # predicate are left out
+    def shownArcs(self, margin=culling.cullingMargin):
+        return self.lookup(self.cache, ('shown arcs', margin),
+                           self.computeShownArcs, margin)
+
+    def computeShownArcs(self, margin):
+        visible = culling.visibleArcPositions(self.inputData,
+                                              self.solutionData,
+                                              self.boundingBox,
+                                              self.convertX, self.convertY,
+                                              margin)
+        if self.arcPredicate is None:
+            arcMasks = [ None ] * len(visible)
+        else:
+            arcMasks = self.solutionData.arcMasks(self.arcPredicate)
+        routes = self.solutionData.routes
+        result = [ [] for positions in visible ]
+        for i in numpy.flatnonzero(self.routeMask()):
+            arcs = routes[i]['arcs']
+            if arcMasks[i] is None:
+                result[i] = [ arcs[j] for j in visible[i] ]
+            else:
+                result[i] = [ arcs[j] for j in visible[i] if arcMasks[i][j] ]
+        return result
+
+    # parts of the node sequence of each route in the visible area (see
+    # culling.visiblePolylines()), optionally without depots
+    def visiblePolylines(self, skipDepots=False,
+                         margin=culling.cullingMargin):
+        return self.lookup(self.cache, ('polylines', skipDepots, margin),
+                           self.computeVisiblePolylines, skipDepots, margin)
+
+    def computeVisiblePolylines(self, skipDepots, margin):
+        if skipDepots:
+            isDepot = self.nodeAttributeColumn('is depot')
+            nodeFilter = lambda node: not isDepot[node]
+        else:
+            nodeFilter = None
+        return culling.visiblePolylines(self.inputData, self.solutionData,
+                                        self.boundingBox,
+                                        self.convertX, self.convertY,
+                                        nodeFilter, margin)
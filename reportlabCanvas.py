@@ -11,11 +11,13 @@ from reportlab.graphics.shapes import *
 from reportlab.graphics.charts.textlabels import Label
 from reportlab.graphics import renderPDF
 from reportlab.pdfgen import canvas as rlcanvas
+from reportlab.pdfgen.canvas import FILL_NON_ZERO
+from reportlab.pdfbase import pdfdoc
 
 from canvas import *
 import colours
 import style
-from functools import reduce
+import graphicsstate
 
 # convert an AbstractColour to a reportlab Color
 def convertColour(abstractColour):
@@ -26,6 +28,13 @@ def convertColour(abstractColour):
                         abstractColour.blue / 255.0,
                         alpha = abstractColour.alpha / 255.0)
 
+# same as above, but each distinct colour is only converted once
+def internedColour(abstractColour):
+    if abstractColour is None:
+        abstractColour = colours.transparent
+    return graphicsstate.intern('reportlab colour', abstractColour.getRGBA(),
+                                lambda *rgba: convertColour(style.Colour(*rgba)))
+
 # adapt the abstract style thickness to reportlab
 def getThickness(style):
     if style.lineThickness is None:
@@ -33,6 +42,51 @@ def getThickness(style):
     else:
         return style.lineThickness
 
+# repeated symbols and static layers are stored once as PDF form XObjects
+useFormXObjects = True
+# a centred polygon drawn at least this many times at once becomes a symbol
+minSymbolPlacements = 2
+
+# key identifying a drawing style by value
+def drawingStyleKey(style):
+    return (None if style.lineColour is None else style.lineColour.getRGBA(),
+            None if style.fillColour is None else style.fillColour.getRGBA(),
+            style.lineThickness, style.lineStyle)
+
+# split shapes, given by their bounding boxes, into runs of consecutive shapes
+# that don't overlap; a run filled then stroked as one path looks the same as
+# its shapes filled and stroked one by one
+# return a list of (first, last + 1) index pairs
+def nonOverlappingRuns(xmins, ymins, xmaxs, ymaxs):
+    n = len(xmins)
+    if n == 0:
+        return []
+    # shapes are registered in the cells of a grid at least as large as the
+    # largest shape, so that each shape is in at most 4 cells
+    size = max(max([ b - a for a, b in zip(xmins, xmaxs) ]),
+               max([ b - a for a, b in zip(ymins, ymaxs) ])) or 1.0
+    runs = []
+    start = 0
+    cells = {}
+    for i in range(n):
+        keys = [ (cx, cy)
+                 for cx in range(int(floor(xmins[i] / size)),
+                                 int(floor(xmaxs[i] / size)) + 1)
+                 for cy in range(int(floor(ymins[i] / size)),
+                                 int(floor(ymaxs[i] / size)) + 1) ]
+        for key in keys:
+            if any( xmins[j] <= xmaxs[i] and xmaxs[j] >= xmins[i] and
+                    ymins[j] <= ymaxs[i] and ymaxs[j] >= ymins[i]
+                    for j in cells.get(key, []) ):
+                runs.append( (start, i) )
+                start = i
+                cells = {}
+                break
+        for key in keys:
+            cells.setdefault(key, []).append(i)
+    runs.append( (start, n) )
+    return runs
+
 # compute the line going through point x1, y1 that is parallel to the line
 # going through points x2,y2 and x3,y3
 def parallelThroughPoint(x1, y1, x2, y2, x3, y3):
@@ -47,63 +101,143 @@ class ReportlabCanvas(Canvas):
         self.width = width
         self.height = height
         # derive dash array from stoke style
-        self.lineStyleArray = { 'solid':[self.width,0], 'dashed':[7,10] }
+        self.lineStyleArray = { 'solid':[], 'dashed':[7,10] }
+        # line caps: round for solid lines, butt for dashed lines so that
+        # dashes keep their length
+        self.lineCap = { 'solid':1, 'dashed':0 }
         self.fName = fName
+        # operators are only emitted for state changes
+        self.state = graphicsstate.GraphicsState()
+        # reportlab canvas, created by blank()
+        self.canvas = None
+        # key = group key, value = (form name, origin)
+        self.groups = {}
+        # names of the groups being defined
+        self.groupStack = []
     
     # return the width and height of this canvas
     def getSize(self):
         return self.width, self.height
 
     # clear the canvas and set a white background
+    # painting again on the same canvas adds a page to the same document, so
+    # that groups are shared by all pages
     def blank(self):
-        self.canvas = rlcanvas.Canvas(self.fName)
-        self.canvas.setPageSize((self.width, self.height))
-        creatorString = 'proute - https://github.com/fa-bien/proute'
-        self.canvas.setCreator(creatorString)
+        if self.canvas is None:
+            self.canvas = rlcanvas.Canvas(self.fName)
+            self.canvas.setPageSize((self.width, self.height))
+            creatorString = 'proute - https://github.com/fa-bien/proute'
+            self.canvas.setCreator(creatorString)
+        else:
+            self.canvas.showPage()
+        self.state.reset()
+
+    # finish the current page and write the document
+    def save(self):
+        self.canvas.showPage()
+        self.canvas.save()
 
     def restrictDrawing(self, xmin, ymin, xmax, ymax):
         self.canvas.saveState()
+        self.state.save()
         sub = self.canvas.beginPath()
         sub.rect(xmin, ymin, xmax-xmin, ymax-ymin)
         self.canvas.clipPath(sub, stroke=0)
 
     def unrestrictDrawing(self):
         self.canvas.restoreState()
+        self.state.restore()
+
+    # set stroke and fill colours and line width, if different from the
+    # current ones
+    def setStrokeColour(self, colour):
+        if colour is None:
+            colour = colours.transparent
+        if self.state.change('stroke colour', colour.getRGBA()):
+            self.canvas.setStrokeColor(internedColour(colour))
+
+    def setFillColour(self, colour):
+        if colour is None:
+            colour = colours.transparent
+        if self.state.change('fill colour', colour.getRGBA()):
+            self.canvas.setFillColor(internedColour(colour))
+
+    def setLineWidth(self, width):
+        if self.state.change('line width', width):
+            self.canvas.setLineWidth(width)
         
     # set a drawing style
     # for internal use only
     def setDrawingStyle(self, style):
         if style.lineStyle is None or style.lineStyle == 'solid':
-            self.canvas.setDash(self.lineStyleArray['solid'])
+            lineStyle = 'solid'
         elif style.lineStyle == 'dashed':
-            self.canvas.setDash(self.lineStyleArray['dashed'])
+            lineStyle = 'dashed'
+        else:
+            lineStyle = None
+        if not lineStyle is None:
+            if self.state.change('dash', lineStyle):
+                self.canvas.setDash(self.lineStyleArray[lineStyle])
+            if self.state.change('line cap', self.lineCap[lineStyle]):
+                self.canvas.setLineCap(self.lineCap[lineStyle])
+        # round joints everywhere
+        if self.state.change('line join', 1):
+            self.canvas.setLineJoin(1)
         if not style.lineColour is None:
-            self.canvas.setStrokeColor(convertColour(style.lineColour))
+            self.setStrokeColour(style.lineColour)
         if not style.fillColour is None:
-            self.canvas.setFillColor(convertColour(style.fillColour))
+            self.setFillColour(style.fillColour)
         else:
-            self.canvas.setFillColor(convertColour(colours.transparent))
-        self.canvas.setLineWidth(getThickness(style))
+            self.setFillColour(colours.transparent)
+        self.setLineWidth(getThickness(style))
            
     # set a writing style
     # also for internal use only
     def setWritingStyle(self, font, foregroundColour, backgroundColour):
-        self.canvas.setFontSize(font.size)
-        self.canvas.setStrokeColor(convertColour(foregroundColour))
-        self.canvas.setFillColor(convertColour(foregroundColour))
+        if self.state.change('font size', font.size):
+            self.canvas.setFontSize(font.size)
+        self.setStrokeColour(foregroundColour)
+        self.setFillColour(foregroundColour)
            
-    # draw a rectangle centred at coordinates x, y
-    def drawRectangle(self, x, y, w, h, style, referencePoint='centre'):
+    # coordinates of the south-west corner of a rectangle of size w, h with
+    # the given reference point at x, y
+    def southWestCorner(self, x, y, w, h, referencePoint):
         if referencePoint == 'centre' or referencePoint == 'center':
-            x, y = x - w/2.0, y - h/2.0
+            return x - w/2.0, y - h/2.0
         elif referencePoint == 'northwest':
-            x, y = x, y-h
+            return x, y-h
         elif referencePoint == 'northeast':
-            x, y = x-w, y-h
+            return x-w, y-h
         elif referencePoint == 'southeast':
-            x, y = x-w, y
-        elif referencePoint == 'southwest':
-            x, y = x, y
+            return x-w, y
+        else:
+            return x, y
+
+    # ranges of shapes that can be drawn as one path: shapes that are both
+    # filled and stroked are only batched while they don't overlap, so that
+    # outlines stay under the fill of the shapes drawn after them
+    def shapeBatches(self, style, fill, stroke, xmins, ymins, xmaxs, ymaxs):
+        if len(xmins) == 0:
+            return []
+        elif not (fill and stroke):
+            return [ (0, len(xmins)) ]
+        margin = getThickness(style) / 2.0
+        return nonOverlappingRuns([ x - margin for x in xmins ],
+                                  [ y - margin for y in ymins ],
+                                  [ x + margin for x in xmaxs ],
+                                  [ y + margin for y in ymaxs ])
+
+    # draw a path built with self.canvas.beginPath() using the given style
+    # batches of shapes are drawn as one path, with the non-zero winding rule
+    # so that overlapping shapes are filled
+    def drawStyledPath(self, path, style, fill, stroke=1):
+        self.setDrawingStyle(style)
+        self.canvas.drawPath(path, stroke=stroke, fill=fill,
+                             fillMode=FILL_NON_ZERO)
+
+    # draw a rectangle centred at coordinates x, y
+    def drawRectangle(self, x, y, w, h, style, referencePoint='centre'):
+        x, y = self.southWestCorner(x, y, w, h, referencePoint)
         self.setDrawingStyle(style)
         fill = not style.fillColour is None
         self.canvas.rect(x, y, w, h, fill=fill,
@@ -113,8 +247,23 @@ class ReportlabCanvas(Canvas):
     # draw a list of rectangles with the same style
     # xs, ys, ws, hs are lists
     def drawRectangles(self, xs, ys, ws, hs, style, referencePoint='centre'):
-        for x, y, w, h in zip(xs, ys, ws, hs):
-            self.drawRectangle(x, y, w, h, style, referencePoint)
+        fill = not style.fillColour is None
+        corners = [ self.southWestCorner(x, y, w, h, referencePoint)
+                    for x, y, w, h in zip(xs, ys, ws, hs) ]
+        ws, hs = list(ws), list(hs)
+        x1s = [ x for x, y in corners ]
+        y1s = [ y for x, y in corners ]
+        x2s = [ x + w for x, w in zip(x1s, ws) ]
+        y2s = [ y + h for y, h in zip(y1s, hs) ]
+        for first, last in self.shapeBatches(style, fill, 1,
+                                             list(map(min, x1s, x2s)),
+                                             list(map(min, y1s, y2s)),
+                                             list(map(max, x1s, x2s)),
+                                             list(map(max, y1s, y2s))):
+            path = self.canvas.beginPath()
+            for i in range(first, last):
+                path.rect(x1s[i], y1s[i], ws[i], hs[i])
+            self.drawStyledPath(path, style, fill)
                 
     # draw a circle centreed at coordinates x, y
     def drawCircle(self, x, y, r, style):
@@ -127,111 +276,163 @@ class ReportlabCanvas(Canvas):
     # draw a list of circles with the same colour style
     # parameters xs, ys, rs should be lists
     def drawCircles(self, xs, ys, rs, style):
-        for x, y, r in zip(xs, ys, rs):
-            self.drawCircle(x, y, r, style)
+        fill = not style.fillColour is None
+        xs, ys, rs = list(xs), list(ys), list(rs)
+        for first, last in self.shapeBatches(\
+            style, fill, 1,
+            [ x - abs(r) for x, r in zip(xs, rs) ],
+            [ y - abs(r) for y, r in zip(ys, rs) ],
+            [ x + abs(r) for x, r in zip(xs, rs) ],
+            [ y + abs(r) for y, r in zip(ys, rs) ]):
+            path = self.canvas.beginPath()
+            for i in range(first, last):
+                path.circle(xs[i], ys[i], rs[i])
+            self.drawStyledPath(path, style, fill)
 
     # draw a line
+    # line ends are rounded by the line cap
     def drawLine(self, x1, y1, x2, y2, style):
-        self.setDrawingStyle(style)
-        self.canvas.line(x1, y1, x2, y2)
-        # smooth line joints
-        thickness = getThickness(style)
-        style.lineThickness = 0.0
-        oldFillcolour = style.fillColour
-        style.fillColour = style.lineColour
-        self.drawCircle(x1, y1, (thickness) /2.0, style)
-        self.drawCircle(x2, y2, (thickness) /2.0, style)
-        style.lineThickness = thickness
-        style.fillColour = oldFillcolour
+        path = self.canvas.beginPath()
+        path.moveTo(x1, y1)
+        path.lineTo(x2, y2)
+        self.drawStyledPath(path, style, 0)
 
     # draw lines with the same style
     def drawLines(self, x1s, y1s, x2s, y2s, style):
+        path = self.canvas.beginPath()
         for x1, y1, x2, y2 in zip(x1s, y1s, x2s, y2s):
-            self.setDrawingStyle(style)
-            self.canvas.line(x1, y1, x2, y2)
-            # smooth line joints
-            thickness = getThickness(style)
-            style.lineThickness = 0.0
-            oldFillcolour = style.fillColour
-            style.fillColour = style.lineColour
-            self.drawCircle(x1, y1, (thickness) /2.0, style)
-            self.drawCircle(x2, y2, (thickness) /2.0, style)
-            style.lineThickness = thickness
-            style.fillColour = oldFillcolour
+            path.moveTo(x1, y1)
+            path.lineTo(x2, y2)
+        if len(x1s) > 0:
+            self.drawStyledPath(path, style, 0)
 
     # draw a polyline
     # x and y are lists
     def drawPolyline(self, x, y, style):
-        self.setDrawingStyle(style)
-        list = reduce(lambda x,y: x+y, [ [x[i], y[i]] for i in range(len(x)) ] )
-        fillCol = convertColour(style.fillColour)
-        strokeCol = convertColour(style.lineColour)
-        thickness = getThickness(style)
-        p = PolyLine(list,
-                     strokeColor=strokeCol,
-                     fillColor=fillCol,
-                     strokeWidth=thickness,
-                     strokeLineJoin=1)
-        d = Drawing(self.width, self.height)
-        d.add(p)
-        renderPDF.draw(d, self.canvas, 0, 0)
+        # no line colour means an invisible line
+        if style.lineColour is None or len(x) < 2:
+            return
+        path = self.canvas.beginPath()
+        path.moveTo(x[0], y[0])
+        for i in range(1, len(x)):
+            path.lineTo(x[i], y[i])
+        self.drawStyledPath(path, style, 0)
         
     # draw a spline; each element in points is a 2-uple with x,y coordinates
     def drawSpline(self, points, style):
         # required to close the path on each side
         points = [ points[0] ] + points + [ points[-1] ]
-        self.setDrawingStyle(style)
+        path = self.canvas.beginPath()
+        path.moveTo((points[1][0] + points[0][0]) / 2.0,
+                    (points[1][1] + points[0][1]) / 2.0)
+        # each bezier curve starts where the previous one ends
         for i in range(1, len(points)-1):
-            self.canvas.bezier((points[i][0] + points[i-1][0]) / 2.0,
-                               (points[i][1] + points[i-1][1]) / 2.0,
-                               points[i][0],
-                               points[i][1],
-                               (points[i][0] + points[i+1][0]) / 2.0,
-                               (points[i][1] + points[i+1][1]) / 2.0,
-                               (points[i][0] + points[i+1][0]) / 2.0,
-                               (points[i][1] + points[i+1][1]) / 2.0)
+            path.curveTo(points[i][0],
+                         points[i][1],
+                         (points[i][0] + points[i+1][0]) / 2.0,
+                         (points[i][1] + points[i+1][1]) / 2.0,
+                         (points[i][0] + points[i+1][0]) / 2.0,
+                         (points[i][1] + points[i+1][1]) / 2.0)
+        self.drawStyledPath(path, style, 0)
+
+    # add a closed polygon to a path
+    def addPolygon(self, path, x, y):
+        path.moveTo(x[0], y[0])
+        for i in range(1, len(x)):
+            path.lineTo(x[i], y[i])
+        path.close()
             
     # draw a polygon
     # x and y are lists of point coordinates
     def drawPolygon(self, x, y, style):
-        self.setDrawingStyle(style)
-        list = reduce(lambda x,y: x+y, [ [x[i], y[i]] for i in range(len(x)) ] )
-        fillCol = convertColour(style.fillColour)
-        thickness = getThickness(style)
-        strokeCol = convertColour(style.lineColour) \
-            #if thickness > 0 else fillCol
-        p = Polygon(list,
-                    strokeColor=strokeCol,
-                    fillColor=fillCol,
-                    strokeWidth=thickness,
-                    strokeLineJoin=1,
-#                     strokeDashArray=[0,100] if thickness <= 0 else [],
-                    )
-        d = Drawing(self.width, self.height)
-        d.add(p)
-        renderPDF.draw(d, self.canvas, 0, 0)
-
-    # draw several polygons with the same style
+        if len(x) < 2:
+            return
+        path = self.canvas.beginPath()
+        self.addPolygon(path, x, y)
+        self.drawStyledPath(path, style,
+                            not style.fillColour is None,
+                            not style.lineColour is None)
+
+    # draw several polygons with the same style, as a single path
     # xs and ys are lists of lists of point coordinates
     def drawPolygons(self, xs, ys, style):
-        self.setDrawingStyle(style)
-        d = Drawing(self.width, self.height)
+        fill = not style.fillColour is None
+        stroke = not style.lineColour is None
+        polygons = [ (x, y) for x, y in zip(xs, ys) if len(x) >= 2 ]
+        for first, last in self.shapeBatches(\
+            style, fill, stroke,
+            [ min(x) for x, y in polygons ], [ min(y) for x, y in polygons ],
+            [ max(x) for x, y in polygons ], [ max(y) for x, y in polygons ]):
+            path = self.canvas.beginPath()
+            for x, y in polygons[first:last]:
+                self.addPolygon(path, x, y)
+            self.drawStyledPath(path, style, fill, stroke)
+
+    # draw several times a centred polygon with the same style
+    # the polygon is stored once as a symbol and placed at each position
+    def drawCentredPolygons(self, polygon, xs, ys, radius, style, angle=0):
+        if not useFormXObjects or len(xs) < minSymbolPlacements:
+            Canvas.drawCentredPolygons(self, polygon, xs, ys, radius, style,
+                                       angle)
+            return
+        points = polygon.getTransformedPoints(radius, angle)
+        key = ('symbol', tuple(points), drawingStyleKey(style))
+        if not self.hasGroup(key):
+            # leave room for the contour
+            extent = max( [ max(abs(a), abs(b)) for a, b in points ] ) + \
+                getThickness(style)
+            self.beginGroup(key, -extent, -extent, extent, extent)
+            self.drawPolygon([ a for a, b in points ],
+                             [ b for a, b in points ],
+                             style)
+            self.endGroup()
         for x, y in zip(xs, ys):
-            list = reduce(lambda x,y: x+y,
-                          [ [x[i], y[i]] for i in range(len(x)) ] )
-            fillCol = convertColour(style.fillColour)
-            thickness = getThickness(style)
-            strokeCol = convertColour(style.lineColour) \
-                #if thickness > 0 else fillCol
-            p = Polygon(list,
-                        strokeColor=strokeCol,
-                        fillColor=fillCol,
-                        strokeWidth=thickness,
-                        strokeLineJoin=1,
-#                         strokeDashArray=[0,100] if thickness <= 0 else [],
-                        )
-            d.add(p)
-            renderPDF.draw(d, self.canvas, 0, 0)
+            self.placeGroup(key, x, y)
+
+    # groups are stored as form XObjects
+    def supportsGroups(self):
+        return useFormXObjects
+
+    def hasGroup(self, key):
+        return key in self.groups
+
+    def beginGroup(self, key, xmin, ymin, xmax, ymax, origin=(0, 0)):
+        name = 'g' + str(len(self.groups))
+        self.groups[key] = (name, origin)
+        self.groupStack.append(name)
+        self.canvas.beginForm(name, xmin, ymin, xmax, ymax)
+        # a form is drawn in whatever state it is placed in
+        self.state.save()
+        self.state.forget()
+
+    def endGroup(self):
+        self.canvas.endForm()
+        self.state.restore()
+        # reportlab leaves the transparency states used in a form out of its
+        # resources, so they are added here
+        document = self.canvas._doc
+        form = document.idToObject[\
+            document.getXObjectName(self.groupStack.pop())]
+        if form.ExtGState:
+            resources = pdfdoc.PDFResourceDictionary()
+            resources.basicFonts()
+            resources.allProcs()
+            if form.XObjects:
+                resources.XObject = form.XObjects
+            resources.ExtGState = form.ExtGState
+            form.Resources = resources
+
+    def placeGroup(self, key, x, y):
+        name, (originX, originY) = self.groups[key]
+        self.canvas.saveState()
+        # the content of a form assumes opaque colours unless it says
+        # otherwise, so the transparency of the page must not leak into it
+        self.canvas.setFillAlpha(1)
+        self.canvas.setStrokeAlpha(1)
+        if x != originX or y != originY:
+            self.canvas.translate(x - originX, y - originY)
+        self.canvas.doForm(name)
+        self.canvas.restoreState()
 
     # draw a text label with top left corner at x, y
     def drawText(self, label, x, y,
@@ -13,15 +13,32 @@
 # painting, e.g. only paint a subset of the nodes
 # additionally, a bounding box may be passed as parameter boundingBox as a
 # 4-uple (xmin, ymin, xmax, ymax) of the coordinates of the box to paint
+# finally, styles whose paint() method has an extra context parameter receive a
+# rendercontext.RenderContext holding data shared by all styles
 
 import random
 import math
 import os
+import inspect
 
 import util
+import rendercontext
 
 from vrpexceptions import MissingAttributeException, NotImplementedError
 
+# key = style class, value = True if its paint() method accepts a context
+_acceptsContext = {}
+
+# True if the paint() method of a style class accepts a render context
+def acceptsRenderContext(styleClass):
+    if not styleClass in _acceptsContext:
+        try:
+            parameters = inspect.signature(styleClass.paint).parameters
+        except (TypeError, ValueError) as e:
+            parameters = {}
+        _acceptsContext[styleClass] = 'context' in parameters
+    return _acceptsContext[styleClass]
+
 # generic colour encapsulation class
 # arbitrary decision = components take integer values between 0 and 255
 class Colour():
@@ -211,6 +228,11 @@ class Style( object ):
     
     """
     description = 'no description'
+    # kind of layer this style is painted in: 'background', 'instance' or
+    # 'solution'; interactive views can keep each layer in its own bitmap
+    # styles of the instance layer using the solution must say so, see
+    # dependsOnSolution()
+    layer = 'solution'
     def __init__(self, parameters={}, description=None):
         self.parameterValue = {}
         self.parameterInfo = {}
@@ -252,17 +274,46 @@ class Style( object ):
     def setParameter(self, parameterName, parameterValue):
         self.parameterValue[parameterName] = parameterValue
 
+    # True if what this style paints depends on the solution, which is only
+    # the case of solution styles unless overloaded
+    def dependsOnSolution(self):
+        return self.layer == 'solution'
+
+    # token identifying what this style paints: it changes when a parameter
+    # changes or when the style is used with other data
+    # can be overloaded by styles whose output depends on something else
+    def changeToken(self, inputData, solutionData):
+        return (self.__class__, repr(self.parameterValue),
+                util.IdentityKey(inputData),
+                util.IdentityKey(solutionData) if self.dependsOnSolution() \
+                    else None)
+
     # this is the wrapper method called by the stylesheet class
+    # context is passed to styles accepting it, and built if required
     def paintData(self, inputData, solutionData,
                   canvas, convertX, convertY,
                   nodePredicate, routePredicate, arcPredicate,
-                  boundingBox):
+                  boundingBox, context=None):
         try:
             self.preProcessAttributes(inputData, solutionData)
-            self.paint(inputData, solutionData,
-                       canvas, convertX, convertY,
-                       nodePredicate, routePredicate, arcPredicate,
-                       boundingBox)
+            if acceptsRenderContext(self.__class__):
+                if context is None:
+                    context = rendercontext.RenderContext(inputData,
+                                                          solutionData,
+                                                          convertX, convertY,
+                                                          nodePredicate,
+                                                          routePredicate,
+                                                          arcPredicate,
+                                                          boundingBox)
+                self.paint(inputData, solutionData,
+                           canvas, convertX, convertY,
+                           nodePredicate, routePredicate, arcPredicate,
+                           boundingBox, context)
+            else:
+                self.paint(inputData, solutionData,
+                           canvas, convertX, convertY,
+                           nodePredicate, routePredicate, arcPredicate,
+                           boundingBox)
         except Exception as e:
             print('Cannot paint using style ' + self.__class__.__name__ + \
                 ': ' + str(e))
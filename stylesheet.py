@@ -7,7 +7,11 @@ import string
 import re
 from math import *
 
+import numpy
+
 import config
+import canvas as canvasModule
+import rendercontext
 import style
 import util
 import colours
@@ -21,6 +25,20 @@ gridDecorationStyle = style.DrawingStyle(lineColour=colours.lightgray,
                                          lineThickness=1,
                                          lineStyle='solid')
 gridDecorationFont = style.Font(cellTitleFontSize)
+# keep the drawing operations of each style when painting the whole of an
+# interactive canvas (see Canvas.isInteractive), and replay them instead of
+# running the style again as long as neither the style (see Style.changeToken)
+# nor the view changed
+memoizeStyleOutput = True
+# on canvases supporting groups (see Canvas.supportsGroups), paint the styles
+# whose output is the same in every grid cell up to a translation once as a
+# group, and place it in each cell
+groupStaticStyles = True
+
+# value with 9 significant digits, so that values computed differently for
+# each cell but mathematically equal are equal
+def approximately(value):
+    return float('%.9g' % value)
 
 # # load available plugins
 # pluginNames = util.getPluginNames()
@@ -58,6 +76,13 @@ class StyleSheet(object):
         self.drawGridLines = gridLines
         # preferred number of columns in the grid or None for default
         self.nColumnsInGrid = nColumns if nColumns else None
+        # last output of each style in each cell
+        # key = (id(style), cell index), value = (style, token, view key,
+        # recorded operations); styles are kept so that ids are not reused
+        self.styleOutputs = {}
+        # data the style outputs were painted for, the outputs are forgotten
+        # when it changes so that old data isn't kept alive
+        self.styleOutputsData = None
         # do we display a title for each cell?
         self.displayCellTitle = cellTitle
         # string format to display as title for each cell
@@ -72,6 +97,19 @@ class StyleSheet(object):
             self.keepAspectRatio = keepAspectRatio
             self.styles = styles
 
+    # style outputs are neither copied nor pickled: they are only valid for the
+    # styles of this stylesheet and refer to the data they were painted for
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['styleOutputs']
+        del state['styleOutputsData']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.styleOutputs = {}
+        self.styleOutputsData = None
+
     # default stylesheet: display nodes and arcs in a simple way
     def loadDefault(self, keepAspectRatio=True):
         import basestyles
@@ -183,25 +221,74 @@ class StyleSheet(object):
                                           cellHeight)
         return revX, revY
             
+    # compute the area of the data displayed in the given part of the canvas
+    # returns (xmin, ymin, xmax, ymax) in data coordinates
+    def getVisibleBox(self, convertX, convertY, xmin, xmax, ymin, ymax):
+        # transformations are linear so they can be inverted from two points
+        x0, xScale = convertX(0.0), convertX(1.0) - convertX(0.0)
+        y0, yScale = convertY(0.0), convertY(1.0) - convertY(0.0)
+        if xScale == 0 or yScale == 0:
+            return self.xmin, self.ymin, self.xmax, self.ymax
+        x1, x2 = (xmin - x0) / xScale, (xmax - x0) / xScale
+        y1, y2 = (ymin - y0) / yScale, (ymax - y0) / yScale
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+            
+    # split the styles into layers: consecutive styles of the same kind (see
+    # Style.layer) belong to the same layer
+    def getLayers(self):
+        layers = []
+        for style in self.styles:
+            if layers and layers[-1][-1].layer == style.layer:
+                layers[-1].append(style)
+            else:
+                layers.append( [ style ] )
+        return layers
+
     # paint using stylesheet
     def paint(self, inputData, solutionData, canvas,
               nodePredicate=None, #lambda(x): True,
               routePredicate=None, #lambda(x): True,
               arcPredicate=None, #lambda(x): True,
-              thumbnail=False):
+              thumbnail=False,
+              styles=None,
+              decorate=True,
+              area=None):
         """
         Paint inputData and solutionData on canvas.
         The predicates are used to filter out some nodes, routes and arcs if
         required. They are passed to each style's individual paint() call.
         The style is supposed to paint only the entities that satisfy the
-        predicate.
+        predicate. Which entities satisfy a predicate is only cached for
+        predicates with a key (see util.predicateKey()): other predicates are
+        evaluated every time, and nothing painted with them is kept.
+        If styles is specified, only these styles are painted instead of all
+        styles of the stylesheet. If decorate is False, the canvas is not
+        blanked and no border, grid lines or cell titles are drawn. If area is
+        specified, as (xmin, ymin, xmax, ymax) in canvas coordinates, styles
+        only paint this part of the canvas.
         
         """
-        canvas.blank()
+        if styles is None:
+            styles = self.styles
+        # partial paintings and thumbnails are not worth memoizing, neither
+        # are exports since they are only painted once (also, styles painting
+        # random things would always give the same result)
+        # nothing painted with predicates that may change is kept either
+        predicateKeys = (util.predicateKey(nodePredicate),
+                         util.predicateKey(routePredicate),
+                         util.predicateKey(arcPredicate))
+        keepOutput = not None in predicateKeys
+        memoize = memoizeStyleOutput and area is None and not thumbnail and \
+            canvas.isInteractive() and keepOutput
+        if memoize:
+            self.forgetStyleOutputs(inputData, solutionData)
+        if decorate:
+            canvas.blank()
         # case where we want to paint a thumbnail: smaller padding and a border
         if thumbnail:
             margin = 2
-            canvas.drawBorder()
+            if decorate:
+                canvas.drawBorder()
         else:
             margin = padding
 
@@ -219,9 +306,14 @@ class StyleSheet(object):
                 break
         # only use a grid if the solution isn't empty
         if self.grid and solutionData.routes:
+            # routes of each cell and the nodes they visit, if possible
+            gridIndex = solutionData.routeIndex(self.gridRouteAttribute)
             # count and sort the occurrences of the grid attribute
-            attributeValues = set([ route[self.gridRouteAttribute]
-                                    for route in solutionData.routes ])
+            if gridIndex is None:
+                attributeValues = set([ route[self.gridRouteAttribute]
+                                        for route in solutionData.routes ])
+            else:
+                attributeValues = set(gridIndex.keys())
             gridSize = len(attributeValues)
             # if we must use a grid but haven't specified dimensions for it yet
             if not self.nColumnsInGrid:
@@ -240,13 +332,23 @@ class StyleSheet(object):
             nColumns = 1
             nRows = 1
             attributeValues = set([None])
+            gridIndex = None
         cellWidth = float(width + gridCellPadding) / nColumns
         cellHeight = float(height + gridCellPadding) / nRows
         # for each cell in the grid, compute its bounding box
         # draw a grid if needed
         # (do it before displaying the cell's title)
-        if self.drawGridLines and self.grid:
+        if decorate and self.drawGridLines and self.grid:
             self.drawGrid(canvas, nColumns, nRows)
+        # derived data that doesn't depend on the cell, shared by the render
+        # contexts of all cells
+        sharedData = {}
+        # styles painted as groups, see paintGroupedStyle()
+        useGroups = groupStaticStyles and area is None and not thumbnail and \
+            canvas.supportsGroups() and keepOutput
+        # styles in the instance and background layers only depend on the
+        # cell through the node predicate
+        cellIndependent = not (self.grid and self.filterNodesInGrid)
         for i, cell in enumerate(attributeValues):
             # grid coordinates for the cell
             cellX = i % nColumns
@@ -262,59 +364,213 @@ class StyleSheet(object):
                     self.cellTitleFormat.replace('%a',
                                                  str(self.gridRouteAttribute))\
                                                  .replace('%v', str(cell))
-                canvas.drawFancyText(titleText,
-                                     cellXmin + (cellXmax - cellXmin) / 2.0,
-                                     cellYmax - cellTitleFontSize / 2.0,
-                                     gridDecorationFont,
-                                     colours.black, colours.white,
-                                     referencePoint='centre')
+                if decorate:
+                    canvas.drawFancyText(titleText,
+                                         cellXmin + (cellXmax - cellXmin) / 2.0,
+                                         cellYmax - cellTitleFontSize / 2.0,
+                                         gridDecorationFont,
+                                         colours.black, colours.white,
+                                         referencePoint='centre')
                 cellYmax -= cellTitleFontSize
 #                 self.drawCellBorder(canvas,
 #                                     cellXmin, cellXmax, cellYmin, cellYmax)
+            # part of the cell to paint
+            if area is None:
+                xmin, ymin, xmax, ymax = cellXmin, cellYmin, cellXmax, cellYmax
+            else:
+                xmin, ymin = max(cellXmin, area[0]), max(cellYmin, area[1])
+                xmax, ymax = min(cellXmax, area[2]), min(cellYmax, area[3])
+                if xmin >= xmax or ymin >= ymax:
+                    continue
             # only draw in this cell
-            canvas.restrictDrawing(cellXmin, cellYmin, cellXmax, cellYmax)
+            canvas.restrictDrawing(xmin, ymin, xmax, ymax)
             # next steps:
-            xmin, xmax, ymin, ymax = \
-                self.computeOuterBoundingBox(cellXmin, cellXmax,
-                                             cellYmin, cellYmax,
-                                             inputData,
-                                             margin)
-            revX, revY = self.getReverseCoordMapping(canvas, inputData)
             convertX, convertY = self.getTransformations(cellXmin, cellXmax,
                                                          cellYmin, cellYmax,
                                                          inputData,
                                                          margin)
-            # predicate if required for grid
-            tmpNodePredicate = lambda x: True
-            if not self.grid:
-                newRoutePredicate = routePredicate
-            else:
-                tmpPredicate = util.makeRoutePredicate(self.gridRouteAttribute,
-                                                       cell)
-                newRoutePredicate = \
-                    lambda route: tmpPredicate(route) and \
-                    (routePredicate is None or routePredicate(route))
-                # in case we also need to filter nodes
-                if self.filterNodesInGrid:
-                    tmpNodePredicate = \
-                        util.makeNodeInRoutePredicate(solutionData,
-                                                      newRoutePredicate)
-            newNodePredicate = lambda node: tmpNodePredicate(node) and\
-                (nodePredicate is None or nodePredicate(node))
+            # area of the data visible in this cell, styles may use it to
+            # only draw what is visible; as with the reverse mapping used
+            # before, it stops 2 pixels short of the cell border, so that
+            # styles cropping a background to this box paint the same area
+            visibleBox = self.getVisibleBox(convertX, convertY,
+                                            max(xmin, cellXmin + 2),
+                                            min(xmax, cellXmax - 2),
+                                            max(ymin, cellYmin + 2),
+                                            min(ymax, cellYmax - 2))
+            # predicates of the nodes and routes to paint in this cell
+            newNodePredicate, newRoutePredicate = \
+                self.cellPredicates(inputData, solutionData, cell, gridIndex,
+                                    nodePredicate, routePredicate)
+            # everything except the style itself that its output depends on
+            viewKey = (i, cell, width, height, visibleBox,
+                       convertX(0.0), convertX(1.0),
+                       convertY(0.0), convertY(1.0),
+                       self.grid, self.gridRouteAttribute,
+                       self.filterNodesInGrid) + predicateKeys
+            # everything except the style and the position of the cell that
+            # the output of cell-independent styles depends on
+            groupKey = (approximately(xmax - xmin),
+                        approximately(ymax - ymin),
+                        approximately(convertX(1.0) - convertX(0.0)),
+                        approximately(convertY(1.0) - convertY(0.0)),
+                        tuple( [ approximately(v) for v in visibleBox ] ),
+                        predicateKeys[0], predicateKeys[2])
+            # data shared by all styles painting this cell
+            context = rendercontext.RenderContext(inputData, solutionData,
+                                                  convertX, convertY,
+                                                  newNodePredicate,
+                                                  newRoutePredicate,
+                                                  arcPredicate,
+                                                  visibleBox,
+                                                  sharedData)
             # display all styles sequentially
-            for style in self.styles:
+            for style in styles:
                 if i == 0 or not style.oncePerGrid:
-                    style.paintData(inputData, solutionData,
-                                    canvas, convertX, convertY,
-                                    newNodePredicate,
-                                    newRoutePredicate,
-                                    arcPredicate,
-                                    (revX(xmin-padding+2), revY(ymin-padding+2),
-                                     revX(xmax+padding-2), revY(ymax+padding-2))
-                                )
+                    # output of static styles only depends on the cell
+                    # through its position
+                    static = style.layer != 'solution' and cellIndependent
+                    if useGroups and (static or style.oncePerGrid):
+                        self.paintGroupedStyle(style,
+                                               groupKey if static \
+                                                   else (groupKey, i, cell),
+                                               (xmin, ymin, xmax, ymax),
+                                               inputData, solutionData,
+                                               canvas, convertX, convertY,
+                                               newNodePredicate,
+                                               newRoutePredicate,
+                                               arcPredicate,
+                                               visibleBox, context)
+                    elif memoize:
+                        self.paintMemoizedStyle(style, viewKey,
+                                                inputData, solutionData,
+                                                canvas, convertX, convertY,
+                                                newNodePredicate,
+                                                newRoutePredicate,
+                                                arcPredicate,
+                                                visibleBox, context)
+                    else:
+                        style.paintData(inputData, solutionData,
+                                        canvas, convertX, convertY,
+                                        newNodePredicate,
+                                        newRoutePredicate,
+                                        arcPredicate,
+                                        visibleBox, context)
             # allow to draw everywhere again
             canvas.unrestrictDrawing()
 
+    # node and route predicates of a grid cell (cell is None without grid),
+    # combining the cell and the predicates given to paint(), as mask
+    # predicates (see util.MaskPredicate); the route predicate is None if there
+    # is no grid and no route predicate
+    # masks are cached in the solution data for each cell and predicate keys
+    # (see util.predicateKey())
+    def cellPredicates(self, inputData, solutionData, cell, gridIndex,
+                       nodePredicate, routePredicate):
+        routes = solutionData.routes
+        nodeKey = util.predicateKey(nodePredicate)
+        routeKey = util.predicateKey(routePredicate)
+        nodeMask = solutionData.cachedData( util.cacheKey('nodes', nodeKey),
+                                            util.predicateMask,
+                                            nodePredicate, inputData.nodes)
+        routeMask = solutionData.cachedData( util.cacheKey('routes', routeKey),
+                                             util.predicateMask,
+                                             routePredicate, routes)
+        if not self.grid:
+            return (util.makeNodeMaskPredicate(nodeMask),
+                    None if routePredicate is None else \
+                        util.makeRouteMaskPredicate(solutionData, routeMask))
+        # routes of the cell
+        def computeCellRouteMask():
+            if gridIndex is None:
+                cellMask = util.predicateMask(\
+                    util.makeRoutePredicate(self.gridRouteAttribute, cell),
+                    routes)
+            else:
+                cellMask = numpy.zeros(len(routes), dtype=bool)
+                cellMask[gridIndex[cell][0]] = True
+            return cellMask & routeMask
+        cellRouteMask = \
+            solutionData.cachedData( util.cacheKey('cell routes',
+                                                   self.gridRouteAttribute,
+                                                   cell, routeKey),
+                                     computeCellRouteMask)
+        # nodes of the cell, if nodes are filtered: those visited by its routes
+        def computeCellNodeMask():
+            cellMask = numpy.zeros(len(nodeMask), dtype=bool)
+            if routePredicate is None and not gridIndex is None:
+                cellMask[list(gridIndex[cell][1])] = True
+            else:
+                for i in numpy.flatnonzero(cellRouteMask):
+                    cellMask[routes[i]['node sequence']] = True
+            return cellMask & nodeMask
+        if self.filterNodesInGrid:
+            cellNodeMask = \
+                solutionData.cachedData( util.cacheKey('cell nodes',
+                                                       self.gridRouteAttribute,
+                                                       cell, routeKey, nodeKey),
+                                         computeCellNodeMask)
+        else:
+            cellNodeMask = nodeMask
+        return (util.makeNodeMaskPredicate(cellNodeMask),
+                util.makeRouteMaskPredicate(solutionData, cellRouteMask))
+
+    # paint a style, or replay its previous output if it is still valid
+    def paintMemoizedStyle(self, style, viewKey, inputData, solutionData,
+                           canvas, convertX, convertY,
+                           nodePredicate, routePredicate, arcPredicate,
+                           boundingBox, context):
+        key = (id(style), viewKey[0])
+        token = style.changeToken(inputData, solutionData)
+        if key in self.styleOutputs:
+            oldStyle, oldToken, oldViewKey, operations = self.styleOutputs[key]
+            if oldToken == token and oldViewKey == viewKey:
+                canvasModule.replay(operations, canvas)
+                return
+        recorder = canvasModule.RecordingCanvas(canvas)
+        style.paintData(inputData, solutionData,
+                        recorder, convertX, convertY,
+                        nodePredicate, routePredicate, arcPredicate,
+                        boundingBox, context)
+        # painting may set default parameter values, so the token is computed
+        # again
+        self.styleOutputs[key] = (style,
+                                  style.changeToken(inputData, solutionData),
+                                  viewKey,
+                                  recorder.operations)
+
+    # paint a style as a group of the canvas: the group is defined the first
+    # time and placed at the position of the cell afterwards, which lets
+    # backends such as PDF store the output of the style only once for all
+    # cells and pages; groupKey identifies the view up to a translation
+    def paintGroupedStyle(self, style, groupKey, box, inputData, solutionData,
+                          canvas, convertX, convertY,
+                          nodePredicate, routePredicate, arcPredicate,
+                          boundingBox, context):
+        key = ('style', util.IdentityKey(style),
+               style.changeToken(inputData, solutionData), groupKey)
+        origin = convertX(0.0), convertY(0.0)
+        if not canvas.hasGroup(key):
+            canvas.beginGroup(key, *box, origin=origin)
+            style.paintData(inputData, solutionData,
+                            canvas, convertX, convertY,
+                            nodePredicate, routePredicate, arcPredicate,
+                            boundingBox, context)
+            canvas.endGroup()
+        canvas.placeGroup(key, *origin)
+
+    # forget the output of styles that are not in this stylesheet anymore, or
+    # of all styles if the data changed
+    def forgetStyleOutputs(self, inputData, solutionData):
+        data = (util.IdentityKey(inputData), util.IdentityKey(solutionData))
+        if data != self.styleOutputsData:
+            self.styleOutputs = {}
+            self.styleOutputsData = data
+        current = set( id(style) for style in self.styles )
+        for key in list(self.styleOutputs):
+            if not key[0] in current:
+                del self.styleOutputs[key]
+
     # export the stylesheet as a new class
     def export(self, name, defaultFor=[]):
         # keep only alphanumeric characters
@@ -396,7 +652,8 @@ class StyleSheet(object):
             ', cellTitle=' + str(self.displayCellTitle) + \
             ', cellTitleFormat=\'' + str(self.cellTitleFormat) + '\'' + \
             ', currentBox=' + \
-            str((self.xmin, self.ymin, self.xmax, self.ymax)) + \
+            (str(None) if self.xmin is None
+             else str((self.xmin, self.ymin, self.xmax, self.ymax))) + \
             ', styles=' + str(self.styles) + ')'
 
     # used for debug
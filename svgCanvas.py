@@ -0,0 +1,420 @@
+#
+# SVG canvas
+#
+# -*- coding: utf-8 -*-
+# The SVG document is written to its file as primitives arrive, so that memory
+# does not grow with the size of the drawing. Consecutive primitives with the
+# same style are merged into a single <path> element, repeated node shapes are
+# defined once as a <symbol> and placed with <use>, and restricted drawing is
+# done with clip paths.
+
+import base64
+import io
+from xml.sax.saxutils import escape, quoteattr
+
+from canvas import *
+import colours
+import style
+import graphicsstate
+
+# repeated node shapes and static layers are stored once as symbols
+useSymbols = True
+# a centred polygon drawn at least this many times at once becomes a symbol
+minSymbolPlacements = 2
+# a merged path is written when its data reaches this many characters
+maxPathLength = 65536
+# width used for lines with a thickness of 0, which PDF draws as thin as the
+# device allows
+hairlineWidth = 0.25
+# used when a font has no family
+defaultFontFamily = 'Helvetica, Arial, sans-serif'
+
+# number formatting: two decimals are enough for points
+def num(value):
+    result = ('%.2f' % value).rstrip('0').rstrip('.')
+    return '0' if result == '-0' else result
+
+# SVG attributes for an AbstractColour used as a fill or stroke colour
+def colourAttributes(abstractColour, kind):
+    if abstractColour is None or abstractColour.alpha == 0:
+        return ' ' + kind + '="none"'
+    result = ' ' + kind + '="#%02x%02x%02x"' % (abstractColour.red,
+                                                 abstractColour.green,
+                                                 abstractColour.blue)
+    if abstractColour.alpha < 255:
+        result += ' ' + kind + '-opacity="' + \
+            num(abstractColour.alpha / 255.0) + '"'
+    return result
+
+# adapt the abstract style thickness to SVG
+def getThickness(style):
+    if style.lineThickness is None:
+        return 1
+    elif style.lineThickness <= 0:
+        return hairlineWidth
+    else:
+        return style.lineThickness
+
+# key identifying a drawing style by value
+def drawingStyleKey(style):
+    return (None if style.lineColour is None else style.lineColour.getRGBA(),
+            None if style.fillColour is None else style.fillColour.getRGBA(),
+            style.lineThickness, style.lineStyle)
+
+# SVG attributes for a drawing style, with or without filling and contour
+def styleAttributes(lineRGBA, fillRGBA, thickness, lineStyle, fill, stroke):
+    fillColour = style.Colour(*fillRGBA) if fill and fillRGBA else None
+    lineColour = style.Colour(*lineRGBA) if stroke and lineRGBA else None
+    result = colourAttributes(fillColour, 'fill')
+    result += colourAttributes(lineColour, 'stroke')
+    if not lineColour is None:
+        if thickness is None:
+            thickness = 1
+        elif thickness <= 0:
+            thickness = hairlineWidth
+        result += ' stroke-width="' + num(thickness) + '"'
+        # same caps and joins as in PDF: round, except for dashes
+        if lineStyle == 'dashed':
+            result += ' stroke-dasharray="7,10" stroke-linejoin="round"'
+        else:
+            result += ' stroke-linecap="round" stroke-linejoin="round"'
+    return result
+
+# SVG canvas, streamed to a file name or a file object
+class SvgCanvas(Canvas):
+    def __init__(self, width, height, fName='default.svg'):
+        self.width = width
+        self.height = height
+        self.fName = fName
+        # file we write to, opened by blank()
+        self.out = None
+        # path being merged: (attributes, list of path data, length)
+        self.pending = None
+        # number of clip paths and of open clipped groups
+        self.nClips = 0
+        self.openClips = 0
+        # key = group key, value = (symbol id, origin)
+        self.groups = {}
+
+    # return the width and height of this canvas
+    def getSize(self):
+        return self.width, self.height
+
+    # write a string to the document
+    def write(self, string):
+        self.out.write(string)
+
+    # y coordinate in the SVG document, whose origin is at the top
+    def svgY(self, y):
+        return self.height - y
+
+    # clear the canvas and set a white background
+    # the document is started the first time; afterwards, since what was
+    # written cannot be taken back, it is covered with white
+    def blank(self):
+        if self.out is None:
+            if hasattr(self.fName, 'write'):
+                self.out = self.fName
+            else:
+                self.out = io.open(self.fName, 'w', encoding='utf-8')
+            self.write('<?xml version="1.0" encoding="UTF-8"?>\n' +
+                       '<svg xmlns="http://www.w3.org/2000/svg"' +
+                       ' xmlns:xlink="http://www.w3.org/1999/xlink"' +
+                       ' version="1.1"' +
+                       ' width="' + num(self.width) + '"' +
+                       ' height="' + num(self.height) + '"' +
+                       ' viewBox="0 0 ' + num(self.width) + ' ' +
+                       num(self.height) + '">\n' +
+                       '<!-- proute - https://github.com/fa-bien/proute -->\n')
+        else:
+            self.flush()
+        self.write('<rect width="100%" height="100%" fill="#ffffff"/>\n')
+
+    # write the pending path, if any
+    def flush(self):
+        if not self.pending is None:
+            attributes, data, length = self.pending
+            self.write('<path d="' + ''.join(data) + '"' + attributes +
+                       '/>\n')
+            self.pending = None
+
+    # finish the document and close its file, unless it was given as a file
+    # object
+    def save(self):
+        self.flush()
+        while self.openClips > 0:
+            self.unrestrictDrawing()
+        self.write('</svg>\n')
+        if hasattr(self.fName, 'write'):
+            self.out.flush()
+        else:
+            self.out.close()
+        self.out = None
+
+    # add path data to the document using the given style
+    # consecutive path data with the same attributes make up a single path,
+    # with the non-zero winding rule so that overlapping shapes are filled
+    def addPath(self, data, style, fill, stroke=True):
+        attributes = graphicsstate.intern('svg style',
+                                          drawingStyleKey(style) +
+                                          (bool(fill), bool(stroke)),
+                                          styleAttributes)
+        if not self.pending is None and self.pending[0] != attributes:
+            self.flush()
+        if self.pending is None:
+            self.pending = (attributes, [], 0)
+        attributes, pendingData, length = self.pending
+        pendingData.append(data)
+        length += len(data)
+        self.pending = (attributes, pendingData, length)
+        if length >= maxPathLength:
+            self.flush()
+
+    def restrictDrawing(self, xmin, ymin, xmax, ymax):
+        self.flush()
+        name = 'c' + str(self.nClips)
+        self.nClips += 1
+        self.write('<clipPath id="' + name + '"><rect' +
+                   ' x="' + num(xmin) + '" y="' + num(self.svgY(ymax)) +
+                   '" width="' + num(xmax-xmin) +
+                   '" height="' + num(ymax-ymin) + '"/></clipPath>\n' +
+                   '<g clip-path="url(#' + name + ')">\n')
+        self.openClips += 1
+
+    def unrestrictDrawing(self):
+        self.flush()
+        self.write('</g>\n')
+        self.openClips -= 1
+
+    # draw a simple border...
+    def drawBorder(self):
+        self.flush()
+        self.write('<rect width="' + num(self.width) + '" height="' +
+                   num(self.height) +
+                   '" fill="none" stroke="#808080" stroke-width="2"/>\n')
+
+    # coordinates of the south-west corner of a rectangle of size w, h with
+    # the given reference point at x, y
+    def southWestCorner(self, x, y, w, h, referencePoint):
+        if referencePoint == 'centre' or referencePoint == 'center':
+            return x - w/2.0, y - h/2.0
+        elif referencePoint == 'northwest':
+            return x, y-h
+        elif referencePoint == 'northeast':
+            return x-w, y-h
+        elif referencePoint == 'southeast':
+            return x-w, y
+        else:
+            return x, y
+
+    # path data for various shapes
+    def rectangleData(self, x, y, w, h, referencePoint):
+        x, y = self.southWestCorner(x, y, w, h, referencePoint)
+        return 'M' + num(x) + ' ' + num(self.svgY(y+h)) + \
+            'h' + num(w) + 'v' + num(h) + 'h' + num(-w) + 'z'
+
+    def circleData(self, x, y, r):
+        # two half circles
+        arc = 'a' + num(r) + ' ' + num(r) + ' 0 1 0 '
+        return 'M' + num(x - r) + ' ' + num(self.svgY(y)) + \
+            arc + num(2 * r) + ' 0' + arc + num(-2 * r) + ' 0z'
+
+    def lineData(self, x1, y1, x2, y2):
+        return 'M' + num(x1) + ' ' + num(self.svgY(y1)) + \
+            'L' + num(x2) + ' ' + num(self.svgY(y2))
+
+    def polylineData(self, x, y):
+        return 'M' + ' L'.join( [ num(a) + ' ' + num(self.svgY(b))
+                                  for a, b in zip(x, y) ] )
+
+    # draw a rectangle centred at coordinates x, y
+    def drawRectangle(self, x, y, w, h, style, referencePoint='centre'):
+        self.addPath(self.rectangleData(x, y, w, h, referencePoint),
+                     style, not style.fillColour is None)
+
+    # draw a list of rectangles with the same style
+    # xs, ys, ws, hs are lists
+    def drawRectangles(self, xs, ys, ws, hs, style, referencePoint='centre'):
+        for x, y, w, h in zip(xs, ys, ws, hs):
+            self.drawRectangle(x, y, w, h, style, referencePoint)
+
+    # draw a circle centred at coordinates x, y
+    def drawCircle(self, x, y, r, style):
+        self.addPath(self.circleData(x, y, r),
+                     style, not style.fillColour is None)
+
+    # draw a list of circles with the same colour style
+    # parameters xs, ys, rs should be lists
+    def drawCircles(self, xs, ys, rs, style):
+        for x, y, r in zip(xs, ys, rs):
+            self.drawCircle(x, y, r, style)
+
+    # draw a line
+    def drawLine(self, x1, y1, x2, y2, style):
+        self.addPath(self.lineData(x1, y1, x2, y2), style, False)
+
+    # draw lines with the same style
+    def drawLines(self, x1s, y1s, x2s, y2s, style):
+        for x1, y1, x2, y2 in zip(x1s, y1s, x2s, y2s):
+            self.drawLine(x1, y1, x2, y2, style)
+
+    # draw a polyline
+    # x and y are lists
+    def drawPolyline(self, x, y, style):
+        # no line colour means an invisible line
+        if style.lineColour is None or len(x) < 2:
+            return
+        self.addPath(self.polylineData(x, y), style, False)
+
+    # draw a spline; each element in points is a 2-uple with x,y coordinates
+    def drawSpline(self, points, style):
+        # required to close the path on each side
+        points = [ points[0] ] + points + [ points[-1] ]
+        data = [ 'M' + num((points[1][0] + points[0][0]) / 2.0) + ' ' +
+                 num(self.svgY((points[1][1] + points[0][1]) / 2.0)) ]
+        # each bezier curve starts where the previous one ends
+        for i in range(1, len(points)-1):
+            midX = num((points[i][0] + points[i+1][0]) / 2.0)
+            midY = num(self.svgY((points[i][1] + points[i+1][1]) / 2.0))
+            data.append('C' + num(points[i][0]) + ' ' +
+                        num(self.svgY(points[i][1])) + ' ' +
+                        midX + ' ' + midY + ' ' + midX + ' ' + midY)
+        self.addPath(''.join(data), style, False)
+
+    # draw a polygon
+    # x and y are lists of point coordinates
+    def drawPolygon(self, x, y, style):
+        if len(x) < 2:
+            return
+        self.addPath(self.polylineData(x, y) + 'z', style,
+                     not style.fillColour is None,
+                     not style.lineColour is None)
+
+    # draw several polygons with the same style
+    # xs and ys are lists of lists of point coordinates
+    def drawPolygons(self, xs, ys, style):
+        for x, y in zip(xs, ys):
+            self.drawPolygon(x, y, style)
+
+    # draw several times a centred polygon with the same style
+    # the polygon is stored once as a symbol and placed at each position
+    def drawCentredPolygons(self, polygon, xs, ys, radius, style, angle=0):
+        if not useSymbols or len(xs) < minSymbolPlacements:
+            Canvas.drawCentredPolygons(self, polygon, xs, ys, radius, style,
+                                       angle)
+            return
+        points = polygon.getTransformedPoints(radius, angle)
+        key = ('symbol', tuple(points), drawingStyleKey(style))
+        if not self.hasGroup(key):
+            extent = max( [ max(abs(a), abs(b)) for a, b in points ] ) + \
+                getThickness(style)
+            self.beginGroup(key, -extent, -extent, extent, extent)
+            self.drawPolygon([ a for a, b in points ],
+                             [ b for a, b in points ],
+                             style)
+            self.endGroup()
+        for x, y in zip(xs, ys):
+            self.placeGroup(key, x, y)
+
+    # groups are stored as symbols
+    # they are not clipped to their box since SVG symbols only clip to their
+    # viewport, which would also scale them; the cell clip path applies
+    # anyway wherever they are placed
+    def supportsGroups(self):
+        return useSymbols
+
+    def hasGroup(self, key):
+        return key in self.groups
+
+    # the content of a symbol is written in document coordinates, placing it
+    # translates it so that its origin lands at the given position
+    def beginGroup(self, key, xmin, ymin, xmax, ymax, origin=(0, 0)):
+        self.flush()
+        name = 'g' + str(len(self.groups))
+        self.groups[key] = (name, origin)
+        self.write('<defs><symbol id="' + name + '" overflow="visible">\n')
+
+    def endGroup(self):
+        self.flush()
+        self.write('</symbol></defs>\n')
+
+    def placeGroup(self, key, x, y):
+        self.flush()
+        name, (originX, originY) = self.groups[key]
+        self.write('<use xlink:href="#' + name + '"' +
+                   ('' if x == originX else ' x="' + num(x - originX) + '"') +
+                   ('' if y == originY else ' y="' + num(originY - y) + '"') +
+                   '/>\n')
+
+    # SVG attributes for a font and colour
+    def fontAttributes(self, font, foregroundColour):
+        result = ' font-family=' + \
+            quoteattr(font.family or defaultFontFamily) + \
+            ' font-size="' + num(font.size) + '"'
+        if font.style == 'bold':
+            result += ' font-weight="bold"'
+        elif font.style == 'italic':
+            result += ' font-style="italic"'
+        return result + colourAttributes(foregroundColour, 'fill')
+
+    # draw a text label with top left corner at x, y
+    def drawText(self, label, x, y,
+                 font, foregroundColour, backgroundColour):
+        self.drawTexts([ label ], [ x ], [ y ],
+                       font, foregroundColour, backgroundColour)
+
+    # draw several text labels with top left corners given in xs, ys
+    # they share a group carrying their font and colour
+    def drawTexts(self, labels, xs, ys,
+                 font, foregroundColour, backgroundColour):
+        self.flush()
+        self.write('<g' + self.fontAttributes(font, foregroundColour) + '>\n')
+        for label, x, y in zip(labels, xs, ys):
+            self.write('<text x="' + num(x) + '" y="' +
+                       num(self.svgY(y - font.size)) + '">' +
+                       escape(str(label)) + '</text>\n')
+        self.write('</g>\n')
+
+    # draw a text label at x, y
+    # this version allows to specify a reference point and an angle
+    # instead of measuring the text, the reference point is given to the
+    # viewer as text anchor and baseline
+    def drawFancyText(self, label, x, y,
+                      font, foregroundColour, backgroundColour,
+                      angle=0,
+                      referencePoint='northwest'):
+        self.flush()
+        if angle is None:
+            angle = 0
+        if referencePoint == 'centre' or referencePoint == 'center':
+            anchor, baseline = 'middle', 'central'
+        else:
+            anchor = 'end' if referencePoint[-4:] == 'east' else 'start'
+            baseline = 'hanging' if referencePoint[:5] == 'north' \
+                else 'alphabetic'
+        x, y = num(x), num(self.svgY(y))
+        self.write('<text x="' + x + '" y="' + y + '"' +
+                   self.fontAttributes(font, foregroundColour) +
+                   ('' if anchor == 'start'
+                    else ' text-anchor="' + anchor + '"') +
+                   ('' if baseline == 'alphabetic'
+                    else ' dominant-baseline="' + baseline + '"') +
+                   ('' if angle == 0
+                    else ' transform="rotate(' + num(-angle) + ' ' + x +
+                    ' ' + y + ')"') +
+                   '>' + escape(str(label)) + '</text>\n')
+
+    # draw a bitmap using the given north-west corner
+    # the bitmap is embedded as a PNG image
+    def drawBitmap(self, bitmap, NWcorner):
+        self.flush()
+        x, y = NWcorner
+        w, h = bitmap.size
+        buffer = io.BytesIO()
+        bitmap.save(buffer, format='png')
+        self.write('<image x="' + num(x) + '" y="' + num(self.svgY(y)) +
+                   '" width="' + num(w) + '" height="' + num(h) +
+                   '" preserveAspectRatio="none"' +
+                   ' xlink:href="data:image/png;base64,')
+        self.write(base64.b64encode(buffer.getvalue()).decode('ascii'))
+        self.write('"/>\n')
@@ -0,0 +1,172 @@
+#
+# Thumbnails of solutions
+#
+# -*- coding: utf-8 -*-
+# Painting the thumbnails of hundreds of solutions with their full style sheet
+# used to delay the opening of the main window by minutes. Thumbnails now only
+# show routes as polylines, painted on a raster canvas that doesn't need wx,
+# in a background thread. The GUI submits one job per solution, tells which
+# ones are visible so that they are painted first, and cancels what is left
+# when it closes. Painted thumbnails are kept in a disk cache, so that they are
+# reused by other windows and sessions.
+
+import os
+import io
+import hashlib
+import threading
+
+from PIL import Image
+
+import config
+import util
+import stylesheet
+import pilCanvas
+
+# change this whenever thumbnails are painted differently
+thumbnailVersion = 1
+
+# painted thumbnails are cached on disk
+useThumbnailCache = True
+thumbnailCacheSize = 32 * 1024 * 1024
+thumbnailCache = \
+    util.PersistentDiskCache(os.path.join(config.userConfigDir, 'thumbnails'),
+                             thumbnailCacheSize)
+
+# style sheet used for all thumbnails: routes as polylines
+def thumbnailStyleSheet():
+    import basestyles
+    return stylesheet.StyleSheet(styles=[ basestyles.RoutePolylineDisplayer() ])
+
+# paint the thumbnail of a solution, as a Pillow image
+def paintThumbnail(vrp, solution, width, height, sheet=None):
+    if sheet is None:
+        sheet = thumbnailStyleSheet()
+    canvas = pilCanvas.PilThumbnailCanvas(width, height)
+    sheet.paint(vrp, solution, canvas, thumbnail=True)
+    return canvas.getImage()
+
+# key identifying the thumbnail of a solution in the cache: the content of the
+# solution file, how the solution was read from it, the instance file in its
+# current state, the style sheet and the thumbnail size
+# the solution class and repr() tell apart solutions read from the same file,
+# e.g. the solutions of a log file or the same file read as another subtype
+def thumbnailCacheKey(vrp, solution, width, height, sheet):
+    with open(solution.fName, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(vrp.fName)
+    solutionClass = solution.__class__.__module__ + '.' + \
+        solution.__class__.__name__
+    return ('thumbnail', thumbnailVersion, util.version(), digest,
+            solutionClass, repr(solution),
+            os.path.abspath(vrp.fName), stat.st_size, stat.st_mtime_ns,
+            repr(sheet), width, height)
+
+# same as paintThumbnail(), using the cache when possible
+# thumbnails are stored as PNG data
+def cachedThumbnail(vrp, solution, width, height):
+    sheet = thumbnailStyleSheet()
+    if not useThumbnailCache:
+        return paintThumbnail(vrp, solution, width, height, sheet)
+    try:
+        key = thumbnailCacheKey(vrp, solution, width, height, sheet)
+    except (IOError, OSError):
+        # no file to identify the solution with
+        return paintThumbnail(vrp, solution, width, height, sheet)
+    data = thumbnailCache.get(key)
+    if not data is None:
+        try:
+            return Image.open(io.BytesIO(data)).convert('RGB')
+        except Exception as e:
+            print('[Warning] unable to read cached thumbnail for',
+                  solution.name, ':', e)
+    image = paintThumbnail(vrp, solution, width, height, sheet)
+    buffer = io.BytesIO()
+    image.save(buffer, format='png')
+    thumbnailCache.put(key, buffer.getvalue())
+    return image
+
+# paint thumbnails in a background thread
+# each job has a key chosen by the caller; callback(key, image) is called in
+# the background thread when the thumbnail for key is ready
+class ThumbnailRenderer(object):
+    def __init__(self, width, height, callback):
+        self.width = width
+        self.height = height
+        self.callback = callback
+        # key = job key, value = (submission number, vrp, solution)
+        self.jobs = {}
+        self.nSubmitted = 0
+        # keys of the jobs to do first
+        self.urgent = set()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    # paint the thumbnail of a solution; a pending job with the same key is
+    # replaced
+    def submit(self, key, vrp, solution):
+        with self.condition:
+            if self.stopped:
+                return
+            self.jobs[key] = (self.nSubmitted, vrp, solution)
+            self.nSubmitted += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name='thumbnails')
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    # forget a pending job
+    def cancel(self, key):
+        with self.condition:
+            if key in self.jobs:
+                del self.jobs[key]
+
+    # jobs with these keys are done before all others
+    def prioritize(self, keys):
+        with self.condition:
+            self.urgent = set(keys)
+
+    # number of jobs left
+    def pending(self):
+        with self.condition:
+            return len(self.jobs)
+
+    # cancel all pending jobs and let the background thread finish
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.jobs = {}
+            self.condition.notify()
+
+    # next job to do, in order of submission, urgent jobs first
+    # None if the renderer is stopped
+    def nextJob(self):
+        with self.condition:
+            while not self.jobs and not self.stopped:
+                self.condition.wait()
+            if self.stopped:
+                return None
+            urgent = [ key for key in self.urgent if key in self.jobs ]
+            candidates = urgent if urgent else self.jobs.keys()
+            key = min(candidates, key=lambda k: self.jobs[k][0])
+            number, vrp, solution = self.jobs.pop(key)
+            return key, vrp, solution
+
+    # body of the background thread
+    def run(self):
+        while True:
+            job = self.nextJob()
+            if job is None:
+                return
+            key, vrp, solution = job
+            try:
+                image = cachedThumbnail(vrp, solution,
+                                        self.width, self.height)
+            except Exception as e:
+                print('[Warning] unable to paint thumbnail for',
+                      solution.name, ':', e)
+                continue
+            if not self.stopped:
+                self.callback(key, image)
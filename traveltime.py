@@ -0,0 +1,123 @@
+#
+# Lazily computed travel time matrices
+#
+# -*- coding: utf-8 -*-
+# An EuclideanTravelTimes object is used as the travelTime attribute of
+# instances which do not provide their own travel times. It can be indexed
+# like the former list of lists (travelTime[i][j]), but rows are only computed
+# when first needed, one block of rows at a time, and stored as float32.
+# Large matrices are memory-mapped to a temporary file.
+
+import tempfile
+
+import numpy
+
+# number of rows computed at once
+blockSize = 256
+# matrices bigger than this (in bytes) are memory-mapped to a temporary file
+memoryMapThreshold = 256 * 1024 * 1024
+
+# one row of a travel time matrix
+class TravelTimeRow(object):
+    __slots__ = ('matrix', 'row')
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+
+    def __getitem__(self, column):
+        return self.matrix.get(self.row, column)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __iter__(self):
+        values = self.matrix.getRow(self.row).astype(numpy.float64)
+        return iter(numpy.round(values, 2).tolist())
+
+# travel times computed as euclidean distances rounded to two decimals
+class EuclideanTravelTimes(object):
+    def __init__(self, xs, ys):
+        self.xs = numpy.asarray(xs, dtype=numpy.float64)
+        self.ys = numpy.asarray(ys, dtype=numpy.float64)
+        self.reset()
+
+    # forget all computed values
+    def reset(self):
+        self.values = None
+        self.tmpFile = None
+        nBlocks = (len(self.xs) + blockSize - 1) // blockSize
+        self.computedBlocks = numpy.zeros(nBlocks, dtype=bool)
+
+    # computed values are not worth storing: they are recomputed on demand
+    def __getstate__(self):
+        return { 'xs': self.xs, 'ys': self.ys }
+
+    def __setstate__(self, state):
+        self.xs, self.ys = state['xs'], state['ys']
+        self.reset()
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            return self.get(*index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('travel time row out of range')
+        return TravelTimeRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TravelTimeRow(self, i)
+
+    # travel time from node i to node j
+    def get(self, i, j):
+        return round(float(self.getRow(i)[j]), 2)
+
+    # all travel times from node i, as a float32 array
+    def getRow(self, i):
+        block = i // blockSize
+        if not self.computedBlocks[block]:
+            self.computeBlock(block)
+        return self.values[i]
+
+    # travel times between pairs of nodes given as two sequences of indices,
+    # computed without materializing the matrix
+    def pairs(self, froms, tos):
+        froms = numpy.asarray(froms, dtype=numpy.intp)
+        tos = numpy.asarray(tos, dtype=numpy.intp)
+        return numpy.round(numpy.hypot(self.xs[froms] - self.xs[tos],
+                                       self.ys[froms] - self.ys[tos]),
+                           2)
+
+    # the whole matrix as a float32 array
+    def toArray(self):
+        for block in range(len(self.computedBlocks)):
+            if not self.computedBlocks[block]:
+                self.computeBlock(block)
+        return self.values
+
+    # allocate the storage for the matrix on first use
+    def allocate(self):
+        n = len(self)
+        if n * n * numpy.dtype(numpy.float32).itemsize > memoryMapThreshold:
+            self.tmpFile = tempfile.TemporaryFile(prefix='proute-')
+            self.values = numpy.memmap(self.tmpFile, dtype=numpy.float32,
+                                       mode='w+', shape=(n, n))
+        else:
+            self.values = numpy.empty((n, n), dtype=numpy.float32)
+
+    # compute rows of the given block in one vectorized operation
+    def computeBlock(self, block):
+        if self.values is None:
+            self.allocate()
+        first = block * blockSize
+        last = min(first + blockSize, len(self))
+        self.values[first:last] = \
+            numpy.round(numpy.hypot(self.xs[first:last, None] - self.xs,
+                                    self.ys[first:last, None] - self.ys),
+                        2)
+        self.computedBlocks[block] = True
@@ -5,24 +5,45 @@
 import os
 import atexit
 import pickle
+import hashlib
 import urllib.request, urllib.error, urllib.parse
 import io
 from math import *
 
+import numpy
+
 import config
 
 # useful general-purpose functions
 
+# linear mapping of input values between inputMin and inputMax to output
+# values between outputMin and outputMax
+# it can be applied to a single value or to a whole NumPy array at once
+class LinearMapping(object):
+    def __init__(self, inputMin, inputMax, outputMin, outputMax):
+        # identifies the mapping, e.g. for caching its results
+        self.key = (inputMin, inputMax, outputMin, outputMax)
+        self.inputMin = float(inputMin)
+        self.inputRange = inputMax - inputMin
+        self.outputMin = outputMin
+        self.outputRange = outputMax - outputMin
+        self.middle = (outputMax + outputMin) / 2.0
+
+    def __call__(self, x):
+        if isinstance(x, (list, tuple)):
+            x = numpy.asarray(x, dtype=float)
+        if self.inputRange == 0:
+            if isinstance(x, numpy.ndarray):
+                return numpy.full(x.shape, self.middle)
+            return self.middle
+        return self.outputMin \
+            + (x - self.inputMin) / self.inputRange * self.outputRange
+
 # returns a function mapping input values between inputMin and inputMax to
 # output values between outputMin and outputMax
 # the mapping is linear
 def intervalMapping(inputMin, inputMax, outputMin, outputMax):
-    if inputMin == inputMax:
-        return lambda x: (outputMax + outputMin) / 2.0
-    else:
-        return lambda x: outputMin\
-            + (x - float(inputMin)) / (inputMax - inputMin)\
-            * (outputMax - outputMin)
+    return LinearMapping(inputMin, inputMax, outputMin, outputMax)
 
 # same as above but uses a modulo so that the value always matches
 def intervalMappingModulo(inputMin, inputMax,
@@ -35,7 +56,10 @@ def intervalMappingModulo(inputMin, inputMax,
 # return a predicate returning true if the route has the right value for the
 # specified attribute
 def makeRoutePredicate(attribute, value):
-    return lambda route: route[attribute] == value
+    predicate = lambda route: route[attribute] == value
+    # the routes it selects only depend on the attribute and the value
+    predicate.key = ('route attribute', attribute, value)
+    return predicate
 
 # return a predicate returning true if the node is present in a route of
 # solutionData satisfying routePredicate
@@ -45,7 +69,100 @@ def makeNodeInRoutePredicate(solutionData, routePredicate):
         if routePredicate(route):
             for i in route['node sequence']:
                 acceptableIndices.add(i)
-    return lambda node: node['index'] in acceptableIndices
+    return makeNodeInSetPredicate(acceptableIndices)
+
+# return a predicate returning true if the index of the node is in a set
+def makeNodeInSetPredicate(indices):
+    return lambda node: node['index'] in indices
+
+# predicate given by a boolean mask over nodes, routes or arcs: an item
+# satisfies it if the mask is True at its position, given by position(item)
+# (None for items not covered by the mask)
+# mask predicates are called like any other predicate; masks of predicates
+# over the same items combine with &
+class MaskPredicate(object):
+    def __init__(self, mask, position):
+        self.mask = numpy.asarray(mask, dtype=bool)
+        self.position = position
+        # same as mask, as a list: faster to index item by item
+        self.values = None
+
+    def __call__(self, item):
+        if self.values is None:
+            self.values = self.mask.tolist()
+        i = self.position(item)
+        return not i is None and self.values[i]
+
+    def __and__(self, other):
+        if not isinstance(other, MaskPredicate):
+            return NotImplemented
+        return MaskPredicate(self.mask & other.mask, self.position)
+
+# return a mask predicate on nodes
+def makeNodeMaskPredicate(mask):
+    return MaskPredicate(mask, lambda node: node['index'])
+
+# return a mask predicate on the routes of solutionData
+def makeRouteMaskPredicate(solutionData, mask):
+    positions = solutionData.routePositions()
+    return MaskPredicate(mask, lambda route: positions.get(id(route)))
+
+# boolean array: True for items satisfying a predicate, all True if the
+# predicate is None; the mask of a mask predicate is used as is
+def predicateMask(predicate, items):
+    if predicate is None:
+        return numpy.ones(len(items), dtype=bool)
+    elif isinstance(predicate, MaskPredicate):
+        return predicate.mask
+    else:
+        return numpy.array([ bool(predicate(item)) for item in items ],
+                           dtype=bool)
+
+# key identifying what a predicate selects in given data, so that it can be
+# cached: 'all' for no predicate, the key attribute of predicates having one
+# (see makeRoutePredicate()), None for other predicates, which may give
+# another answer each time they are used
+def predicateKey(predicate):
+    if predicate is None:
+        return 'all'
+    key = getattr(predicate, 'key', None)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+# cache key made of the given parts, None if one of them is None
+def cacheKey(*parts):
+    if any( part is None for part in parts ):
+        return None
+    return parts
+
+# part of a cache key standing for an object, compared by identity
+# unlike id(object), it keeps the object alive, so that another object created
+# at the same address later on can't be mistaken for it
+class IdentityKey(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, IdentityKey) and self.value is other.value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __repr__(self):
+        return 'IdentityKey(' + hex(id(self.value)) + ')'
+
+    # a copy of the key must stand for the same object, not for a copy of it
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 # return the end index of the longest common substring starting at index 0
 def longestStartingSubstringIndex(strings):
@@ -152,6 +269,100 @@ class PersistentWebCache:
                 pickle.dump(self.dict, f)
             print('Stored web cache to', self.fileName)
 
+# this class implements a persistent cache of picklable objects on disk
+# Each entry is stored in its own file in the given directory, named after a
+# hash of its key. The key is stored at the start of the file, so that an entry
+# is only returned for the exact key it was stored with.
+# The total size of the cache is bounded by maxSize bytes: when it is exceeded,
+# the least recently used entries are removed. The modification time of each
+# file is used to keep track of its last use.
+class PersistentDiskCache:
+    # when the cache is too big, entries are removed until it is down to this
+    # fraction of maxSize, so that the next entries fit without scanning the
+    # cache again
+    evictionRatio = 0.9
+
+    def __init__(self, directory, maxSize):
+        self.directory = directory
+        self.maxSize = maxSize
+        # size of the cache as known to this process: from the last scan of
+        # the directory, plus the size of the entries stored since then
+        # (entries stored by other processes are only counted when scanning)
+        # None until the first scan
+        self.estimatedSize = None
+
+    def fileName(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.cache')
+
+    # return the value stored for this key, or default if there is none
+    def get(self, key, default=None):
+        fName = self.fileName(key)
+        if not os.path.exists(fName):
+            return default
+        try:
+            with open(fName, 'rb') as f:
+                if pickle.load(f) != key:
+                    return default
+                value = pickle.load(f)
+            # mark the entry as recently used
+            os.utime(fName)
+            return value
+        except Exception as e:
+            print('[Warning] unable to read cache entry', fName, ':', e)
+            return default
+
+    # store a value for this key, then make room if the cache is too big
+    def put(self, key, value):
+        fName = self.fileName(key)
+        # several processes may store the same entry at the same time
+        tmpFileName = fName + '.' + str(os.getpid()) + '.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmpFileName, 'wb') as f:
+                pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                entrySize = f.tell()
+            os.replace(tmpFileName, fName)
+        except Exception as e:
+            print('[Warning] unable to store cache entry', fName, ':', e)
+            if os.path.exists(tmpFileName):
+                os.remove(tmpFileName)
+            return
+        # the directory is only scanned when the cache may be too big
+        if self.estimatedSize is None or \
+                self.estimatedSize + entrySize > self.maxSize:
+            self.evict()
+        else:
+            self.estimatedSize += entrySize
+
+    # remove least recently used entries if the cache doesn't fit in maxSize,
+    # until it fits in evictionRatio * maxSize
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name[-6:] != '.cache':
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                # removed by another process in the meantime
+                continue
+            entries.append( (stat.st_mtime, stat.st_size, name) )
+        totalSize = sum( [ size for date, size, name in entries ] )
+        if totalSize > self.maxSize:
+            entries.sort()
+            for date, size, name in entries:
+                if totalSize <= self.evictionRatio * self.maxSize:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    totalSize -= size
+                except OSError as e:
+                    print('[Warning] unable to remove cache entry', name, ':',
+                          e)
+        self.estimatedSize = totalSize
+
 # escape characters that might otherwise be interpreted in an inappropriate way
 def escapeFileName(fileName):
     return fileName.replace('\\', '\\\\').replace('\'', '\\\'')
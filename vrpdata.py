@@ -12,12 +12,26 @@ import sys
 import string
 import math
 
+import numpy
+
 import util
 import vrpexceptions
 import findneighbour
+import nodestore
+import traveltime
 from functools import reduce
 
 widthNodeFactor = 3
+# instances with at least this many nodes store their node data in columns
+# (see nodestore.py) instead of one dictionary per node
+# None disables the columnar store
+columnarStoreThreshold = 5000
+# number of transformations for which screen coordinates of nodes are cached
+# (node coordinates are not supposed to change once an instance is loaded)
+screenCoordinateCacheSize = 8
+# number of masks and other data derived from a solution that are cached (see
+# VrpSolutionData.cachedData())
+derivedDataCacheSize = 256
 
 # this class represents input data for any kind of routing problem
 class VrpInputData(object):
@@ -41,6 +55,10 @@ class VrpInputData(object):
                                                       'demand': 12.
                                                       'x': 3,
                                                       'y': 6}
+    For large instances, nodes is a nodestore.ColumnarNodeStore instead: nodes[i]
+    then returns a view that behaves like the dictionary above. In both cases,
+    nodeColumn(attribute) returns the values of an attribute for all nodes as
+    a NumPy array.
     
     """
     problemType = 'Change me'
@@ -83,17 +101,24 @@ class VrpInputData(object):
                                                             fName)
         # generate missing information
         self.generateMissingData()
+        # large instances: switch to columnar node storage
+        if columnarStoreThreshold is not None and \
+                len(self.nodes) >= columnarStoreThreshold:
+            self.nodes = nodestore.ColumnarNodeStore(self.nodes,
+                                                     self.nodeAttributes)
         # in case the travel time matrix doesn't exist, make a simple one
+        # (it is computed lazily so this is cheap even for large instances)
         try:
             self.travelTime
         except Exception as e:
-            if len(self.nodes) < 500: # arbitrary
-                self.computeEuclideanTravelTimes()
+            self.computeEuclideanTravelTimes()
         # we must update the bounding box of all nodes we just read
         self.updateBoundingBox()
         # we also create a neighbour finder
 #         self.neighbourFinder = findneighbour.MapNeighbourFinder(self)
-        self.neighbourFinder = findneighbour.TwoDTreeNeighbourFinder(self)
+        self.neighbourFinder = findneighbour.KDTreeNeighbourFinder(self)
+        # screen coordinates of all nodes for the last few transformations
+        self.screenCoordinateCache = {}
 
     # get closest node to given coordinates
     def getNodeAtCoords(self, x, y, maxDist):
@@ -116,18 +141,39 @@ class VrpInputData(object):
             if not x in self.nodeAttributes:
                 self.nodeAttributes.append(x)
         
+    # return the values of given node attribute for all nodes as an array
+    def nodeColumn(self, attribute):
+        if isinstance(self.nodes, nodestore.ColumnarNodeStore):
+            return self.nodes.column(attribute)
+        else:
+            return numpy.array([ node[attribute] for node in self.nodes ])
+
+    # return the screen coordinates of all nodes, as two arrays, for given
+    # coordinate transformations (e.g. as returned by
+    # StyleSheet.getTransformations())
+    # results are cached for transformations identifying themselves with a key
+    def screenCoordinates(self, convertX, convertY):
+        key = (getattr(convertX, 'key', None), getattr(convertY, 'key', None))
+        if None in key:
+            return convertX(self.nodeColumn('x').astype(float)), \
+                convertY(self.nodeColumn('y').astype(float))
+        if not key in self.screenCoordinateCache:
+            if len(self.screenCoordinateCache) >= screenCoordinateCacheSize:
+                self.screenCoordinateCache.clear()
+            self.screenCoordinateCache[key] = \
+                (convertX(self.nodeColumn('x').astype(float)),
+                 convertY(self.nodeColumn('y').astype(float)))
+        return self.screenCoordinateCache[key]
+
     # update bounding box with all node coordinates
     def updateBoundingBox(self):
-        for node in self.nodes:
-            x, y = node['x'], node['y']
-            if x > self.xmax:
-                self.xmax = x
-            if x < self.xmin:
-                self.xmin = x
-            if y > self.ymax:
-                self.ymax = y
-            if y < self.ymin:
-                self.ymin = y
+        xs, ys = self.nodeColumn('x'), self.nodeColumn('y')
+        # without nodes the bounding box is left as it is
+        if len(xs) > 0:
+            self.xmin = min(self.xmin, xs.min().item())
+            self.xmax = max(self.xmax, xs.max().item())
+            self.ymin = min(self.ymin, ys.min().item())
+            self.ymax = max(self.ymax, ys.max().item())
         # compute width/height ratio
         self.width = 600 # len(self.nodes) * widthNodeFactor
         self.heightOverWidth =\
@@ -139,12 +185,25 @@ class VrpInputData(object):
             self.width = self.height / self.heightOverWidth
 
     # compute travel times using euclidean distance
+    # the matrix is only materialized when its rows are accessed
     def computeEuclideanTravelTimes(self):
-        self.travelTime = [ [ round(math.hypot(n1['x'] - n2['x'],
-                                               n1['y'] - n2['y'], ),
-                                    2)
-                              for n1 in self.nodes ]
-                            for n2 in self.nodes ]
+        self.travelTime = \
+            traveltime.EuclideanTravelTimes(self.nodeColumn('x'),
+                                            self.nodeColumn('y'))
+
+    # return the travel time of each leg along a sequence of node indices
+    def travelTimesAlong(self, sequence):
+        if isinstance(self.travelTime, traveltime.EuclideanTravelTimes):
+            return self.travelTime.pairs(sequence[:-1], sequence[1:]).tolist()
+        else:
+            return [ self.travelTime[a][b]
+                     for a, b in zip(sequence[:-1], sequence[1:]) ]
+
+    # complete node data required to compute a simple schedule
+    def completeSchedulingData(self):
+        for node in self.nodes:
+            if not 'service time' in node:
+                node['service time'] = 0
 
     # store this instance to a PIF file
     def storeAsPIF(self, fName, sep=','):
@@ -212,6 +271,13 @@ class VrpSolutionData(object):
     # standard constructor, always called. It does all kinds of necessary
     # initialisations then calls the specialised self.loadData() method
     def __init__(self, fName, vrpData):
+        self.parse(fName, vrpData)
+        self.complete(vrpData)
+
+    # first part of the constructor: everything up to self.loadData()
+    # the resulting state, as returned by parsedData(), only contains what was
+    # read from the file, and can be completed by another process
+    def parse(self, fName, vrpData):
         self.fName = os.path.abspath(fName)
         # solution attributes e.g. cost
         self.attributes = {}
@@ -244,6 +310,22 @@ class VrpSolutionData(object):
             print(e)
             raise vrpexceptions.SolutionFileFormatException(self.problemType,
                                                             fName)
+
+    # data read by parse(), as a dictionary of attributes
+    def parsedData(self):
+        return dict(self.__dict__)
+
+    # solution of given class from data returned by parsedData(), completed
+    # for instance vrpData
+    @classmethod
+    def fromParsedData(cls, data, vrpData):
+        solution = cls.__new__(cls)
+        solution.__dict__.update(data)
+        solution.complete(vrpData)
+        return solution
+
+    # second part of the constructor: complete the data read by parse()
+    def complete(self, vrpData):
         # in case the route information provided by loadData() is not complete:
         # generate the missing data e.g. generate node sequence from arcs
         self.populateRouteData(vrpData)
@@ -259,6 +341,71 @@ class VrpSolutionData(object):
             self.computeSimpleScheduling(vrpData)
         # enrich solution data
         self.generateMetaData(vrpData)
+        # no route index or derived data yet, they are built on first use
+        self.forgetRouteIndex()
+
+    # index of the routes by value of a route attribute: dictionary with an
+    # entry per value, as (list of the indices of the routes taking this value,
+    # frozenset of the indices of the nodes they visit)
+    # None if some routes don't have the attribute or its values are not
+    # hashable
+    def routeIndex(self, attribute):
+        if not attribute in self.routeIndexCache:
+            index = {}
+            try:
+                for i, route in enumerate(self.routes):
+                    routes, nodes = index.setdefault(route[attribute],
+                                                     ([], set()))
+                    routes.append(i)
+                    nodes.update(route['node sequence'])
+                index = dict( [ (value, (routes, frozenset(nodes)))
+                                for value, (routes, nodes) in index.items() ] )
+            except (KeyError, TypeError):
+                index = None
+            self.routeIndexCache[attribute] = index
+        return self.routeIndexCache[attribute]
+
+    # to be called after modifying the routes: forget the route index and
+    # all cached data derived from the solution
+    def forgetRouteIndex(self):
+        # indices of routes by route attribute value
+        self.routeIndexCache = {}
+        # masks and other data derived from the solution
+        self.derivedDataCache = {}
+
+    # data derived from the solution cached under key, computed with
+    # function(*args) if required; with key None (see util.cacheKey()), it is
+    # computed every time
+    def cachedData(self, key, function, *args):
+        if key is None:
+            return function(*args)
+        elif not key in self.derivedDataCache:
+            if len(self.derivedDataCache) >= derivedDataCacheSize:
+                self.derivedDataCache = {}
+            self.derivedDataCache[key] = function(*args)
+        return self.derivedDataCache[key]
+
+    # boolean array: True for nodes used in the solution
+    def usedNodeMask(self):
+        return self.cachedData('used nodes',
+                               lambda: numpy.array([ bool(node['used'])
+                                                     for node in self.nodes ],
+                                                   dtype=bool))
+
+    # position of each route in self.routes, by id of the route
+    def routePositions(self):
+        return self.cachedData('route positions',
+                               lambda: dict( [ (id(route), i)
+                                               for i, route in
+                                               enumerate(self.routes) ] ))
+
+    # boolean array per route: True for its arcs satisfying arcPredicate
+    def arcMasks(self, arcPredicate):
+        return self.cachedData( util.cacheKey('arcs',
+                                              util.predicateKey(arcPredicate)),
+                                lambda: [ util.predicateMask(arcPredicate,
+                                                             route['arcs'])
+                                          for route in self.routes ] )
 
     # generate information on nodes if it's missing
     def populateNodeData(self, vrpData):
@@ -373,8 +520,11 @@ class VrpSolutionData(object):
     def computeSimpleScheduling(self, vrpData):
         self.nodeAttributes += [ 'arrival time', 'start of service',
                                  'end of service' ]
+        # generate missing info on the fly
+        vrpData.completeSchedulingData()
         for route in self.routes:
             sequence = route['node sequence'] + [ route['node sequence'][-1] ]
+            legTimes = vrpData.travelTimesAlong(sequence)
             currentTime = 0
             for i, index in enumerate( sequence[:-1] ):
                 if index != route['node information'][i]['index']:
@@ -386,13 +536,10 @@ class VrpSolutionData(object):
                                   currentTime)
                 self.nodes[index]['start of service'] = currentTime
                 route['node information'][i]['start of service'] = currentTime
-                # generate missing info on the fly
-                if not 'service time' in vrpData.nodes[index]:
-                    vrpData.nodes[index]['service time'] = 0
                 currentTime += vrpData.nodes[index]['service time']
                 self.nodes[index]['end of service'] = currentTime
                 route['node information'][i]['end of service'] = currentTime
-                currentTime += vrpData.travelTime[index][sequence[i+1]]
+                currentTime += legTimes[i]
         # add dummy data for unvisited nodes
         for node in self.nodes:
             if not node['used']:
@@ -406,9 +553,8 @@ class VrpSolutionData(object):
         try:
             totalLength = 0
             for route in self.routes:
-                for a, b in zip(route['node sequence'][:-1],
-                                route['node sequence'][1:]):
-                    totalLength += vrpData.travelTime[a][b]
+                for t in vrpData.travelTimesAlong(route['node sequence']):
+                    totalLength += t
             self.attributes['travel time'] = totalLength
         except Exception as e:
             pass
@@ -9,6 +9,7 @@ import wx
 
 import util
 import style
+import pluginregistry
 
 # this class pops a window in order to choose one or several styles
 class AddStyleDialog(wx.Dialog):
@@ -29,19 +30,19 @@ class AddStyleDialog(wx.Dialog):
                            wx.TR_MULTIPLE)
         root = self.tree.AddRoot('Style modules')
         # for each module, add styles found into it to the tree
-        for moduleName in util.getPluginNames():
-            module = __import__(moduleName)
-            subItems = []
-            for item in dir(module):
-                thisOne = module.__getattribute__(item)
-                if type(thisOne) is type and \
-                        issubclass(thisOne, style.Style) and \
-                        not issubclass(style.Style, thisOne):
-                    subItems.append(thisOne.__name__ +': '+ thisOne.description)
-            if len(subItems) > 0:
-                thisNode = self.tree.AppendItem(root, module.__name__)
-                for item in subItems:
-                    self.tree.AppendItem(thisNode, item)
+        # (plugins are scanned, not imported)
+        subItems = {}
+        moduleNames = []
+        for thisOne in pluginregistry.getPluginClasses('style'):
+            if not thisOne.moduleName in subItems:
+                subItems[thisOne.moduleName] = []
+                moduleNames.append(thisOne.moduleName)
+            subItems[thisOne.moduleName].append(thisOne.className + ': ' + \
+                                                    thisOne.description)
+        for moduleName in moduleNames:
+            thisNode = self.tree.AppendItem(root, moduleName)
+            for item in subItems[moduleName]:
+                self.tree.AppendItem(thisNode, item)
         self.Bind(wx.EVT_TREE_SEL_CHANGED, self.onSelection)
         # now add the tree to the sizer in the panel...
         treeSizer.Add(self.tree, 1, wx.EXPAND)
@@ -9,7 +9,7 @@ import wx
 import wx.grid
 
 import vrpdata
-from . import wxcanvas
+import thumbnails
 from .vrppanel import VrpPanel
 import style
 from . import events
@@ -74,28 +74,75 @@ class SolutionListBook(wx.Listbook):
         self.thumbnailWidth, self.thumbnailHeight = 64, 48
         self.AssignImageList(wx.ImageList(self.thumbnailWidth,
                                           self.thumbnailHeight))
+        # thumbnails are painted in the background and replace a light grey
+        # placeholder when they are ready
+        self.placeholder = wx.Bitmap.FromBuffer(\
+            self.thumbnailWidth, self.thumbnailHeight,
+            bytes([ 235 ]) * (self.thumbnailWidth * self.thumbnailHeight * 3))
+        self.thumbnailRenderer = \
+            thumbnails.ThumbnailRenderer(self.thumbnailWidth,
+                                         self.thumbnailHeight,
+                                         self.onThumbnailPainted)
+        # visible thumbnails are painted first: check which ones they are
+        # regularly while thumbnails are being painted
+        self.thumbnailTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.prioritizeVisibleThumbnails,
+                  self.thumbnailTimer)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onDestroy)
+
+    # called by the thumbnail renderer in its own thread
+    def onThumbnailPainted(self, key, image):
+        wx.CallAfter(self.setThumbnail, key, image)
+
+    # replace a placeholder with the painted thumbnail
+    def setThumbnail(self, key, image):
+        # the book may have been closed in the meantime
+        if not self:
+            return
+        self.GetImageList().Replace(key,
+                                    wx.Bitmap.FromBuffer(image.size[0],
+                                                         image.size[1],
+                                                         image.tobytes()))
+        self.Refresh()
+
+    # paint the thumbnails of visible pages and of the selected page first
+    def prioritizeVisibleThumbnails(self, event):
+        if not self.thumbnailRenderer.pending():
+            self.thumbnailTimer.Stop()
+            return
+        listView = self.GetListView()
+        top = listView.GetTopItem()
+        visible = range(max(0, top),
+                        min(self.GetPageCount(),
+                            top + listView.GetCountPerPage() + 1))
+        keys = [ self.GetPage(i).thumbnailKey for i in visible ]
+        if self.GetSelection() >= 0:
+            keys.append(self.GetPage(self.GetSelection()).thumbnailKey)
+        self.thumbnailRenderer.prioritize(keys)
+
+    # pending thumbnails are cancelled when the book is closed
+    def onDestroy(self, event):
+        if event.GetEventObject() is self:
+            self.thumbnailTimer.Stop()
+            self.thumbnailRenderer.stop()
+        event.Skip()
 
     # add a solution to this browser
     # nodeInfoList is the NodeInputInformationList where to display node
     # information when the mouse hovers over nodes
     def addSolution(self, vrp, solution, sheet, nodeInfoList):
-        # thumbnail creation
-        memdc = wx.MemoryDC()
-        bitmap = wx.Bitmap(self.thumbnailWidth, self.thumbnailHeight)
-        memdc.SelectObject(bitmap)
-        dc = wx.GCDC(memdc)
-        canvas = wxcanvas.WxThumbnailCanvas(dc,
-                                            self.thumbnailWidth,
-                                            self.thumbnailHeight)
-        sheet.paint(vrp, solution, canvas, thumbnail=True)
-        memdc.Destroy()
-        self.GetImageList().Add(bitmap)
+        # thumbnail creation is done in the background
+        imageId = self.GetImageList().Add(self.placeholder)
+        self.thumbnailRenderer.submit(imageId, vrp, solution)
+        if not self.thumbnailTimer.IsRunning():
+            self.thumbnailTimer.Start(200)
         # panel creation
         panel = VrpPanel(self,
                          inputData=vrp,
                          solutionData=solution,
                          styleSheet=sheet,
                          nodeInfoList=nodeInfoList)
+        panel.thumbnailKey = imageId
 #         newName = reduce(lambda x, y: x+ y,
 #                          [ x if i % 10 != 9 else x + '\n'
 #                            for i, x in enumerate(solution.name) ] )
@@ -104,7 +151,7 @@ class SolutionListBook(wx.Listbook):
             else solution.name[:12] + '...' + solution.name[-3:]
         self.AddPage(panel,
                      newName,
-                     imageId=self.GetPageCount())
+                     imageId=imageId)
 
     # add several solutions at once
     def addSolutions(self, vrp, solutions, sheet, nodeInfoList):
@@ -112,28 +159,16 @@ class SolutionListBook(wx.Listbook):
             self.addSolution(vrp, s, sheet, nodeInfoList)
 
     # load a new stylesheet
+    # thumbnails only show routes, so they don't depend on the stylesheet
     def loadStyleSheet(self, newSheet):
         for i in range(self.GetPageCount()):
             # update the sheet for this panel
             self.GetPage(i).styleSheet = newSheet
-            # update the thumbnail
-            memdc = wx.MemoryDC()
-            bitmap = wx.Bitmap(self.thumbnailWidth, self.thumbnailHeight)
-            memdc.SelectObject(bitmap)
-            dc = wx.GCDC(memdc)
-            canvas = wxcanvas.WxThumbnailCanvas(dc,
-                                                self.thumbnailWidth,
-                                                self.thumbnailHeight)
-            newSheet.paint(self.GetPage(i).inputData,
-                           self.GetPage(i).solutionData,
-                           canvas, thumbnail=True)
-            memdc.Destroy()
-            self.GetImageList().Replace(i, bitmap)
-            # required to refresh thumbnails
-            self.Refresh()
 
     # remove the currently selected solution
     def removeSolution(self):
+        self.thumbnailRenderer.cancel(\
+            self.GetPage(self.GetSelection()).thumbnailKey)
         self.DeletePage(self.GetSelection())
         
 class NodeInputInformationList(wx.ListCtrl):
@@ -9,6 +9,7 @@ import wx
 import util
 import stylesheet
 import loaddata
+import pluginregistry
 
 # this class pops a dialog in order to load a stylesheet
 class LoadStyleSheetDialog(wx.Dialog):
@@ -27,20 +28,18 @@ class LoadStyleSheetDialog(wx.Dialog):
                            wx.TR_HAS_BUTTONS )
         root = self.tree.AddRoot('Plugins')
         # for each module, add stylesheets found into it to the tree
-        for moduleName in util.getPluginNames():
-            module = __import__(moduleName)
-            subItems = []
-            for item in dir(module):
-                thisOne = module.__getattribute__(item)
-                if type(thisOne) is type and \
-                        issubclass(thisOne, stylesheet.StyleSheet) and \
-                        not issubclass(stylesheet.StyleSheet, thisOne):
-                    name = thisOne.__name__
-                    subItems.append(name)
-            if len(subItems) > 0:
-                thisNode = self.tree.AppendItem(root, module.__name__)
-                for item in subItems:
-                    self.tree.AppendItem(thisNode, item) 
+        # (plugins are scanned, not imported)
+        subItems = {}
+        moduleNames = []
+        for thisOne in pluginregistry.getPluginClasses('stylesheet'):
+            if not thisOne.moduleName in subItems:
+                subItems[thisOne.moduleName] = []
+                moduleNames.append(thisOne.moduleName)
+            subItems[thisOne.moduleName].append(thisOne.className)
+        for moduleName in moduleNames:
+            thisNode = self.tree.AppendItem(root, moduleName)
+            for item in subItems[moduleName]:
+                self.tree.AppendItem(thisNode, item) 
         self.Bind(wx.EVT_TREE_SEL_CHANGED, self.onSelection)
         # now add the tree to the sizer in the panel...
         treeSizer.Add(self.tree, 1, wx.EXPAND)
@@ -247,11 +247,10 @@ def loadDataInteractively(problemType=None,
                 solutionFNames = \
                     eval(fileLoader.solutionsNameField.GetValue()) \
                     if fileLoader.solutionsNameField.GetValue() else []
-                mySolutions = [ loader.loadSolution(fName,
-                                                    myVrp,
-                                                    type,
-                                                    solutionType)
-                                for fName in solutionFNames ]
+                mySolutions = loader.loadSolutions(solutionFNames,
+                                                   myVrp,
+                                                   type,
+                                                   solutionType)
                 myStyleSheet = loader.loadStyleSheet(type)
                 fileLoader.Destroy()
                 return myVrp, mySolutions, myStyleSheet
@@ -10,6 +10,8 @@ import math
 import wx
 
 import config
+import util
+import stylesheet
 from . import wxcanvas
 from . import events
 
@@ -24,6 +26,18 @@ zoomKeyStep=0.05
 # 1 means always select the closest node no matter how far it is
 maxDistToNeighbourFactor = 0.01
 
+# keep each layer of the stylesheet in an off-screen bitmap, so that only the
+# layers whose styles changed are painted again, and dragging the map only
+# paints the newly exposed parts
+useLayerCache = True
+
+# off-screen rendering of consecutive styles of a stylesheet
+class PanelLayer:
+    def __init__(self, styles, key, bitmap):
+        self.styles = styles
+        self.key = key
+        self.bitmap = bitmap
+
 class VrpPanel(wx.Panel):
     def __init__(self, parent, inputData=None, solutionData=None,
                  styleSheet=None,
@@ -65,6 +79,13 @@ class VrpPanel(wx.Panel):
         self.Bind(wx.EVT_KEY_DOWN, self.onChar)
         # useful to build file name for saving a same panel multiple times
         self.nTimesSaved = 0
+        # retained layers, along with the view and transformation they were
+        # painted for
+        self.layers = []
+        self.layerView = None
+        self.layerTransform = None
+        # set when the map has been dragged since the mouse button was pressed
+        self.dragged = False
         
     def onPaint(self, event):
         ww, hh = self.GetClientSize()
@@ -79,10 +100,13 @@ class VrpPanel(wx.Panel):
         canvas = wxcanvas.WxCanvas(dc, ww, hh)
 #         import cProfile
 #         cProfile.runctx('self.styleSheet.paint(self.inputData, self.solutionData, canvas, routePredicate = self.routePredicate, nodePredicate = self.nodePredicate, )', globals(), locals(), 'profiling-data')
-        self.styleSheet.paint(self.inputData, self.solutionData, canvas,
-                              routePredicate = self.routePredicate,
-                              nodePredicate = self.nodePredicate,
-                              )
+        if useLayerCache:
+            self.drawLayers(dc, ww, hh)
+        else:
+            self.styleSheet.paint(self.inputData, self.solutionData, canvas,
+                                  routePredicate = self.routePredicate,
+                                  nodePredicate = self.nodePredicate,
+                                  )
         self.revX, self.revY = \
             self.styleSheet.getReverseCoordMapping(canvas, self.inputData)
 #         allowedNodes = set([ node['index'] for node in self.inputData.nodes
@@ -102,10 +126,13 @@ class VrpPanel(wx.Panel):
         # end of device context declaration
         # Now we need to declare a canvas object...
         canvas = wxcanvas.WxCanvas(dc, ww, hh)
-        self.styleSheet.paint(self.inputData, self.solutionData, canvas,
-                              routePredicate = self.routePredicate,
-                              nodePredicate = self.nodePredicate,
-                              )
+        if useLayerCache:
+            self.drawLayers(dc, ww, hh)
+        else:
+            self.styleSheet.paint(self.inputData, self.solutionData, canvas,
+                                  routePredicate = self.routePredicate,
+                                  nodePredicate = self.nodePredicate,
+                                  )
         self.revX, self.revY = \
             self.styleSheet.getReverseCoordMapping(canvas, self.inputData)
 #         allowedNodes = set([ node['index'] for node in self.inputData.nodes
@@ -115,6 +142,135 @@ class VrpPanel(wx.Panel):
 #                                   arc['from'] in allowedNodes and\
 #                                   arc['to'] in allowedNodes)
 
+    # draw the retained layers, painting again those that are out of date
+    def drawLayers(self, dc, ww, hh):
+        if ww <= 0 or hh <= 0:
+            return
+        self.updateLayers(ww, hh)
+        for layer in self.layers:
+            dc.DrawBitmap(layer.bitmap, 0, 0, True)
+
+    # everything except styles and zoom level that changes what the panel
+    # looks like
+    def viewKey(self, ww, hh):
+        sheet = self.styleSheet
+        return (ww, hh, util.IdentityKey(self.inputData),
+                util.IdentityKey(self.solutionData),
+                util.IdentityKey(self.routePredicate),
+                util.IdentityKey(self.nodePredicate),
+                sheet.keepAspectRatio, sheet.grid, sheet.gridRouteAttribute,
+                sheet.filterNodesInGrid, sheet.drawGridLines,
+                sheet.nColumnsInGrid, sheet.displayCellTitle,
+                sheet.cellTitleFormat)
+
+    # bring the retained layers up to date
+    def updateLayers(self, ww, hh):
+        view = self.viewKey(ww, hh)
+        # the transformation is linear so two points are enough to compare it
+        convertX, convertY = \
+            self.styleSheet.getTransformations(0, ww, 0, hh,
+                                               self.inputData,
+                                               stylesheet.padding)
+        transform = (convertX(0.0), convertX(1.0) - convertX(0.0),
+                     convertY(0.0), convertY(1.0) - convertY(0.0))
+        # layers can be kept as they are if the map didn't move, and shifted
+        # instead of painted again if it was dragged by a whole number of
+        # pixels; other moves, e.g. with the keyboard, paint everything again
+        # since they are not followed by a full painting as dragging is (see
+        # resetPosition())
+        shift = None
+        if view == self.layerView and transform == self.layerTransform:
+            shift = 0, 0
+        elif view == self.layerView and self.dragged and \
+                not self.styleSheet.grid:
+            x0, xScale, y0, yScale = self.layerTransform
+            dx = transform[0] - x0
+            # the y axis points downwards on the screen
+            dy = y0 - transform[2]
+            if abs(transform[1] - xScale) <= 1e-9 * abs(xScale) and \
+                    abs(transform[3] - yScale) <= 1e-9 * abs(yScale) and \
+                    abs(dx - round(dx)) < 1e-3 and \
+                    abs(dy - round(dy)) < 1e-3 and \
+                    abs(dx) < ww and abs(dy) < hh:
+                shift = int(round(dx)), int(round(dy))
+        # layers are identified by their styles; the bottom layer also holds
+        # the background and grid decoration
+        oldLayers = dict( (layer.key, layer) for layer in self.layers )
+        newLayers = []
+        for i, styles in enumerate(self.styleSheet.getLayers() or [ [] ]):
+            key = (i == 0,
+                   tuple( (util.IdentityKey(style),
+                           style.changeToken(self.inputData,
+                                             self.solutionData))
+                          for style in styles ))
+            if key in oldLayers and shift == (0, 0):
+                newLayers.append(oldLayers[key])
+            elif key in oldLayers and not shift is None:
+                newLayers.append(self.shiftLayer(oldLayers[key], shift,
+                                                 ww, hh))
+            else:
+                bitmap = self.newLayerBitmap(i == 0, ww, hh)
+                self.paintLayer(bitmap, styles, i == 0, ww, hh, [ None ])
+                newLayers.append(PanelLayer(styles, key, bitmap))
+        self.layers = newLayers
+        # painting may set default grid parameters, so the view is only
+        # recorded afterwards
+        self.layerView = self.viewKey(ww, hh)
+        self.layerTransform = transform
+
+    # empty bitmap for a layer: the bottom layer is opaque, the others are
+    # transparent
+    def newLayerBitmap(self, bottom, ww, hh):
+        if bottom:
+            bitmap = wx.Bitmap(ww, hh)
+            dc = wx.MemoryDC(bitmap)
+            dc.SetBackground(wx.Brush('white'))
+            dc.Clear()
+            dc.SelectObject(wx.NullBitmap)
+            return bitmap
+        else:
+            return wx.Bitmap.FromRGBA(ww, hh, 0, 0, 0, 0)
+
+    # paint styles onto the bitmap of a layer
+    # areas is a list of parts of the canvas to paint, None meaning all of it
+    def paintLayer(self, bitmap, styles, bottom, ww, hh, areas):
+        memoryDC = wx.MemoryDC(bitmap)
+        dc = wx.GCDC(memoryDC)
+        canvas = wxcanvas.WxCanvas(dc, ww, hh)
+        for area in areas:
+            self.styleSheet.paint(self.inputData, self.solutionData, canvas,
+                                  routePredicate = self.routePredicate,
+                                  nodePredicate = self.nodePredicate,
+                                  styles = styles,
+                                  decorate = bottom and area is None,
+                                  area = area)
+        del dc
+        memoryDC.SelectObject(wx.NullBitmap)
+
+    # move the content of a layer by the given number of pixels and only
+    # paint the exposed strips
+    def shiftLayer(self, layer, shift, ww, hh):
+        dx, dy = shift
+        bottom = layer.key[0]
+        bitmap = self.newLayerBitmap(bottom, ww, hh)
+        memoryDC = wx.MemoryDC(bitmap)
+        dc = wx.GCDC(memoryDC)
+        dc.DrawBitmap(layer.bitmap, dx, dy, True)
+        del dc
+        memoryDC.SelectObject(wx.NullBitmap)
+        # exposed strips in canvas coordinates, i.e. y axis upwards
+        areas = []
+        if dx > 0:
+            areas.append( (0, 0, dx, hh) )
+        elif dx < 0:
+            areas.append( (ww + dx, 0, ww, hh) )
+        if dy > 0:
+            areas.append( (0, hh - dy, ww, hh) )
+        elif dy < 0:
+            areas.append( (0, 0, ww, -dy) )
+        self.paintLayer(bitmap, layer.styles, bottom, ww, hh, areas)
+        return PanelLayer(layer.styles, layer.key, bitmap)
+
     def onSize(self, event):
         if self.IsDoubleBuffered():
             self.Refresh()
@@ -157,6 +313,7 @@ class VrpPanel(wx.Panel):
         centerX += self.dragX - x
         centerY += self.dragY - y
         self.updateView(centerX, centerY, width, height)
+        self.dragged = True
         self.rePaint()
         # update the coordinates _after_ updating the view, in case we
         # requested something out of the map
@@ -277,6 +434,13 @@ class VrpPanel(wx.Panel):
     # the map
     def resetPosition(self, event):
         self.dragX, self.dragY = None, None
+        # exposed strips are painted on their own while dragging, so styles
+        # adapting to what is visible (e.g. level of detail) may differ from
+        # one strip to the next: paint everything again once done
+        if self.dragged:
+            self.dragged = False
+            self.layers = []
+            self.rePaint()
 
     # move/zoom the map with arrow and +/- keys
     # delete the current solution with del or backspace
@@ -6,6 +6,7 @@
 import sys
 from math import *
 
+import numpy
 import wx
 import wx.lib
 import wx.lib.colourdb
@@ -13,6 +14,7 @@ import wx.lib.colourdb
 import canvas
 import style
 import colours
+import graphicsstate
 
 # convert a Colour to a wx.Colour
 def convertColour(abstractColour):
@@ -39,6 +41,36 @@ def convertFont(abstractFont):
                    family,
                    style,
                    weight)
+
+# interned versions of the above, and of pens and brushes: each distinct value
+# is only converted once
+def internedColour(abstractColour):
+    return graphicsstate.intern('wx colour', abstractColour.getRGBA(),
+                                lambda *rgba: wx.Colour(*rgba))
+
+def internedFont(abstractFont):
+    return graphicsstate.intern('wx font',
+                                (abstractFont.size,
+                                 abstractFont.family,
+                                 abstractFont.style),
+                                lambda *key: convertFont(style.Font(*key)))
+
+# rgba is a 4-uple of colour components, penStyle a wx pen style
+def internedPen(penStyle, rgba, width):
+    return graphicsstate.intern('wx pen', (penStyle, rgba, width),
+                                lambda penStyle, rgba, width: \
+                                    wx.Pen(wx.Colour(*rgba), width, penStyle))
+
+# a brush with no colour is transparent
+def internedBrush(rgba):
+    if rgba is None:
+        return graphicsstate.intern('wx brush', (None,),
+                                    lambda rgba: \
+                                        wx.Brush(convertColour(colours.white),
+                                                 style=wx.TRANSPARENT))
+    else:
+        return graphicsstate.intern('wx brush', (rgba,),
+                                    lambda rgba: wx.Brush(wx.Colour(*rgba)))
     
 class WxCanvas(canvas.Canvas):
     def __init__(self, dc, width, height):
@@ -46,6 +78,29 @@ class WxCanvas(canvas.Canvas):
         self.width = round(width)
         self.height = round(height)
         self.defaultLineThickness = 1
+        # pens, brushes etc. are only set on the dc when they change
+        self.state = graphicsstate.GraphicsState()
+
+    def isInteractive(self):
+        return True
+
+    # convert lists of coordinates to arrays of pixel coordinates, truncated
+    # to the length of the shortest list (as zip() does)
+    # rounding is the same as with round(), i.e. half to even
+    def pixelColumns(self, *columns):
+        n = min( [ len(column) for column in columns ] )
+        return [ numpy.asarray(column[:n], dtype=float) for column in columns ]
+
+    def toPixels(self, values):
+        return numpy.rint(values).astype(int)
+
+    # graphics context used to draw a batch as a single path, if the dc is a
+    # GCDC, None otherwise
+    def graphicsContext(self):
+        if isinstance(self.dc, wx.GCDC):
+            return self.dc.GetGraphicsContext()
+        else:
+            return None
 
     # clear and set a white background
     def blank(self):
@@ -69,33 +124,57 @@ class WxCanvas(canvas.Canvas):
         self.dc.DrawRectangle(0, 0, self.width, self.height)
         
         
+    # current pen as a (pen style, rgba, width) 3-uple: drawing styles only
+    # change the pen components they specify
+    def currentPen(self):
+        pen = self.state.get('pen')
+        if pen is None:
+            pen = self.dc.GetPen()
+            colour = pen.GetColour()
+            return pen.GetStyle(), \
+                (colour.Red(), colour.Green(), colour.Blue(), colour.Alpha()), \
+                pen.GetWidth()
+        else:
+            return pen
+
+    # set the pen and brush, if different from the current ones
+    def setPen(self, penStyle, rgba, width):
+        if self.state.change('pen', (penStyle, rgba, width)):
+            self.dc.SetPen(internedPen(penStyle, rgba, width))
+
+    def setBrush(self, rgba):
+        if self.state.change('brush', rgba):
+            self.dc.SetBrush(internedBrush(rgba))
+
     # set a drawing style
     # for internal use only
     def setDrawingStyle(self, style):
-        pen = self.dc.GetPen()
+        penStyle, rgba, width = self.currentPen()
         if style.lineStyle is None or style.lineStyle == 'solid':
-            pen.SetStyle(wx.SOLID)
+            penStyle = wx.SOLID
         elif style.lineStyle == 'dashed' and sys.platform != 'linux2':
-            pen.SetStyle(wx.SHORT_DASH)
+            penStyle = wx.SHORT_DASH
         if not style.lineColour is None:
-            pen.SetColour(convertColour(style.lineColour))
+            rgba = style.lineColour.getRGBA()
         if not style.fillColour is None:
-            self.dc.SetBrush(wx.Brush(convertColour(style.fillColour)))
+            self.setBrush(style.fillColour.getRGBA())
         else:
-            self.dc.SetBrush(wx.Brush(convertColour(colours.white),
-                                      style=wx.TRANSPARENT))
+            self.setBrush(None)
         if not style.lineThickness is None:
-            pen.SetWidth(style.lineThickness)
+            width = style.lineThickness
         else:
-            pen.SetWidth(self.defaultLineThickness)
-        self.dc.SetPen(pen)
+            width = self.defaultLineThickness
+        self.setPen(penStyle, rgba, width)
         
     # set a writing style
     # also for internal use only
     def setWritingStyle(self, font, foregroundColour, backgroundColour):
-        self.dc.SetTextForeground(convertColour(foregroundColour))
-        self.dc.SetTextBackground(convertColour(backgroundColour))
-        self.dc.SetFont(convertFont(font))
+        if self.state.change('text foreground', foregroundColour.getRGBA()):
+            self.dc.SetTextForeground(internedColour(foregroundColour))
+        if self.state.change('text background', backgroundColour.getRGBA()):
+            self.dc.SetTextBackground(internedColour(backgroundColour))
+        if self.state.change('font', (font.size, font.family, font.style)):
+            self.dc.SetFont(internedFont(font))
            
     # draw a rectangle centered at coordinates x, y
     # if a reference point is specified, it is used, otherwise the coordinates
@@ -127,20 +206,31 @@ class WxCanvas(canvas.Canvas):
     # xs, ys, ws, hs are lists
     def drawRectangles(self, xs, ys, ws, hs, style, referencePoint='center'):
         self.setDrawingStyle(style)
+        x, y, w, h = self.pixelColumns(xs, ys, ws, hs)
         # wxWidgets work with pixels, not points, so we must count the line and
         # the column where the rectangle is centered, hence the w-1 and h-1
-        for x, y, w, h in zip(xs, ys, ws, hs):
-            if referencePoint == 'center':
-                x, y = x - (w-1)/2.0, self.height-y-(h-1)/2.0
-            elif referencePoint == 'northwest':
-                x, y, w, h = x, self.height-y, w, h
-            elif referencePoint == 'northeast':
-                x, y, w, h = x-w+1, self.height-y, w, h
-            elif referencePoint == 'southeast':
-                x, y, w, h = x-w+1, self.height-y-h+1, w, h
-            elif referencePoint == 'southwest':
-                x, y, w, h = x, self.height-y-h+1, w, h
-            self.dc.DrawRectangle(round(x), round(y), round(w), round(h))
+        if referencePoint == 'center':
+            x, y = x - (w-1)/2.0, self.height-y-(h-1)/2.0
+        elif referencePoint == 'northwest':
+            x, y = x, self.height-y
+        elif referencePoint == 'northeast':
+            x, y = x-w+1, self.height-y
+        elif referencePoint == 'southeast':
+            x, y = x-w+1, self.height-y-h+1
+        elif referencePoint == 'southwest':
+            x, y = x, self.height-y-h+1
+        rectangles = numpy.column_stack( [ self.toPixels(x),
+                                           self.toPixels(y),
+                                           self.toPixels(w),
+                                           self.toPixels(h) ] ).tolist()
+        gc = self.graphicsContext()
+        if gc is None:
+            self.dc.DrawRectangleList(rectangles)
+        elif rectangles:
+            path = gc.CreatePath()
+            for rectangle in rectangles:
+                path.AddRectangle(*rectangle)
+            gc.DrawPath(path, wx.WINDING_RULE)
 
     # draw a circle centered at coordinates x, y
     def drawCircle(self, x, y, r, style):
@@ -151,8 +241,19 @@ class WxCanvas(canvas.Canvas):
     # parameters xs, ys, rs should be lists
     def drawCircles(self, xs, ys, rs, style):
         self.setDrawingStyle(style)
-        for x, y, r in zip(xs, ys, rs):
-            self.dc.DrawCircle(round(x), round(self.height-y), round(r))
+        x, y, r = self.pixelColumns(xs, ys, rs)
+        x, y, r = self.toPixels(x), self.toPixels(self.height-y), \
+            self.toPixels(r)
+        gc = self.graphicsContext()
+        if gc is None:
+            # same bounding boxes as dc.DrawCircle()
+            self.dc.DrawEllipseList(numpy.column_stack( [ x-r, y-r,
+                                                          2*r, 2*r ] ).tolist())
+        elif len(x) > 0:
+            path = gc.CreatePath()
+            for x, y, r in zip(x.tolist(), y.tolist(), r.tolist()):
+                path.AddCircle(x, y, r)
+            gc.DrawPath(path, wx.WINDING_RULE)
 
     # draw a line
     def drawLine(self, x1, y1, x2, y2, style):
@@ -163,9 +264,20 @@ class WxCanvas(canvas.Canvas):
     # draw a line
     def drawLines(self, x1s, y1s, x2s, y2s, style):
         self.setDrawingStyle(style)
-        for x1, y1, x2, y2 in zip(x1s, y1s, x2s, y2s):
-            self.dc.DrawLine(round(x1), round(self.height-y1),
-                             round(x2), round(self.height-y2))
+        x1, y1, x2, y2 = self.pixelColumns(x1s, y1s, x2s, y2s)
+        lines = numpy.column_stack( [ self.toPixels(x1),
+                                      self.toPixels(self.height-y1),
+                                      self.toPixels(x2),
+                                      self.toPixels(self.height-y2) ] ).tolist()
+        gc = self.graphicsContext()
+        if gc is None:
+            self.dc.DrawLineList(lines)
+        elif lines:
+            path = gc.CreatePath()
+            for x1, y1, x2, y2 in lines:
+                path.MoveToPoint(x1, y1)
+                path.AddLineToPoint(x2, y2)
+            gc.StrokePath(path)
 
     # draw a polyline
     # x and y are lists
@@ -244,10 +356,32 @@ class WxCanvas(canvas.Canvas):
     # style is either unique or a list of styles to use
     def drawPolygons(self, xss, yss, style):
         self.setDrawingStyle(style)
-        for i, (xs, ys) in enumerate(zip(xss, yss)):
-            points = [ (round(x), round(self.height-y))
-                       for x, y in zip(xs, ys) ]
-            self.dc.DrawPolygon(points)
+        # all points are converted at once, then split into polygons
+        lengths = [ min(len(xs), len(ys)) for xs, ys in zip(xss, yss) ]
+        allX = numpy.fromiter( ( x for xs, n in zip(xss, lengths)
+                                 for x in xs[:n] ), dtype=float )
+        allY = numpy.fromiter( ( y for ys, n in zip(yss, lengths)
+                                 for y in ys[:n] ), dtype=float )
+        points = numpy.column_stack( [ self.toPixels(allX),
+                                       self.toPixels(self.height-allY) ]\
+                                         ).tolist()
+        polygons, start = [], 0
+        for n in lengths:
+            polygons.append(points[start:start+n])
+            start += n
+        gc = self.graphicsContext()
+        if gc is None:
+            self.dc.DrawPolygonList(polygons)
+        elif polygons:
+            path = gc.CreatePath()
+            for polygon in polygons:
+                if not polygon:
+                    continue
+                path.MoveToPoint(*polygon[0])
+                for point in polygon[1:]:
+                    path.AddLineToPoint(*point)
+                path.CloseSubpath()
+            gc.DrawPath(path, wx.WINDING_RULE)
 
     # draw a bitmap using the given north-west corner
     def drawBitmap(self, bitmap, NWcorner):
@@ -262,22 +396,20 @@ class WxThumbnailCanvas(WxCanvas):
     # set a drawing style
     # for internal use only
     def setDrawingStyle(self, thisStyle):
-        pen = self.dc.GetPen()
+        penStyle, rgba, width = self.currentPen()
         if thisStyle.lineStyle is None or thisStyle.lineStyle == 'solid':
-            pen.SetStyle(wx.SOLID)
+            penStyle = wx.SOLID
         # elif thisStyle.lineStyle == 'dashed':
-        #     pen.SetStyle(wx.SHORT_DASH)
+        #     penStyle = wx.SHORT_DASH
         if not thisStyle.lineColour is None:
             # make the line look thinner for the thumbnail, by adding some alpha
             # component
             r,g,b,a = thisStyle.lineColour.getRGBA()
-            thumbnailLineColour = style.Colour(r, g, b, max(0,a-100))
-            pen.SetColour(convertColour(thumbnailLineColour))
+            rgba = (r, g, b, max(0,a-100))
         if not thisStyle.fillColour is None:
-            self.dc.SetBrush(wx.Brush(convertColour(thisStyle.fillColour)))
+            self.setBrush(thisStyle.fillColour.getRGBA())
         # we paint on a thumbnail so we use a thin line
-        pen.SetWidth(1)
-        self.dc.SetPen(pen)
+        self.setPen(penStyle, rgba, 1)
         
     # we don't draw many shapes because they wouldn't be distinguishable anyway
     def drawRectangle(self, x, y, w, h, style, referencePoint='center'):
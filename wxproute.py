@@ -48,9 +48,8 @@ def main():
         # reorder solutions using numbers in file names
         if solutionFileNames:
             solutionFileNames = util.reorder(solutionFileNames)
-            solutions = [ loader.loadSolution(fName, myVrp,
-                                              type, solutionSubtype)
-                          for fName in solutionFileNames ]
+            solutions = loader.loadSolutions(solutionFileNames, myVrp,
+                                             type, solutionSubtype)
         else:
             solutions = None
         myStyleSheet = loader.loadStyleSheet(type)